@@ -1,37 +1,117 @@
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from typing import Dict, Any, Callable, List, Optional
+import asyncio
 import uuid
 from pydantic import BaseModel
 
-from app.models import embedding_task_model
+import os
+from app.models import embedding_task_model, embedding_batch_task_model
 from app.utils.queue_manager import task_queue
+from app.utils.task_processor import task_processor
+from app.utils.concurrency_limiter import ConcurrencyLimiter
+from app.utils.task_dedup import task_dedup
+from app.utils.model_registry import model_registry
+from app.utils.ndjson_stream import process_ndjson_stream
+from app.utils.vector_codec import (convert_chunks, decode_matrix, decode_result, format_chunks, format_matrix,
+                                    format_vector, truncate_dimensions, validate_dimensions, validate_formats)
 from app.utils.logger import logger
 
 router = APIRouter()
+sync_limiter = ConcurrencyLimiter("embedding")
+# 批量任务最多包含的文本数
+batch_max_texts = int(os.getenv("EMBEDDING_BATCH_MAX_TEXTS", 100000))
+# 流式接口：同时处理的流数、每批行数、单行最大字节数、预读批次数
+stream_limiter = ConcurrencyLimiter("embedding_stream")
+stream_batch_size = int(os.getenv("EMBEDDING_STREAM_BATCH_SIZE", 256))
+stream_max_line_bytes = int(os.getenv("EMBEDDING_STREAM_MAX_LINE_BYTES", 1024 * 1024))
+stream_prefetch = int(os.getenv("EMBEDDING_STREAM_PREFETCH", 2))
+
+class RequestStreamingResponse(StreamingResponse):
+    """边读取请求体边输出的流式响应，发送结束时（包括客户端提前断开、发送失败）调用release
+
+    StreamingResponse在ASGI spec_version低于2.4时会并发调用receive()监听断开，与响应体生成器读取请求体争抢消息，
+    这里只发送响应，客户端断开由读取请求体或发送失败感知。
+    """
+
+    def __init__(self, content: Any, release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            try:
+                await self.stream_response(send)
+            except OSError:
+                raise ClientDisconnect()
+        finally:
+            if hasattr(self.body_iterator, "aclose"):
+                await self.body_iterator.aclose()
+            self.release()
 
 class EmbeddingRequest(BaseModel):
     text: str
     handle: str
 
+def parse_long_text(request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """解析长文本模式参数
+
+    long_text为truncate（默认，超出模型最大长度的部分被截断）时返回None；
+    为chunk时返回分块参数：pooling（mean或weighted）、overlap（相邻窗口重叠的token数）和return_chunks。
+
+    Raises:
+        ValueError: 参数不合法
+    """
+    mode = request.get("long_text") or "truncate"
+    if mode not in ("truncate", "chunk"):
+        raise ValueError(f"不支持的长文本模式：{mode}，可选值: ['truncate', 'chunk']")
+    if mode == "truncate":
+        return None
+    pooling = request.get("pooling") or "mean"
+    if pooling not in ("mean", "weighted"):
+        raise ValueError(f"不支持的池化方式：{pooling}，可选值: ['mean', 'weighted']")
+    overlap = request.get("chunk_overlap")
+    if overlap is not None and (not isinstance(overlap, int) or overlap < 0):
+        raise ValueError("chunk_overlap必须是非负整数")
+    return {"pooling": pooling, "overlap": overlap, "return_chunks": bool(request.get("return_chunks"))}
+
 @router.post("/", response_model=Dict[str, Any])
 async def create_embedding_task(request: Dict[str, Any]):
     """创建Embedding任务"""
     text = request["text"]
     handle = request.get("handle")  # 使用get方法获取handle，如果不存在则为None
+    try:
+        priority = task_queue.normalize_priority(request.get("priority"))
+        vector_format, callback_format = validate_formats(request.get("vector_format"), request.get("callback_format"))
+        long_text = parse_long_text(request)
+        dimensions = validate_dimensions(request.get("dimensions"))
+    except (ValueError, ImportError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    params = {"text": text}
+    if long_text:
+        params["long_text"] = long_text
+    if dimensions:
+        params["dimensions"] = dimensions
+    dedup_key = task_dedup.make_key("embedding", task_processor.embedding_service.model_name, params)
+    retry_after = await task_queue.check_admission("embedding")
+    if retry_after is not None and not task_dedup.has(dedup_key):
+        raise HTTPException(status_code=429, detail="任务积压过多，请稍后再试", headers={"Retry-After": str(retry_after)})
     task_id = str(uuid.uuid4())
     logger.info(f"开始创建Embedding任务， 创建任务 task_id: {task_id}, text: {text[:10]}，文本长度: {len(text)}, handle: {handle}")
     
     # 创建任务记录
     await embedding_task_model.create(task_id, {
         "text": text,
-        "handle": handle
+        "handle": handle,
+        "vector_format": vector_format,
+        "callback_format": callback_format,
+        "long_text": long_text,
+        "output_dimensions": dimensions
     })
     
-    # 添加到任务队列
-    success = await task_queue.add_task(
-        task_id=task_id,
-        task_type="embedding"
-    )
+    # 添加到任务队列（相同任务可直接复用结果）
+    success = await task_processor.submit_task(task_id, "embedding", priority, dedup_key)
     
     if not success:
         await embedding_task_model.update(task_id, {"status": "failed"})
@@ -39,9 +119,175 @@ async def create_embedding_task(request: Dict[str, Any]):
     
     return {"task_id": task_id, "success": True}
 
+@router.post("/sync", response_model=Dict[str, Any])
+async def create_embedding_sync(request: Dict[str, Any]):
+    """同步生成Embedding，不经过任务存储和队列，直接返回结果"""
+    text = request.get("text")
+    if not isinstance(text, str):
+        raise HTTPException(status_code=400, detail="text必须是字符串")
+    try:
+        vector_format, _ = validate_formats(request.get("vector_format"), None)
+        long_text = parse_long_text(request)
+        dimensions = validate_dimensions(request.get("dimensions"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not sync_limiter.try_acquire():
+        raise HTTPException(status_code=429, detail="同步接口繁忙，请稍后再试", headers={"Retry-After": "1"})
+    try:
+        if long_text:
+            vector, spans, matrix = await task_processor.embedding_service.generate_long_embedding(
+                text, long_text["overlap"], long_text["pooling"])
+        else:
+            vector = (await task_processor.embedding_service.generate_embeddings_array([text]))[0]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"同步Embedding失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        sync_limiter.release()
+    response = format_vector(truncate_dimensions(vector, dimensions), vector_format)
+    if long_text and long_text["return_chunks"]:
+        response["chunks"] = format_chunks(spans, truncate_dimensions(matrix, dimensions), vector_format)
+    return response
+
+@router.post("/stream")
+async def create_embedding_stream(request: Request, vector_format: str = "list", dimensions: Optional[int] = None):
+    """流式批量Embedding：请求体为NDJSON，每行 {"id": ..., "text": ...}，响应为NDJSON，每行 {"id": ..., "embedding": ...}
+
+    输入按EMBEDDING_STREAM_BATCH_SIZE行一批编码，每批完成后立即输出；客户端读取变慢时暂停读取请求体。
+    输出行与输入行顺序一致，无效行输出 {"line": 行号, "error": ...}。
+    """
+    try:
+        vector_format, _ = validate_formats(vector_format, None)
+        dimensions = validate_dimensions(dimensions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not stream_limiter.try_acquire():
+        raise HTTPException(status_code=429, detail="流式接口繁忙，请稍后再试", headers={"Retry-After": "1"})
+    released = False
+
+    def release():
+        # 响应体生成器结束和响应发送结束时都会调用，只释放一次；
+        # 客户端在开始读取响应体前断开时生成器不会运行，由响应释放
+        nonlocal released
+        if not released:
+            released = True
+            stream_limiter.release()
+
+    async def embed_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        outputs: List[Dict[str, Any]] = [{"id": record.get("id"), "error": "text必须是字符串"} for record in records]
+        valid = [i for i, record in enumerate(records) if isinstance(record.get("text"), str)]
+        if valid:
+            matrix = await task_processor.embedding_service.generate_embeddings_array(
+                [records[i]["text"] for i in valid], task_processor.encode_batch_size)
+            for i, vector in zip(valid, truncate_dimensions(matrix, dimensions)):
+                outputs[i] = {"id": records[i].get("id"), **format_vector(vector, vector_format)}
+        return outputs
+
+    async def body():
+        try:
+            async for data in process_ndjson_stream(request.stream(), embed_records, stream_batch_size,
+                                                    stream_max_line_bytes, stream_prefetch):
+                yield data
+        finally:
+            release()
+
+    try:
+        logger.info(f"开始流式Embedding, 向量格式: {vector_format}")
+        return RequestStreamingResponse(body(), release, media_type="application/x-ndjson")
+    except Exception:
+        release()
+        raise
+
+@router.post("/batch", response_model=Dict[str, Any])
+async def create_embedding_batch_task(request: Dict[str, Any]):
+    """创建批量Embedding任务，一个任务处理一组文本"""
+    texts = request.get("texts")
+    ids = request.get("ids")
+    chunk_size = request.get("chunk_size")
+    if not isinstance(texts, list) or not texts or not all(isinstance(text, str) for text in texts):
+        raise HTTPException(status_code=400, detail="texts必须是非空的字符串列表")
+    if len(texts) > batch_max_texts:
+        raise HTTPException(status_code=400, detail=f"texts最多包含 {batch_max_texts} 条文本")
+    if ids is not None and (not isinstance(ids, list) or len(ids) != len(texts)):
+        raise HTTPException(status_code=400, detail="ids必须是与texts等长的列表")
+    if chunk_size is not None and (not isinstance(chunk_size, int) or chunk_size < 1):
+        raise HTTPException(status_code=400, detail="chunk_size必须是正整数")
+    try:
+        priority = task_queue.normalize_priority(request.get("priority"))
+        vector_format, callback_format = validate_formats(request.get("vector_format"), request.get("callback_format"))
+        dimensions = validate_dimensions(request.get("dimensions"))
+    except (ValueError, ImportError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    retry_after = await task_queue.check_admission("embedding_batch")
+    if retry_after is not None:
+        raise HTTPException(status_code=429, detail="任务积压过多，请稍后再试", headers={"Retry-After": str(retry_after)})
+    task_id = str(uuid.uuid4())
+    logger.info(f"开始创建批量Embedding任务， task_id: {task_id}, 文本数: {len(texts)}, handle: {request.get('handle')}")
+
+    # 创建任务记录
+    await embedding_batch_task_model.create(task_id, {
+        "texts": texts,
+        "ids": ids,
+        "handle": request.get("handle"),
+        "vector_format": vector_format,
+        "callback_format": callback_format,
+        "chunk_size": chunk_size,
+        "output_dimensions": dimensions
+    })
+
+    # 添加到任务队列
+    success = await task_queue.add_task(task_id=task_id, task_type="embedding_batch", priority=priority)
+    if not success:
+        await embedding_batch_task_model.update(task_id, {"status": "failed"})
+        raise HTTPException(status_code=503, detail="任务队列已满")
+
+    return {"task_id": task_id, "success": True, "count": len(texts)}
+
+@router.get("/batch/{task_id}", response_model=Dict[str, Any])
+async def get_embedding_batch_task(task_id: str, vector_format: str = "list"):
+    """获取批量Embedding任务状态和结果，分块回调的大批量任务只返回进度"""
+    try:
+        vector_format, _ = validate_formats(vector_format, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    task = await embedding_batch_task_model.get(task_id)
+    if not task:
+        return {
+            "task_id": None,
+            "status": "failed",
+            "error": "任务不存在"
+        }
+
+    _, ids = await embedding_batch_task_model.get_inputs(task_id)
+    response = {
+        "task_id": task["task_id"],
+        "status": task["status"],
+        "count": task["count"],
+        "processed": task["processed"],
+        "ids": ids,
+        "embeddings": None,
+        "created_at": task["created_at"],
+        "updated_at": task["updated_at"]
+    }
+    if task["status"] == "completed" and task.get("embeddings"):
+        matrix = decode_matrix(task["embeddings"], task["embedding_format"], task["dimensions"], task.get("scales"))
+        response.update(format_matrix(matrix, vector_format))
+    elif task["status"] == "failed":
+        response["error"] = task.get("error")
+    return response
+
 @router.get("/{task_id}", response_model=Dict[str, Any])
-async def get_embedding_task(task_id: str):
-    """获取Embedding任务状态和结果"""
+async def get_embedding_task(task_id: str, vector_format: str = "list"):
+    """获取Embedding任务状态和结果，vector_format指定返回的向量格式（list、float32、float16、int8 或 binary）
+
+    以int8或binary格式保存的结果为有损还原后的值。
+    """
+    try:
+        vector_format, _ = validate_formats(vector_format, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     task = await embedding_task_model.get(task_id)
     if not task:
         return {
@@ -50,16 +296,32 @@ async def get_embedding_task(task_id: str):
             "error": "任务不存在"
         }
     
-    return {
+    response = {
         "task_id": task["task_id"],
         "status": task["status"],
         "text": task["text"],
-        "embedding": task["embedding"] if task["status"] == "completed" else None,
+        "embedding": None,
         "created_at": task["created_at"],
         "updated_at": task["updated_at"]
     }
+    if task["status"] == "completed":
+        response.update(format_vector(decode_result(task), vector_format))
+        if task.get("chunks"):
+            response["chunks"] = convert_chunks(task["chunks"], vector_format)
+    elif task["status"] == "failed":
+        response["error"] = task.get("error")
+    return response
 
-@router.get("/", response_model=Dict[str, int])
+@router.get("/", response_model=Dict[str, Any])
 async def get_queue_status():
-    """获取队列状态"""
-    return await task_queue.get_queue_status()
\ No newline at end of file
+    """获取队列状态、embedding微批处理、同步接口、去重、token分批、向量缓存和模型加载统计"""
+    status = await task_queue.get_queue_status()
+    status["batching"] = task_processor.batchers["embedding"].stats()
+    status["sync"] = sync_limiter.stats()
+    status["stream"] = stream_limiter.stats()
+    status["dedup"] = task_dedup.stats("embedding")
+    status["token_batching"] = task_processor.embedding_service.batcher.stats()
+    cache = task_processor.embedding_service.cache
+    status["cache"] = await asyncio.to_thread(cache.stats) if cache is not None else None
+    status["models"] = model_registry.stats()
+    return status
\ No newline at end of file
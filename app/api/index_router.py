@@ -0,0 +1,159 @@
+from fastapi import APIRouter, HTTPException
+from typing import Dict, Any, List, Optional
+import asyncio
+import os
+import numpy as np
+
+from app.services.vector_index import vector_index, VectorCollection
+from app.utils.task_processor import task_processor
+from app.utils.vector_codec import truncate_dimensions, validate_dimensions
+from app.utils.logger import logger
+
+router = APIRouter()
+# 单次检索最多返回的结果数，以及单次写入最多的条目数
+max_top_k = int(os.getenv("VECTOR_INDEX_MAX_TOP_K", 1000))
+max_items = int(os.getenv("VECTOR_INDEX_MAX_ITEMS", 10000))
+
+
+async def embed_texts(texts: List[str], dimensions: Optional[int] = None) -> np.ndarray:
+    """用Embedding模型计算文本向量，dimensions小于模型维度时截取并重新归一化"""
+    matrix = await task_processor.embedding_service.generate_embeddings_array(texts)
+    return truncate_dimensions(matrix, dimensions)
+
+
+async def run_index(func, *args) -> Any:
+    """在线程中执行索引操作，参数不合法返回400，索引目录被其他进程占用返回503"""
+    try:
+        return await asyncio.to_thread(func, *args)
+    except ValueError as e:
+        raise HTTPException(status_code=409 if "已存在" in str(e) else 400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+async def get_collection(name: str) -> VectorCollection:
+    collection = await run_index(vector_index.get, name)
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"集合 {name} 不存在")
+    return collection
+
+
+@router.get("/", response_model=Dict[str, Any])
+async def list_collections():
+    """列出所有集合"""
+    return {"collections": await run_index(vector_index.list)}
+
+
+@router.post("/{collection}", response_model=Dict[str, Any])
+async def create_collection(collection: str, request: Dict[str, Any]):
+    """创建集合，dimensions为空时使用Embedding模型的维度"""
+    try:
+        dimensions = validate_dimensions(request.get("dimensions"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if dimensions is None:
+        dimensions = int((await embed_texts(["维度"])).shape[1])
+    created = await run_index(vector_index.get, collection, dimensions, request.get("metric") or "cosine")
+    return created.stats()
+
+
+@router.delete("/{collection}", response_model=Dict[str, Any])
+async def drop_collection(collection: str):
+    """删除集合"""
+    dropped = await run_index(vector_index.drop, collection)
+    if not dropped:
+        raise HTTPException(status_code=404, detail=f"集合 {collection} 不存在")
+    return {"success": True}
+
+
+async def write_items(name: str, request: Dict[str, Any], upsert: bool) -> Dict[str, Any]:
+    """写入条目：每个条目包含id，以及vector或text（由Embedding模型计算向量），metadata可选
+
+    集合不存在时按第一个向量（或模型输出）的维度创建。
+    """
+    items = request.get("items")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="items必须是非空列表")
+    if len(items) > max_items:
+        raise HTTPException(status_code=400, detail=f"items最多包含 {max_items} 个条目")
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("id"), str):
+            raise HTTPException(status_code=400, detail="每个条目必须包含字符串id")
+        if not isinstance(item.get("text"), str) and not isinstance(item.get("vector"), list):
+            raise HTTPException(status_code=400, detail=f"条目 {item['id']} 需要text或vector")
+
+    try:
+        requested_dimensions = validate_dimensions(request.get("dimensions"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    collection = await run_index(vector_index.get, name)
+    dimensions = collection.dimensions if collection else requested_dimensions
+    text_items = [i for i, item in enumerate(items) if not isinstance(item.get("vector"), list)]
+    embedded = await embed_texts([items[i]["text"] for i in text_items], dimensions) if text_items else None
+
+    vectors: List[Any] = [item.get("vector") for item in items]
+    for index, vector in zip(text_items, embedded if embedded is not None else []):
+        vectors[index] = vector
+    if len({len(vector) for vector in vectors}) != 1:
+        raise HTTPException(status_code=400, detail="所有向量的维度必须一致")
+    metadata = [item.get("metadata") for item in items] if any("metadata" in item for item in items) else None
+
+    if collection is None:
+        collection = await run_index(vector_index.get, name, len(vectors[0]), request.get("metric") or "cosine")
+    result = await run_index(collection.add, [item["id"] for item in items], vectors, metadata, upsert)
+    logger.info(f"向量集合 {name} 写入 {len(items)} 个条目, 新增: {result['added']}, 覆盖: {result['updated']}")
+    return {**result, "count": collection.count}
+
+
+@router.post("/{collection}/add", response_model=Dict[str, Any])
+async def add_items(collection: str, request: Dict[str, Any]):
+    """新增条目，ID已存在时返回409"""
+    return await write_items(collection, request, upsert=False)
+
+
+@router.post("/{collection}/upsert", response_model=Dict[str, Any])
+async def upsert_items(collection: str, request: Dict[str, Any]):
+    """新增或覆盖条目"""
+    return await write_items(collection, request, upsert=True)
+
+
+@router.post("/{collection}/delete", response_model=Dict[str, Any])
+async def delete_items(collection: str, request: Dict[str, Any]):
+    """按ID删除条目"""
+    ids = request.get("ids")
+    if not isinstance(ids, list) or not all(isinstance(item_id, str) for item_id in ids):
+        raise HTTPException(status_code=400, detail="ids必须是字符串列表")
+    target = await get_collection(collection)
+    deleted = await run_index(target.delete, ids)
+    return {"deleted": deleted, "count": target.count}
+
+
+@router.post("/{collection}/search", response_model=Dict[str, Any])
+async def search(collection: str, request: Dict[str, Any]):
+    """检索最相似的条目
+
+    查询为text、texts（由Embedding模型计算向量）、vector或vectors之一；
+    单个查询返回 {"results": [...]}，多个查询返回 {"results": [[...], ...]}。
+    """
+    top_k = request.get("top_k", 10)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= max_top_k:
+        raise HTTPException(status_code=400, detail=f"top_k必须是1到{max_top_k}之间的整数")
+    nprobe = request.get("nprobe")
+    if nprobe is not None and (isinstance(nprobe, bool) or not isinstance(nprobe, int) or nprobe < 1):
+        raise HTTPException(status_code=400, detail="nprobe必须是正整数")
+    target = await get_collection(collection)
+
+    single = "text" in request or "vector" in request
+    if isinstance(request.get("text"), str) or isinstance(request.get("texts"), list):
+        texts = [request["text"]] if single else request["texts"]
+        if not texts or not all(isinstance(text, str) for text in texts):
+            raise HTTPException(status_code=400, detail="texts必须是非空的字符串列表")
+        queries = await embed_texts(texts, target.dimensions)
+    elif isinstance(request.get("vector"), list) or isinstance(request.get("vectors"), list):
+        queries = [request["vector"]] if single else request["vectors"]
+    else:
+        raise HTTPException(status_code=400, detail="需要text、texts、vector或vectors之一")
+
+    results = await run_index(target.search, queries, top_k, request.get("mode") or "auto", nprobe)
+    return {"results": results[0] if single else results}
@@ -3,11 +3,12 @@ from typing import Dict, Any, List
 import uuid
 from app.models import mask_task_model
 from app.utils.queue_manager import task_queue
-from app.services.mask_service import MaskService
+from app.utils.task_processor import task_processor
+from app.utils.task_dedup import task_dedup
+from app.utils.model_registry import model_registry
 from app.utils.logger import logger
 
 router = APIRouter()
-mask_service = MaskService()
 
 @router.post("/", response_model=Dict[str, str])
 async def create_mask_task(request: Dict[str, Any]):
@@ -21,6 +22,19 @@ async def create_mask_task(request: Dict[str, Any]):
     mask_field = request.get("mask_field", None)
     force_convert = request.get("force_convert", None)
     handle = request.get("handle", None)  # 获取回调地址
+    try:
+        priority = task_queue.normalize_priority(request.get("priority"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    dedup_key = task_dedup.make_key("mask", mask_model, {
+        "text": text,
+        "mask_type": mask_type,
+        "mask_field": mask_field,
+        "force_convert": force_convert
+    })
+    retry_after = await task_queue.check_admission("mask")
+    if retry_after is not None and not task_dedup.has(dedup_key):
+        raise HTTPException(status_code=429, detail="任务积压过多，请稍后再试", headers={"Retry-After": str(retry_after)})
     
     try:
         # 记录请求信息
@@ -40,11 +54,8 @@ async def create_mask_task(request: Dict[str, Any]):
             logger.error(f"Failed to create task record in Redis for task_id: {task_id}")
             raise HTTPException(status_code=500, detail="Failed to create task record")
         
-        # 添加到任务队列
-        success = await task_queue.add_task(
-            task_id=task_id,
-            task_type="mask"
-        )
+        # 添加到任务队列（相同任务可直接复用结果）
+        success = await task_processor.submit_task(task_id, "mask", priority, dedup_key)
         
         if not success:
             logger.error(f"Task queue is full, failed to add task_id: {task_id}")
@@ -91,7 +102,10 @@ async def get_mask_task(task_id: str):
     
     return response
 
-@router.get("/", response_model=Dict[str, int])
+@router.get("/", response_model=Dict[str, Any])
 async def get_queue_status():
-    """获取队列状态"""
-    return await task_queue.get_queue_status()
\ No newline at end of file
+    """获取队列状态、去重和模型加载统计"""
+    status = await task_queue.get_queue_status()
+    status["dedup"] = task_dedup.stats("mask")
+    status["models"] = model_registry.stats()
+    return status
\ No newline at end of file
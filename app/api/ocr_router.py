@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Request
+import asyncio
 from typing import Dict, Any
 import requests
 from app.services.ocr_service import OCRService
@@ -49,7 +50,7 @@ async def handle_post_request(request: PDFRequest):
         
         # 验证PDF URL
         try:
-            response = requests.head(pdf_url)
+            response = await asyncio.to_thread(requests.head, pdf_url)
             if response.status_code != 200:
                 raise HTTPException(status_code=400, detail="无效的PDF URL")
         except requests.RequestException:
@@ -5,15 +5,21 @@ from pydantic import BaseModel, validator
 
 from app.models import rerank_task_model
 from app.utils.queue_manager import task_queue
+from app.utils.task_processor import task_processor
+from app.utils.concurrency_limiter import ConcurrencyLimiter
+from app.utils.task_dedup import task_dedup
+from app.utils.model_registry import model_registry
 from app.utils.logger import logger
 
 router = APIRouter()
+sync_limiter = ConcurrencyLimiter("rerank")
 
 class RerankRequest(BaseModel):
     query: str
     texts: List[str]
     top_k: int
     handle: str = None
+    priority: str = None
 
     @validator('query')
     def validate_query(cls, v):
@@ -36,6 +42,15 @@ class RerankRequest(BaseModel):
 @router.post("/", response_model=Dict[str, Any])
 async def create_rerank_task(request: RerankRequest):
     """创建Rerank任务"""
+    try:
+        priority = task_queue.normalize_priority(request.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    dedup_key = task_dedup.make_key("rerank", task_processor.rerank_service.model_name,
+                                    {"query": request.query, "texts": request.texts, "top_k": request.top_k})
+    retry_after = await task_queue.check_admission("rerank")
+    if retry_after is not None and not task_dedup.has(dedup_key):
+        raise HTTPException(status_code=429, detail="任务积压过多，请稍后再试", headers={"Retry-After": str(retry_after)})
     task_id = str(uuid.uuid4())
     logger.info(f"开始创建Rerank任务，task_id: {task_id}, query: {request.query[:50]}, 候选文本数量: {len(request.texts)}")
     
@@ -47,11 +62,8 @@ async def create_rerank_task(request: RerankRequest):
         "handle": request.handle
     })
     
-    # 添加到任务队列
-    success = await task_queue.add_task(
-        task_id=task_id,
-        task_type="rerank"
-    )
+    # 添加到任务队列（相同任务可直接复用结果）
+    success = await task_processor.submit_task(task_id, "rerank", priority, dedup_key)
     
     if not success:
         await rerank_task_model.update(task_id, {"status": "failed"})
@@ -59,6 +71,24 @@ async def create_rerank_task(request: RerankRequest):
     
     return {"task_id": task_id, "success": True}
 
+@router.post("/sync", response_model=Dict[str, Any])
+async def create_rerank_sync(request: RerankRequest):
+    """同步执行Rerank，不经过任务存储和队列，直接返回结果"""
+    if not sync_limiter.try_acquire():
+        raise HTTPException(status_code=429, detail="同步接口繁忙，请稍后再试", headers={"Retry-After": "1"})
+    try:
+        rankings = await task_processor.rerank_service.rerank_texts(
+            query=request.query,
+            texts=request.texts,
+            top_k=request.top_k
+        )
+    except Exception as e:
+        logger.error(f"同步Rerank失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        sync_limiter.release()
+    return {"rankings": rankings}
+
 @router.get("/{task_id}", response_model=Dict[str, Any])
 async def get_rerank_task(task_id: str):
     """获取Rerank任务状态和结果"""
@@ -79,7 +109,12 @@ async def get_rerank_task(task_id: str):
         "updated_at": task["updated_at"]
     }
 
-@router.get("/", response_model=Dict[str, int])
+@router.get("/", response_model=Dict[str, Any])
 async def get_queue_status():
-    """获取队列状态"""
-    return await task_queue.get_queue_status()
\ No newline at end of file
+    """获取队列状态、同步接口、去重、token分批和模型加载统计"""
+    status = await task_queue.get_queue_status()
+    status["sync"] = sync_limiter.stats()
+    status["dedup"] = task_dedup.stats("rerank")
+    status["token_batching"] = task_processor.rerank_service.batcher.stats()
+    status["models"] = model_registry.stats()
+    return status
\ No newline at end of file
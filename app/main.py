@@ -4,6 +4,11 @@ from dotenv import load_dotenv
 import os
 import asyncio
 from app.utils.task_processor import task_processor
+from app.utils.queue_manager import task_queue
+from app.utils.callback_dispatcher import callback_dispatcher
+from app.models.task_store import task_store
+from app.utils.task_janitor import task_janitor
+from app.services.vector_index import vector_index
 
 # 加载环境变量
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
@@ -26,13 +31,32 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def startup_event():
+    # 恢复上次运行遗留的任务
+    await task_processor.recover_tasks()
+    # 在线程中打开Embedding磁盘缓存，加载键索引不阻塞事件循环
+    if task_processor.embedding_service.cache is not None:
+        await asyncio.to_thread(task_processor.embedding_service.cache.open)
     # 启动任务处理器
     asyncio.create_task(task_processor.start_processing())
+    # 启动过期任务清理
+    app.state.janitor = asyncio.create_task(task_janitor.run())
 
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
+    app.state.janitor.cancel()
     # 停止任务处理器
-    task_processor.stop_processing()
+    await task_processor.stop_processing()
+    task_queue.close()
+    # 发送剩余的回调
+    await callback_dispatcher.close()
+    # 写入缓存中剩余的任务数据修改
+    await task_store.flush()
+    task_store.close()
+    # 写回Embedding磁盘缓存
+    if task_processor.embedding_service.cache is not None:
+        task_processor.embedding_service.cache.close()
+    # 写回向量索引
+    vector_index.close()
 
 # 导入路由
 from app.api.ocr_router import router as ocr_router
@@ -45,6 +69,10 @@ app.include_router(ocr_router, prefix="/api/v1/ocr", tags=["ocr"])
 app.include_router(mask_router, prefix="/api/v1/mask", tags=["mask"])
 app.include_router(embedding_router, prefix="/api/v1/embedding", tags=["embedding"])
 app.include_router(rerank_router, prefix="/api/v1/rerank", tags=["rerank"])
+# 向量索引（VECTOR_INDEX_ENABLED开启）
+if vector_index.enabled:
+    from app.api.index_router import router as index_router
+    app.include_router(index_router, prefix="/api/v1/index", tags=["index"])
 
 @app.get("/ping")
 async def ping():
@@ -56,7 +84,7 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "janitor": task_janitor.stats}
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,8 +1,10 @@
 from .embedding import EmbeddingTask
+from .embedding_batch import EmbeddingBatchTask
 from .mask import MaskTask
 from .rerank import RerankTask
 
 # 创建全局实例
 embedding_task_model = EmbeddingTask()
+embedding_batch_task_model = EmbeddingBatchTask()
 mask_task_model = MaskTask()
 rerank_task_model = RerankTask()
\ No newline at end of file
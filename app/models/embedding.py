@@ -1,32 +1,25 @@
-import json
-import os
 from datetime import datetime
 from typing import Dict, Any, Optional
-from pathlib import Path
-import fcntl
-import errno
 from .file_models import FileModel
+from .task_store import TaskStore
 
 class EmbeddingTask(FileModel):
-    def __init__(self):
-        super().__init__("embedding_task")
+    def __init__(self, store: Optional[TaskStore] = None):
+        super().__init__("embedding_task", store)
 
     async def create(self, task_id: str, data: Dict[str, Any]) -> bool:
-        file_path = self._get_file_path(task_id)
         task_data = {
             "task_id": task_id,
             "status": "pending",
             "text": data["text"],
             "embedding": None,
             "handle": data.get("handle", None),  # 获取回调地址
+            "vector_format": data.get("vector_format", "list"),
+            "callback_format": data.get("callback_format", "json"),
+            "output_dimensions": data.get("output_dimensions"),  # 截取的输出维度，None表示完整维度
+            "long_text": data.get("long_text"),  # 长文本分块参数，None表示截断
             "created_at": datetime.utcnow().isoformat(),
             "updated_at": datetime.utcnow().isoformat()
         }
         
-        fd = self._acquire_lock(file_path)
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(self._serialize(task_data))
-            return True
-        finally:
-            self._release_lock(fd)
\ No newline at end of file
+        return await self._create(task_id, task_data)
\ No newline at end of file
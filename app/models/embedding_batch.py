@@ -0,0 +1,56 @@
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from .file_models import FileModel
+from .task_store import TaskStore
+
+class EmbeddingBatchTask(FileModel):
+    """批量Embedding任务
+
+    输入文本和ID单独保存为一条输入记录（{task_id}.inputs），只在创建时写入一次；
+    任务记录只包含状态和进度，处理每个分块时更新任务记录不会重写全部输入文本。
+    """
+
+    def __init__(self, store: Optional[TaskStore] = None):
+        super().__init__("embedding_batch_task", store)
+
+    @staticmethod
+    def _inputs_id(task_id: str) -> str:
+        return f"{task_id}.inputs"
+
+    async def create(self, task_id: str, data: Dict[str, Any]) -> bool:
+        now = datetime.utcnow().isoformat()
+        inputs = {
+            "task_id": self._inputs_id(task_id),
+            "status": "input",
+            "texts": data["texts"],
+            "ids": data.get("ids"),
+            "created_at": now,
+            "updated_at": now
+        }
+        task_data = {
+            "task_id": task_id,
+            "status": "pending",
+            "count": len(data["texts"]),
+            "processed": 0,
+            "embeddings": None,
+            "handle": data.get("handle"),
+            "vector_format": data.get("vector_format", "list"),
+            "callback_format": data.get("callback_format", "json"),
+            "output_dimensions": data.get("output_dimensions"),  # 截取的输出维度，None表示完整维度
+            "chunk_size": data.get("chunk_size"),
+            "created_at": now,
+            "updated_at": now
+        }
+
+        return await self.store.put(self._inputs_id(task_id), "embedding_batch_inputs", inputs) \
+            and await self._create(task_id, task_data)
+
+    async def get_inputs(self, task_id: str) -> Tuple[Optional[List[str]], Optional[List[Any]]]:
+        """读取任务的输入文本和ID，兼容直接保存在任务记录中的旧数据"""
+        inputs = await self.store.get(self._inputs_id(task_id)) or await self.get(task_id) or {}
+        return inputs.get("texts"), inputs.get("ids")
+
+    async def delete(self, task_id: str) -> bool:
+        """删除任务记录和输入记录"""
+        await self.store.delete(self._inputs_id(task_id))
+        return await super().delete(task_id)
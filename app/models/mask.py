@@ -1,18 +1,13 @@
-import json
-import os
 from datetime import datetime
 from typing import Dict, Any, Optional
-from pathlib import Path
-import fcntl
-import errno
 from .file_models import FileModel
+from .task_store import TaskStore
 
 class MaskTask(FileModel):
-    def __init__(self):
-        super().__init__("mask_task")
+    def __init__(self, store: Optional[TaskStore] = None):
+        super().__init__("mask_task", store)
 
     async def create(self, task_id: str, data: Dict[str, Any]) -> bool:
-        file_path = self._get_file_path(task_id)
         task_data = {
             "task_id": task_id,
             "status": "pending",
@@ -28,10 +23,4 @@ class MaskTask(FileModel):
             "updated_at": datetime.utcnow().isoformat()
         }
         
-        fd = self._acquire_lock(file_path)
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(self._serialize(task_data))
-            return True
-        finally:
-            self._release_lock(fd)
\ No newline at end of file
+        return await self._create(task_id, task_data)
\ No newline at end of file
@@ -1,13 +1,13 @@
 from datetime import datetime
 from typing import Dict, Any, Optional
 from app.models.file_models import FileModel
+from app.models.task_store import TaskStore
 
 class RerankTask(FileModel):
-    def __init__(self):
-        super().__init__("rerank_task")
+    def __init__(self, store: Optional[TaskStore] = None):
+        super().__init__("rerank_task", store)
 
     async def create(self, task_id: str, data: Dict[str, Any]) -> bool:
-        file_path = self._get_file_path(task_id)
         task_data = {
             "task_id": task_id,
             "status": "pending",
@@ -21,13 +21,7 @@ class RerankTask(FileModel):
             "updated_at": datetime.utcnow().isoformat()
         }
         
-        fd = self._acquire_lock(file_path)
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(self._serialize(task_data))
-            return True
-        finally:
-            self._release_lock(fd)
+        return await self._create(task_id, task_data)
 
 # 创建全局实例
 rerank_task_model = RerankTask()
\ No newline at end of file
@@ -0,0 +1,610 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.utils.logger import logger
+
+load_dotenv()
+
+
+def _isoformat(timestamp: float) -> str:
+    """时间戳转为与任务updated_at相同格式的UTC时间字符串"""
+    return datetime.utcfromtimestamp(timestamp).isoformat()
+
+# 落盘策略：always 每次提交都fsync（文件存储同时fsync目录），
+# normal SQLite在WAL检查点时fsync、文件存储在替换前fsync文件，off 不主动fsync
+FSYNC_POLICY = os.getenv("TASK_STORE_FSYNC", "normal").lower()
+_SQLITE_SYNCHRONOUS = {"always": "FULL", "normal": "NORMAL", "off": "OFF"}
+
+
+class TaskStore:
+    """任务数据存储接口
+
+    保存每个任务的完整数据（字典），任务模型（EmbeddingTask/MaskTask/RerankTask）通过它读写任务。
+    """
+
+    async def put(self, task_id: str, task_type: str, data: Dict[str, Any]) -> bool:
+        """写入新任务，已存在时覆盖"""
+        raise NotImplementedError
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """读取任务数据，不存在时返回None"""
+        raise NotImplementedError
+
+    async def update(self, task_id: str, updates: Dict[str, Any]) -> bool:
+        """合并更新任务数据并刷新updated_at，任务不存在时返回False"""
+        raise NotImplementedError
+
+    async def delete(self, task_id: str) -> bool:
+        """删除任务数据，任务不存在时返回False"""
+        raise NotImplementedError
+
+    async def expire(self, cutoffs: Dict[str, float], default_cutoff: float, limit: int) -> Dict[str, Any]:
+        """清理一批过期任务，多次调用逐步完成一轮清理
+
+        Args:
+            cutoffs: 按任务状态的过期时间点（时间戳），最后更新早于该时间点的任务被删除
+            default_cutoff: cutoffs中没有的状态使用的过期时间点
+            limit: 本次最多检查的任务数
+
+        Returns:
+            Dict[str, Any]: removed（删除的任务数）、bytes（回收的字节数）、
+                task_ids（删除的任务ID）、done（本轮清理是否已完成）
+        """
+        return {"removed": 0, "bytes": 0, "task_ids": [], "done": True}
+
+    async def flush(self) -> None:
+        """把尚未持久化的写操作写入存储"""
+
+    def close(self) -> None:
+        """关闭存储"""
+
+
+class JsonFileTaskStore(TaskStore):
+    """JSON文件任务存储，每个任务一个JSON文件，保存在DATA_DIR目录下
+
+    任务文件按task_id哈希的前两级前缀分目录保存（如 DATA_DIR/3f/a2/{task_id}.json），避免单个目录文件过多；
+    读取时兼容旧版本直接保存在DATA_DIR下的文件，修改旧文件时迁移到分片目录。
+
+    文件读写都在线程中执行，不阻塞事件循环。写入先写临时文件再用os.replace原子替换，
+    读取方不会看到写了一半的文件。修改同一任务的操作通过条带锁互斥：task_id按哈希映射到
+    TASK_FILE_LOCK_STRIPES个锁文件之一，进程内用线程锁、进程间用阻塞的flock。
+    锁加在独立的锁文件上而不是任务文件本身，因为任务文件会被替换为新的inode。
+    """
+
+    def __init__(self, data_dir: Optional[str] = None, lock_stripes: Optional[int] = None):
+        self.data_dir = Path(data_dir or os.getenv("DATA_DIR", "data/tasks"))
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.lock_dir = self.data_dir / ".locks"
+        self.lock_dir.mkdir(exist_ok=True)
+        self.lock_stripes = lock_stripes or int(os.getenv("TASK_FILE_LOCK_STRIPES", 64))
+        self.thread_locks = [threading.Lock() for _ in range(self.lock_stripes)]
+        # 清理时遍历任务文件的游标，跨多次expire调用保持
+        self._sweep_iter: Optional[Iterator[os.DirEntry]] = None
+
+    def _get_file_path(self, task_id: str) -> Path:
+        digest = hashlib.sha1(task_id.encode("utf-8")).hexdigest()
+        return self.data_dir / digest[:2] / digest[2:4] / f"{task_id}.json"
+
+    def _get_legacy_path(self, task_id: str) -> Path:
+        """旧版本不分片的文件路径"""
+        return self.data_dir / f"{task_id}.json"
+
+    def _serialize(self, data: Dict[str, Any]) -> str:
+        return json.dumps(data, ensure_ascii=False, indent=2)
+
+    def _deserialize(self, data: str) -> Dict[str, Any]:
+        return json.loads(data) if data else {}
+
+    @contextmanager
+    def _locked(self, task_id: str):
+        """获取任务所在条带的锁，锁被占用时阻塞等待"""
+        stripe = zlib.crc32(task_id.encode("utf-8")) % self.lock_stripes
+        with self.thread_locks[stripe]:
+            fd = os.open(str(self.lock_dir / f"{stripe}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _write_file(self, file_path: Path, data: Dict[str, Any]) -> None:
+        """原子写入：写临时文件、fsync后替换目标文件"""
+        tmp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self._serialize(data))
+                if FSYNC_POLICY != "off":
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        if FSYNC_POLICY == "always":
+            # 目录也fsync，保证替换操作本身落盘
+            dir_fd = os.open(str(file_path.parent), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _read_file(self, file_path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return self._deserialize(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        task_data = self._read_file(self._get_file_path(task_id))
+        if task_data is None:
+            task_data = self._read_file(self._get_legacy_path(task_id))
+        return task_data
+
+    def _put(self, task_id: str, data: Dict[str, Any]) -> bool:
+        with self._locked(task_id):
+            self._write_file(self._get_file_path(task_id), data)
+        return True
+
+    def _update(self, task_id: str, updates: Dict[str, Any]) -> bool:
+        file_path = self._get_file_path(task_id)
+        legacy_path = self._get_legacy_path(task_id)
+        with self._locked(task_id):
+            task_data = self._read_file(file_path)
+            migrate = task_data is None
+            if migrate:
+                task_data = self._read_file(legacy_path)
+            if task_data is None:
+                return False
+            task_data.update(updates)
+            task_data["updated_at"] = datetime.utcnow().isoformat()
+            self._write_file(file_path, task_data)
+            if migrate:
+                legacy_path.unlink(missing_ok=True)
+        return True
+
+    def _delete(self, task_id: str) -> bool:
+        deleted = False
+        with self._locked(task_id):
+            for file_path in (self._get_file_path(task_id), self._get_legacy_path(task_id)):
+                try:
+                    file_path.unlink()
+                    deleted = True
+                except FileNotFoundError:
+                    pass
+        return deleted
+
+    def _iter_files(self, directory: Path, depth: int = 0) -> Iterator[os.DirEntry]:
+        """逐个遍历任务文件和残留的临时文件，不一次性列出整个目录树"""
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if depth < 2 and not entry.name.startswith("."):
+                        yield from self._iter_files(Path(entry.path), depth + 1)
+                elif entry.name.endswith(".json") or entry.name.endswith(".tmp"):
+                    yield entry
+
+    def _expire(self, cutoffs: Dict[str, float], default_cutoff: float, limit: int) -> Dict[str, Any]:
+        result = {"removed": 0, "bytes": 0, "task_ids": [], "done": False}
+        if self._sweep_iter is None:
+            self._sweep_iter = self._iter_files(self.data_dir)
+        latest_cutoff = max([default_cutoff, *cutoffs.values()])
+        now = time.time()
+        for _ in range(limit):
+            entry = next(self._sweep_iter, None)
+            if entry is None:
+                self._sweep_iter = None
+                result["done"] = True
+                break
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".tmp"):
+                    # 进程崩溃残留的临时文件
+                    if stat.st_mtime < now - 3600:
+                        os.unlink(entry.path)
+                        result["bytes"] += stat.st_size
+                    continue
+                # 修改时间即最后更新时间，较新的文件不需要读取内容
+                if stat.st_mtime >= latest_cutoff:
+                    continue
+                task_data = self._read_file(Path(entry.path)) or {}
+                if stat.st_mtime >= cutoffs.get(task_data.get("status"), default_cutoff):
+                    continue
+                task_id = entry.name[:-len(".json")]
+                with self._locked(task_id):
+                    if os.stat(entry.path).st_mtime != stat.st_mtime:
+                        continue
+                    os.unlink(entry.path)
+            except (FileNotFoundError, ValueError):
+                continue
+            result["removed"] += 1
+            result["bytes"] += stat.st_size
+            result["task_ids"].append(task_id)
+        return result
+
+    async def put(self, task_id: str, task_type: str, data: Dict[str, Any]) -> bool:
+        return await asyncio.to_thread(self._put, task_id, data)
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, task_id)
+
+    async def update(self, task_id: str, updates: Dict[str, Any]) -> bool:
+        return await asyncio.to_thread(self._update, task_id, updates)
+
+    async def delete(self, task_id: str) -> bool:
+        return await asyncio.to_thread(self._delete, task_id)
+
+    async def expire(self, cutoffs: Dict[str, float], default_cutoff: float, limit: int) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._expire, cutoffs, default_cutoff, limit)
+
+
+class SQLiteTaskStore(TaskStore):
+    """SQLite任务存储
+
+    所有任务保存在一个WAL模式的SQLite数据库中，task_id为主键，status/type/created_at建有索引。
+    写操作交给单独的写线程执行：写线程一次取出队列中积压的所有写操作，在同一个事务中执行并提交（组提交），
+    调用方在提交完成后才返回。读操作使用单独的连接在线程中执行，不阻塞事件循环，也不等待写事务。
+    """
+
+    def __init__(self, path: Optional[str] = None, batch_size: Optional[int] = None):
+        self.path = Path(path or os.getenv("TASK_STORE_PATH", "data/tasks.db"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 一次组提交最多包含的写操作数
+        self.batch_size = batch_size or int(os.getenv("TASK_STORE_BATCH_SIZE", 256))
+        self.write_conn = self._connect()
+        self.write_conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                status TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                data TEXT NOT NULL
+            )
+        """)
+        for column in ("status", "type", "created_at", "updated_at"):
+            self.write_conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_{column} ON tasks ({column})")
+        # 清理游标 (updated_at, task_id)，只在写线程中访问
+        self._sweep_cursor: Optional[Tuple[str, str]] = None
+        self.read_conn = self._connect()
+        self.read_lock = threading.Lock()
+        self.writes: "queue.Queue[Optional[Tuple[Callable, Tuple, Future]]]" = queue.Queue()
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_loop, name="task-store-writer", daemon=True)
+        self.writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={_SQLITE_SYNCHRONOUS.get(FSYNC_POLICY, 'NORMAL')}")
+        return conn
+
+    def _write_loop(self) -> None:
+        """写线程：按批取出写操作，在一个事务中执行并提交"""
+        while True:
+            item = self.writes.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self, batch: List[Tuple[Callable, Tuple, Future]]) -> None:
+        conn = self.write_conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            results = [func(conn, *args) for func, args, _ in batch]
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            # 整批失败时逐个重新执行，只让出错的写操作失败
+            logger.warning(f"任务存储批量提交失败，逐个重试: {str(e)}")
+            for item in batch:
+                self._commit_batch([item])
+            return
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    async def _write(self, func: Callable, *args) -> Any:
+        if self.closed:
+            raise RuntimeError("任务存储已关闭")
+        future: Future = Future()
+        self.writes.put((func, args, future))
+        return await asyncio.wrap_future(future)
+
+    @staticmethod
+    def _put(conn: sqlite3.Connection, task_id: str, task_type: str, data: Dict[str, Any]) -> bool:
+        conn.execute(
+            "INSERT OR REPLACE INTO tasks (task_id, type, status, created_at, updated_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (task_id, task_type, data.get("status"), data.get("created_at"), data.get("updated_at"),
+             json.dumps(data, ensure_ascii=False))
+        )
+        return True
+
+    @staticmethod
+    def _update(conn: sqlite3.Connection, task_id: str, updates: Dict[str, Any]) -> bool:
+        row = conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if not row:
+            return False
+        task_data = json.loads(row[0])
+        task_data.update(updates)
+        task_data["updated_at"] = datetime.utcnow().isoformat()
+        conn.execute(
+            "UPDATE tasks SET status = ?, updated_at = ?, data = ? WHERE task_id = ?",
+            (task_data.get("status"), task_data["updated_at"], json.dumps(task_data, ensure_ascii=False), task_id)
+        )
+        return True
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, task_id: str) -> bool:
+        return conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,)).rowcount > 0
+
+    def _expire(self, conn: sqlite3.Connection, cutoffs: Dict[str, float], default_cutoff: float,
+                limit: int) -> Dict[str, Any]:
+        """按updated_at顺序检查一批最后更新早于最晚过期时间点的任务，删除按状态已过期的任务"""
+        latest_cutoff = _isoformat(max([default_cutoff, *cutoffs.values()]))
+        cursor = self._sweep_cursor or ("", "")
+        rows = conn.execute(
+            "SELECT task_id, status, updated_at, length(data) FROM tasks "
+            "WHERE updated_at < ? AND (updated_at > ? OR (updated_at = ? AND task_id > ?)) "
+            "ORDER BY updated_at, task_id LIMIT ?",
+            (latest_cutoff, cursor[0], cursor[0], cursor[1], limit)
+        ).fetchall()
+        expired = [(task_id, size) for task_id, status, updated_at, size in rows
+                   if updated_at < _isoformat(cutoffs.get(status, default_cutoff))]
+        conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(task_id,) for task_id, _ in expired])
+        done = len(rows) < limit
+        self._sweep_cursor = None if done else (rows[-1][2], rows[-1][0])
+        return {
+            "removed": len(expired),
+            "bytes": sum(size for _, size in expired),
+            "task_ids": [task_id for task_id, _ in expired],
+            "done": done
+        }
+
+    def _read(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self.read_lock:
+            row = self.read_conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def put(self, task_id: str, task_type: str, data: Dict[str, Any]) -> bool:
+        return await self._write(self._put, task_id, task_type, data)
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._read, task_id)
+
+    async def update(self, task_id: str, updates: Dict[str, Any]) -> bool:
+        return await self._write(self._update, task_id, updates)
+
+    async def delete(self, task_id: str) -> bool:
+        return await self._write(self._delete, task_id)
+
+    async def expire(self, cutoffs: Dict[str, float], default_cutoff: float, limit: int) -> Dict[str, Any]:
+        return await self._write(self._expire, cutoffs, default_cutoff, limit)
+
+    def close(self) -> None:
+        """提交剩余的写操作并关闭数据库"""
+        if self.closed:
+            return
+        self.closed = True
+        self.writes.put(None)
+        self.writer.join()
+        self.write_conn.close()
+        with self.read_lock:
+            self.read_conn.close()
+        logger.info("任务存储已关闭")
+
+
+class CachedTaskStore(TaskStore):
+    """带内存缓存和延迟写入（write-behind）的任务存储
+
+    活跃任务保存在有容量上限（TASK_CACHE_SIZE）的LRU缓存中，超过TASK_CACHE_TTL秒未访问的任务被淘汰，
+    读取和状态轮询命中缓存时不访问底层存储。新任务直接写入底层存储（入队前任务数据已落盘），
+    之后的修改先写缓存并记为脏数据，由后台协程每隔TASK_CACHE_FLUSH_INTERVAL_MS毫秒批量写入底层存储，
+    同一任务的多次修改合并为一次写入；脏数据达到TASK_CACHE_FLUSH_BATCH条时立即写入。尚未写入的脏数据不会被淘汰。
+
+    缓存只在本进程内有效，进程崩溃时最近一个写入间隔内的修改会丢失。
+    多进程共享队列（QUEUE_BACKEND为sqlite或redis）时不使用缓存，见 create_task_store。
+    """
+
+    def __init__(self, backend: TaskStore, max_size: Optional[int] = None, ttl: Optional[float] = None):
+        self.backend = backend
+        self.max_size = max_size or int(os.getenv("TASK_CACHE_SIZE", 10000))
+        self.ttl = ttl if ttl is not None else float(os.getenv("TASK_CACHE_TTL", 300))
+        self.flush_interval = float(os.getenv("TASK_CACHE_FLUSH_INTERVAL_MS", 100)) / 1000
+        self.flush_batch = int(os.getenv("TASK_CACHE_FLUSH_BATCH", 512))
+        # task_id -> (任务数据, 过期时间)
+        self.cache: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        # 待写入的操作 task_id -> (操作, 任务类型, 任务数据)，操作为 put/update/delete
+        self.dirty: Dict[str, Tuple[str, Optional[str], Optional[Dict[str, Any]]]] = {}
+        self.flushing: Dict[str, Tuple[str, Optional[str], Optional[Dict[str, Any]]]] = {}
+        self.flusher: Optional[asyncio.Task] = None
+        self._dirty_event: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.stats = {"hits": 0, "misses": 0, "flushes": 0, "flushed_writes": 0}
+
+    def _cache_put(self, task_id: str, data: Dict[str, Any]) -> None:
+        self.cache[task_id] = (data, time.monotonic() + self.ttl)
+        self.cache.move_to_end(task_id)
+        self._evict()
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的干净数据，直到不超过容量上限"""
+        excess = len(self.cache) - self.max_size
+        if excess <= 0:
+            return
+        for task_id in list(self.cache):
+            if excess <= 0:
+                break
+            if task_id not in self.dirty and task_id not in self.flushing:
+                del self.cache[task_id]
+                excess -= 1
+
+    def _mark_dirty(self, task_id: str, op: str, task_type: Optional[str], data: Optional[Dict[str, Any]]) -> None:
+        self.dirty[task_id] = (op, task_type, data)
+        if self.flusher is None:
+            self._dirty_event = asyncio.Event()
+            self.flusher = asyncio.create_task(self._flush_loop())
+        self._dirty_event.set()
+
+    async def _flush_loop(self) -> None:
+        """后台写入协程"""
+        while True:
+            await self._dirty_event.wait()
+            if len(self.dirty) < self.flush_batch:
+                await asyncio.sleep(self.flush_interval)
+            self._dirty_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"任务缓存写入存储时发生错误: {str(e)}")
+
+    async def flush(self) -> None:
+        """把所有脏数据批量写入底层存储，写入失败的操作留待下次重试"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if not self.dirty:
+            return
+        self.flushing, self.dirty = self.dirty, {}
+        ops = []
+        for task_id, (op, task_type, data) in self.flushing.items():
+            if op == "update":
+                ops.append(self.backend.update(task_id, data))
+            else:
+                ops.append(self.backend.delete(task_id))
+        results = await asyncio.gather(*ops, return_exceptions=True)
+        failed = 0
+        for (task_id, write), result in zip(self.flushing.items(), results):
+            if isinstance(result, Exception) and task_id not in self.dirty:
+                self.dirty[task_id] = write
+                failed += 1
+        if failed:
+            logger.error(f"任务缓存写入存储失败 {failed} 条，稍后重试")
+        self.stats["flushes"] += 1
+        self.stats["flushed_writes"] += len(self.flushing) - failed
+        self.flushing = {}
+        self._evict()
+
+    async def put(self, task_id: str, task_type: str, data: Dict[str, Any]) -> bool:
+        """新任务直接写入底层存储，之后其他进程或重启后恢复的队列都能读到任务数据"""
+        self.dirty.pop(task_id, None)
+        result = await self.backend.put(task_id, task_type, data)
+        self._cache_put(task_id, data)
+        return result
+
+    async def _lookup(self, task_id: str) -> Optional[Dict[str, Any]]:
+        write = self.dirty.get(task_id) or self.flushing.get(task_id)
+        if write and write[0] == "delete":
+            return None
+        entry = self.cache.get(task_id)
+        if entry and (write or entry[1] > time.monotonic()):
+            self.cache.move_to_end(task_id)
+            self.stats["hits"] += 1
+            return entry[0]
+        self.cache.pop(task_id, None)
+        self.stats["misses"] += 1
+        data = await self.backend.get(task_id)
+        if data is not None:
+            self._cache_put(task_id, data)
+        return data
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        data = await self._lookup(task_id)
+        return dict(data) if data is not None else None
+
+    async def update(self, task_id: str, updates: Dict[str, Any]) -> bool:
+        current = await self._lookup(task_id)
+        if current is None:
+            return False
+        data = {**current, **updates, "updated_at": datetime.utcnow().isoformat()}
+        self._mark_dirty(task_id, "update", None, data)
+        self._cache_put(task_id, data)
+        return True
+
+    async def delete(self, task_id: str) -> bool:
+        existed = await self._lookup(task_id) is not None
+        self.cache.pop(task_id, None)
+        self._mark_dirty(task_id, "delete", None, None)
+        return existed
+
+    async def expire(self, cutoffs: Dict[str, float], default_cutoff: float, limit: int) -> Dict[str, Any]:
+        await self.flush()
+        result = await self.backend.expire(cutoffs, default_cutoff, limit)
+        for task_id in result["task_ids"]:
+            if task_id not in self.dirty:
+                self.cache.pop(task_id, None)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        return {**self.stats, "size": len(self.cache), "dirty": len(self.dirty)}
+
+    def close(self) -> None:
+        """停止后台写入并关闭底层存储，调用前应先await flush()"""
+        if self.flusher:
+            self.flusher.cancel()
+            self.flusher = None
+        if self.dirty:
+            logger.warning(f"任务缓存关闭时仍有 {len(self.dirty)} 条修改未写入")
+        self.backend.close()
+
+
+def create_task_store() -> TaskStore:
+    """根据环境变量TASK_STORE创建任务存储：sqlite（默认）或 file
+
+    TASK_CACHE_SIZE大于0时在前面加内存缓存。多进程共享队列（QUEUE_BACKEND为sqlite或redis）时，
+    任务可能由其他进程处理和查询，进程内缓存会读到过期状态、延迟写入的修改也可能丢失，因此不使用缓存。
+    """
+    store = os.getenv("TASK_STORE", "sqlite").lower()
+    if store == "file":
+        logger.info("使用JSON文件任务存储")
+        backend: TaskStore = JsonFileTaskStore()
+    else:
+        logger.info("使用SQLite任务存储")
+        backend = SQLiteTaskStore()
+    queue_backend = os.getenv("QUEUE_BACKEND", "memory").lower()
+    if queue_backend in ("sqlite", "redis"):
+        logger.info(f"队列后端 {queue_backend} 由多个进程共享，不使用任务缓存")
+    elif int(os.getenv("TASK_CACHE_SIZE", 10000)) > 0:
+        return CachedTaskStore(backend)
+    return backend
+
+
+# 创建全局任务存储实例
+task_store = create_task_store()
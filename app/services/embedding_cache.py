@@ -0,0 +1,287 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from app.utils.logger import logger
+
+load_dotenv()
+
+# 磁盘层每条键记录：20字节SHA-1 + 8字节序号（0表示空）
+_KEY_SIZE = 20
+_RECORD_DTYPE = np.dtype([("key", f"V{_KEY_SIZE}"), ("seq", "<u8")])
+_RECORD_SIZE = _RECORD_DTYPE.itemsize
+# 内存层每条记录除向量外的估计开销（字节）
+_ENTRY_OVERHEAD = 120
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：Unicode NFC规范化并去掉首尾空白"""
+    return unicodedata.normalize("NFC", text).strip()
+
+
+class DiskVectorStore:
+    """基于mmap的磁盘向量存储
+
+    目录结构：
+
+        meta.json    模型指纹、向量维度和容量，与当前模型不一致时整个目录被清空重建
+        vectors.f32  (容量, 维度) 的float32矩阵，通过np.memmap读写
+        keys.bin     与矩阵行一一对应的键记录（键 + 写入序号）
+
+    容量写满后按环形缓冲覆盖最早写入的行。写入时先清空行的键记录，再写向量，最后写键记录，
+    中途崩溃最多丢失这一条记录，不会把键映射到错误的向量。
+    本身不加锁，由EmbeddingCache在持有锁时访问。
+    """
+
+    def __init__(self, directory: Path, fingerprint: str, dimensions: int, capacity: int):
+        self.directory = directory
+        self.dimensions = dimensions
+        self.capacity = capacity
+        directory.mkdir(parents=True, exist_ok=True)
+        meta = {"fingerprint": fingerprint, "dimensions": dimensions, "capacity": capacity}
+        meta_path = directory / "meta.json"
+        existing = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else None
+        if existing != meta:
+            if existing is not None:
+                logger.info(f"Embedding磁盘缓存的模型或配置已变化，清空缓存: {directory}")
+            for name in ("vectors.f32", "keys.bin"):
+                (directory / name).unlink(missing_ok=True)
+            meta_path.write_text(json.dumps(meta), encoding="utf-8")
+
+        vectors_path = directory / "vectors.f32"
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+" if vectors_path.exists() else "w+",
+                                 shape=(capacity, dimensions))
+        keys_path = directory / "keys.bin"
+        if not keys_path.exists():
+            with open(keys_path, "wb") as f:
+                f.truncate(capacity * _RECORD_SIZE)
+        self.keys_file = open(keys_path, "r+b")
+
+        # 键记录整体按结构化dtype解析；行号 -> 键和序号保存为数组，键 -> 行号只为非空行建立
+        records = np.frombuffer(self.keys_file.read(capacity * _RECORD_SIZE), dtype=_RECORD_DTYPE)
+        self.row_keys = records["key"].copy()
+        self.row_used = records["seq"] != 0
+        rows = np.flatnonzero(self.row_used)
+        self.index: Dict[bytes, int] = dict(zip(self.row_keys[rows].tolist(), rows.tolist()))
+        self.next_seq = 1
+        self.next_row = 0
+        if len(rows):
+            last = int(np.argmax(records["seq"]))
+            self.next_seq, self.next_row = int(records["seq"][last]) + 1, (last + 1) % capacity
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        row = self.index.get(key)
+        return None if row is None else np.array(self.vectors[row])
+
+    def _write_record(self, row: int, key: bytes, seq: int) -> None:
+        self.keys_file.seek(row * _RECORD_SIZE)
+        self.keys_file.write(key + seq.to_bytes(8, "little"))
+
+    def put(self, key: bytes, vector: np.ndarray) -> None:
+        if key in self.index:
+            return
+        row = self.next_row
+        if self.row_used[row]:
+            del self.index[self.row_keys[row].tobytes()]
+        self._write_record(row, b"\0" * _KEY_SIZE, 0)
+        self.vectors[row] = vector
+        self._write_record(row, key, self.next_seq)
+        self.index[key] = row
+        self.row_keys[row] = key
+        self.row_used[row] = True
+        self.next_seq += 1
+        self.next_row = (row + 1) % self.capacity
+
+    def flush(self) -> None:
+        self.vectors.flush()
+        self.keys_file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.keys_file.close()
+
+
+class EmbeddingCache:
+    """两级Embedding缓存
+
+    以 (模型指纹, 规范化文本) 的哈希为键：
+
+    - 内存层：LRU，总占用不超过EMBEDDING_CACHE_MEMORY_MB
+    - 磁盘层：EMBEDDING_CACHE_DIR下基于mmap的向量存储，最多EMBEDDING_CACHE_DISK_ENTRIES条，重启后仍然有效
+
+    模型指纹由模型名称和EMBEDDING_CACHE_VERSION组成，修改版本号或更换模型后磁盘层自动清空。
+    磁盘层在首次写入（确定向量维度）时打开，并用文件锁保证只被一个进程使用，其他进程只使用内存层。
+    推理执行器的多个线程会同时读写缓存，所有访问都持有同一把线程锁，
+    因此调用方应在线程中调用（asyncio.to_thread），不要在事件循环上直接调用。
+    """
+
+    def __init__(self, model_name: str, directory: Optional[str] = None, memory_mb: Optional[float] = None,
+                 disk_entries: Optional[int] = None):
+        self.fingerprint = f"{model_name}@{os.getenv('EMBEDDING_CACHE_VERSION', '1')}"
+        directory = directory if directory is not None else os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+        self.directory = Path(directory) if directory else None
+        self.memory_limit = int((memory_mb if memory_mb is not None
+                                 else float(os.getenv("EMBEDDING_CACHE_MEMORY_MB", 256))) * 1024 * 1024)
+        self.disk_entries = disk_entries or int(os.getenv("EMBEDDING_CACHE_DISK_ENTRIES", 1000000))
+        self.memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.memory_bytes = 0
+        self.disk: Optional[DiskVectorStore] = None
+        self._disk_failed = False
+        # 维度未知时已检查过meta.json，没有可用的磁盘层
+        self._disk_probed = False
+        self._lock_fd: Optional[int] = None
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha1(f"{self.fingerprint}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+    def _open_disk(self, dimensions: Optional[int] = None) -> Optional[DiskVectorStore]:
+        """打开磁盘层，维度未知时从已有的meta.json读取"""
+        if self.disk is not None or self._disk_failed or self.directory is None:
+            return self.disk
+        if dimensions is None:
+            if self._disk_probed:
+                return None
+            self._disk_probed = True
+            meta_path = self.directory / "meta.json"
+            if not meta_path.exists():
+                return None
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if meta.get("fingerprint") != self.fingerprint:
+                return None
+            dimensions = meta["dimensions"]
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if self._lock_fd is None:
+                self._lock_fd = os.open(str(self.directory / "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.disk = DiskVectorStore(self.directory, self.fingerprint, dimensions, self.disk_entries)
+            logger.info(f"Embedding磁盘缓存已打开: {self.directory}, 条目数: {len(self.disk)}")
+        except OSError as e:
+            logger.warning(f"Embedding磁盘缓存不可用，只使用内存缓存: {str(e)}")
+            self._disk_failed = True
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+        return self.disk
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        """放入内存层并按容量淘汰最久未使用的条目"""
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return
+        self.memory[key] = vector
+        self.memory_bytes += vector.nbytes + _ENTRY_OVERHEAD
+        while self.memory_bytes > self.memory_limit and self.memory:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted.nbytes + _ENTRY_OVERHEAD
+
+    def open(self) -> None:
+        """打开已有的磁盘层（启动时在线程中调用，加载键索引不占用请求路径）"""
+        with self._lock:
+            self._open_disk()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """查找一组文本的缓存向量，未命中的位置为None"""
+        with self._lock:
+            return self._get_many(texts)
+
+    def _get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        results: List[Optional[np.ndarray]] = []
+        disk = self._open_disk()
+        for text in texts:
+            key = self.key(text)
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory.move_to_end(key)
+                self.metrics["memory_hits"] += 1
+            elif disk is not None and (vector := disk.get(key)) is not None:
+                self._remember(key, vector)
+                self.metrics["disk_hits"] += 1
+            else:
+                self.metrics["misses"] += 1
+            results.append(vector)
+        return results
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        """写入一组新计算的向量"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        with self._lock:
+            self._put_many(texts, vectors)
+
+    def _put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        disk = self._open_disk(vectors.shape[1])
+        for text, vector in zip(texts, vectors):
+            key = self.key(text)
+            vector = np.array(vector)
+            self._remember(key, vector)
+            if disk is not None:
+                disk.put(key, vector)
+
+    def invalidate(self) -> None:
+        """清空内存层和磁盘层"""
+        with self._lock:
+            self._invalidate()
+
+    def _invalidate(self) -> None:
+        self.memory.clear()
+        self.memory_bytes = 0
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+            for name in ("vectors.f32", "keys.bin", "meta.json"):
+                (self.directory / name).unlink(missing_ok=True)
+        self._disk_probed = False
+        logger.info("Embedding缓存已清空")
+
+    def set_model(self, model_name: str) -> None:
+        """更换模型指纹：清空内存层并关闭磁盘层，磁盘层下次打开时因指纹不同被清空重建"""
+        with self._lock:
+            self.fingerprint = f"{model_name}@{os.getenv('EMBEDDING_CACHE_VERSION', '1')}"
+            self.memory.clear()
+            self.memory_bytes = 0
+            if self.disk is not None:
+                self.disk.close()
+                self.disk = None
+            self._disk_probed = False
+        logger.info(f"Embedding缓存模型指纹已更换: {self.fingerprint}")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        with self._lock:
+            total = sum(self.metrics.values())
+            hits = self.metrics["memory_hits"] + self.metrics["disk_hits"]
+            return {
+                **self.metrics,
+                "hit_rate": hits / total if total else 0.0,
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "disk_entries": len(self.disk) if self.disk is not None else 0
+            }
+
+    def close(self) -> None:
+        """把磁盘层写回文件并释放文件锁"""
+        with self._lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
@@ -0,0 +1,241 @@
+import argparse
+import inspect
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+from dotenv import load_dotenv
+from app.utils.logger import logger
+
+load_dotenv()
+
+# 导出时用于精度校验的示例文本
+SAMPLE_TEXTS = [
+    "你好，世界",
+    "张三的手机号是13800138000，住在北京市海淀区中关村大街1号",
+    "The quick brown fox jumps over the lazy dog.",
+    "数据脱敏是指对敏感信息通过脱敏规则进行数据的变形，实现敏感隐私数据的可靠保护。",
+    "向量检索",
+    "合同约定乙方应于2024年12月31日前交付全部货物，逾期每日按合同总额的千分之三支付违约金。"
+]
+
+
+def cosine_similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """按行计算两组向量的余弦相似度"""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12)
+
+
+def export_onnx(model_name: str, model_dir: Path) -> Path:
+    """把SentenceTransformer模型（含池化、Dense和归一化层）导出为ONNX，同时保存分词器
+
+    Returns:
+        Path: 导出的模型文件路径
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    logger.info(f"Embedding模型导出ONNX开始, 模型: {model_name}")
+    model = SentenceTransformer(model_name, device="cpu")
+    model.eval()
+    tokenizer = model.tokenizer
+    dummy = tokenizer(SAMPLE_TEXTS[:2], padding=True, truncation=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+
+    class SentenceEmbedding(torch.nn.Module):
+        """把按位置传入的张量组装为SentenceTransformer需要的特征字典"""
+
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(dict(zip(input_names, inputs)))["sentence_embedding"]
+
+    model_dir.mkdir(parents=True, exist_ok=True)
+    model_path = model_dir / "model.onnx"
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["sentence_embedding"] = {0: "batch"}
+    # 新版torch默认使用dynamo导出（依赖onnxscript），这里固定使用TorchScript导出
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            SentenceEmbedding(),
+            tuple(dummy[name] for name in input_names),
+            str(model_path),
+            input_names=input_names,
+            output_names=["sentence_embedding"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **extra
+        )
+    tokenizer.save_pretrained(str(model_dir))
+    meta = {
+        "model": model_name,
+        "max_seq_length": model.get_max_seq_length(),
+        "do_lower_case": bool(getattr(model[0], "do_lower_case", False)),
+        "dimensions": model.get_sentence_embedding_dimension()
+    }
+    (model_dir / "export.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    logger.info(f"Embedding模型导出ONNX完成: {model_path}")
+    return model_path
+
+
+def quantize_onnx(model_dir: Path) -> Path:
+    """对导出的模型做int8动态量化（权重int8，激活值运行时量化）"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = model_dir / "model.onnx"
+    target = model_dir / "model.int8.onnx"
+    quantize_dynamic(str(source), str(target), weight_type=QuantType.QInt8)
+    logger.info(f"Embedding模型int8量化完成: {target}")
+    return target
+
+
+def create_session(model_path: Path) -> ort.InferenceSession:
+    """创建推理会话
+
+    开启全部图优化，算子内并行线程数由EMBEDDING_ONNX_THREADS指定。为0时按推理执行器的并发数
+    （EMBEDDING_EXECUTOR_WORKERS，线程池共享一个会话、进程池每个子进程一个会话）平分CPU核数，
+    避免多个会话同时推理时线程数超过核数。请求之间由推理执行器并发，算子间不再并行。
+    """
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    workers = max(1, int(os.getenv("EMBEDDING_EXECUTOR_WORKERS", 1)))
+    options.intra_op_num_threads = int(os.getenv("EMBEDDING_ONNX_THREADS", 0)) or max(1, (os.cpu_count() or 1) // workers)
+    options.inter_op_num_threads = 1
+    providers = [provider.strip() for provider in
+                 os.getenv("EMBEDDING_ONNX_PROVIDERS", "CPUExecutionProvider").split(",") if provider.strip()]
+    return ort.InferenceSession(str(model_path), sess_options=options, providers=providers)
+
+
+class OnnxEmbeddingModel:
+    """基于onnxruntime的Embedding模型，encode接口与SentenceTransformer一致
+
+    模型目录（EMBEDDING_ONNX_DIR）中没有导出的模型时先从原模型导出；开启EMBEDDING_ONNX_QUANTIZE时使用int8动态量化模型。
+    导出或量化后与torch输出比较示例文本的余弦相似度，低于EMBEDDING_ONNX_MIN_COSINE时不使用该模型：
+    int8模型改用float32模型，float32模型直接报错。
+    """
+
+    def __init__(self, model_name: str, model_dir: Optional[str] = None, quantize: Optional[bool] = None):
+        self.model_name = model_name
+        self.model_dir = Path(model_dir or os.getenv("EMBEDDING_ONNX_DIR", "models/embedding_onnx"))
+        if quantize is None:
+            quantize = os.getenv("EMBEDDING_ONNX_QUANTIZE", "false").lower() == "true"
+        self.min_cosine = float(os.getenv("EMBEDDING_ONNX_MIN_COSINE", 0.99))
+
+        model_path = self.model_dir / "model.onnx"
+        exported = not model_path.exists()
+        if exported:
+            export_onnx(model_name, self.model_dir)
+        meta = json.loads((self.model_dir / "export.json").read_text(encoding="utf-8"))
+        if meta["model"] != model_name:
+            raise ValueError(f"{self.model_dir} 中的ONNX模型由 {meta['model']} 导出，与 {model_name} 不一致")
+        self.max_seq_length = meta["max_seq_length"]
+        self.do_lower_case = meta.get("do_lower_case", False)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.model_dir))
+
+        self.quantized = False
+        if exported:
+            try:
+                self._check(create_session(model_path))
+            except ValueError:
+                model_path.unlink()
+                raise
+        if quantize:
+            int8_path = self.model_dir / "model.int8.onnx"
+            created = not int8_path.exists()
+            if created:
+                quantize_onnx(self.model_dir)
+            try:
+                if created:
+                    self._check(create_session(int8_path))
+                model_path, self.quantized = int8_path, True
+            except ValueError as e:
+                logger.error(f"{str(e)}，改用float32模型")
+                int8_path.unlink(missing_ok=True)
+        self.session = create_session(model_path)
+        logger.info(f"Embedding ONNX模型加载完成: {model_path}")
+
+    @property
+    def variant(self) -> str:
+        return "onnx-int8" if self.quantized else "onnx"
+
+    def _check(self, session: ort.InferenceSession) -> None:
+        """与torch输出比较示例文本的余弦相似度
+
+        Raises:
+            ValueError: 最小余弦相似度低于阈值
+        """
+        from sentence_transformers import SentenceTransformer
+
+        expected = SentenceTransformer(self.model_name, device="cpu").encode(SAMPLE_TEXTS)
+        actual = self._run(session, SAMPLE_TEXTS)
+        cosine = float(cosine_similarity(expected, actual).min())
+        logger.info(f"ONNX模型精度校验: 最小余弦相似度 {cosine:.6f}, 阈值 {self.min_cosine}")
+        if cosine < self.min_cosine:
+            raise ValueError(f"ONNX模型精度校验未通过: 最小余弦相似度 {cosine:.6f} 低于 {self.min_cosine}")
+
+    def tokenize(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """分词并填充为一个批次，与SentenceTransformer的tokenize一样先去除首尾空白，按模型配置小写化"""
+        texts = [text.strip().lower() if self.do_lower_case else text.strip() for text in texts]
+        return self.tokenizer(texts, padding=True, truncation=True,
+                              max_length=self.max_seq_length, return_tensors="np")
+
+    def _run(self, session: ort.InferenceSession, texts: List[str]) -> np.ndarray:
+        return self._forward(session, self.tokenize(texts))
+
+    @staticmethod
+    def _forward(session: ort.InferenceSession, features: Dict[str, np.ndarray]) -> np.ndarray:
+        names = {i.name for i in session.get_inputs()}
+        inputs: Dict[str, np.ndarray] = {name: np.asarray(features[name], dtype=np.int64) for name in names}
+        return session.run(["sentence_embedding"], inputs)[0]
+
+    def forward(self, features: Dict[str, np.ndarray]) -> np.ndarray:
+        """对已分词并填充的一个批次做前向计算，返回float32向量矩阵"""
+        return self._forward(self.session, features).astype(np.float32, copy=False)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """计算一组文本的embedding向量，返回 (文本数, 维度) 的float32数组"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        batches = [self._run(self.session, texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        return np.concatenate(batches).astype(np.float32, copy=False)
+
+
+def benchmark(model_name: str, texts: List[str], rounds: int, batch_size: int) -> None:
+    """比较torch、ONNX float32和ONNX int8三种后端的延迟和与torch输出的余弦相似度"""
+    from sentence_transformers import SentenceTransformer
+
+    backends = {
+        "torch": SentenceTransformer(model_name, device="cpu"),
+        "onnx": OnnxEmbeddingModel(model_name, quantize=False),
+        "onnx-int8": OnnxEmbeddingModel(model_name, quantize=True)
+    }
+    expected = backends["torch"].encode(texts, batch_size=batch_size)
+    for name, backend in backends.items():
+        backend.encode(texts[:batch_size], batch_size=batch_size)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            vectors = backend.encode(texts, batch_size=batch_size)
+        elapsed = (time.perf_counter() - start) / rounds
+        cosine = cosine_similarity(expected, vectors)
+        logger.info(f"{name:10s} 每轮 {elapsed * 1000:8.1f} ms, 每条 {elapsed * 1000 / len(texts):6.2f} ms, "
+                    f"余弦相似度 最小 {cosine.min():.6f} 平均 {cosine.mean():.6f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding模型ONNX后端延迟和精度对比")
+    parser.add_argument("--model", default="TencentBAC/Conan-embedding-v1")
+    parser.add_argument("--texts", type=int, default=256, help="测试文本数")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+    texts = [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] * (1 + i % 4) for i in range(args.texts)]
+    benchmark(args.model, texts, args.rounds, args.batch_size)
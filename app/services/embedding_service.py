@@ -1,30 +1,216 @@
-from typing import List
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
 import torch
+import threading
 import time
 from app.utils.logger import logger
+from app.utils.inference_executor import InferenceExecutor
+from app.services.embedding_cache import EmbeddingCache
+from app.utils.token_batching import TokenBatcher
+from app.utils.model_registry import model_registry
+from app.utils.vector_codec import truncate_dimensions
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class EmbeddingService:
+    model_name = "TencentBAC/Conan-embedding-v1"
+
     def __init__(self, embedding_model=None):
+        # 推理后端：torch（SentenceTransformer）或 onnx（onnxruntime，可选int8量化）
+        self.backend = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+        if self.backend not in ("torch", "onnx"):
+            raise ValueError(f"不支持的Embedding推理后端: {self.backend}")
+        if self.backend == "onnx" and os.getenv("EMBEDDING_ONNX_QUANTIZE", "false").lower() == "true":
+            self.backend = "onnx-int8"
+        self._backend_lock = threading.Lock()
+        # 模型由全局注册表在第一次推理时加载，进程内共享
+        model_registry.register("embedding", self._load_model)
+        # 模型推理在独立的执行器中进行，避免阻塞事件循环
+        self.executor = InferenceExecutor("embedding", factory=EmbeddingService)
+        # 按token长度分批，每批填充后的token总数不超过EMBEDDING_MAX_BATCH_TOKENS
+        self.batcher = TokenBatcher("embedding")
+        # 两级向量缓存（内存LRU + 磁盘mmap），EMBEDDING_CACHE_ENABLED=false 关闭
+        # 不同后端（尤其是int8量化）的向量略有差异，缓存键区分后端
+        self.cache = EmbeddingCache(f"{self.model_name}:{self.backend}") \
+            if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true" else None
+        # 长文本分块：相邻窗口重叠的token数，以及单个文本最多的分块数
+        self.chunk_overlap = int(os.getenv("EMBEDDING_CHUNK_OVERLAP", 64))
+        self.max_chunks = int(os.getenv("EMBEDDING_LONG_TEXT_MAX_CHUNKS", 256))
+
+    def _load_model(self) -> Any:
+        """加载Embedding模型（由模型注册表调用）"""
         try:
-            logger.info(f"Embedding模型加载开始, 模型: TencentBAC/Conan-embedding-v1")
-            # 加载分词器和模型
-            self.model = SentenceTransformer("TencentBAC/Conan-embedding-v1")
-            # 将模型设置为评估模式
-            self.model.eval()
-            logger.info(f"Embedding模型加载完成, 模型: TencentBAC/Conan-embedding-v1")
+            logger.info(f"Embedding模型加载开始, 模型: {self.model_name}, 后端: {self.backend}")
+            if self.backend == "torch":
+                # 加载分词器和模型
+                model = SentenceTransformer(self.model_name)
+                # 将模型设置为评估模式
+                model.eval()
+            else:
+                from app.services.embedding_onnx import OnnxEmbeddingModel
+                model = OnnxEmbeddingModel(self.model_name, quantize=self.backend == "onnx-int8")
+                # int8模型未通过精度校验时改用float32模型。进程池模式下这里更新的是子进程的实例，
+                # 父进程根据encode_variant返回的后端更新自己的缓存指纹
+                self._set_backend(model.variant)
+            logger.info(f"Embedding模型加载完成, 模型: {self.model_name}, 后端: {self.backend}")
+            return model
         except Exception as e:
             logger.error(f"Embedding模型加载失败: {str(e)}")
             raise Exception(f"Embedding模型加载失败: {str(e)}")
 
-    async def generate_embedding(self, text: str) -> List[float]:
-        """生成文本的embedding向量"""
+    def _set_backend(self, backend: str) -> None:
+        """更换推理后端并同步更换缓存指纹
+
+        缓存对象不替换，只在缓存锁内更换指纹，其他线程不会读到关闭的缓存。
+        """
+        with self._backend_lock:
+            if backend == self.backend:
+                return
+            logger.warning(f"Embedding后端由 {self.backend} 改为 {backend}")
+            self.backend = backend
+            if self.cache is not None:
+                self.cache.set_model(f"{self.model_name}:{self.backend}")
+
+    def encode_variant(self, texts: List[str], batch_size: int = 32) -> Tuple[np.ndarray, str]:
+        """计算embedding向量，同时返回实际使用的推理后端（在执行器中调用）"""
+        return self.encode(texts, batch_size), self.backend
+
+    async def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """在执行器中计算embedding向量，执行器中的后端与当前实例不同时（进程池模式下的int8回退）同步到当前实例"""
+        vectors, backend = await self.executor.call(self, "encode_variant", texts, batch_size)
+        if backend != self.backend:
+            await asyncio.to_thread(self._set_backend, backend)
+        return vectors
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """同步计算一组文本的embedding向量（在执行器中调用）
+
+        先用分词器估计每个文本的token数并按长度分批，每批再经模型自身的preprocess/tokenize
+        （去除首尾空白、小写化等预处理与 SentenceTransformer.encode 一致）分词后前向计算，
+        模型配置了默认提示词时在文本前加上提示词。结果按原始顺序返回。
+
+        Args:
+            texts: 文本列表
+            batch_size: 模型每次前向计算的最多文本数
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        with model_registry.use("embedding") as model:
+            prompt = self._default_prompt(model)
+            prefix = prompt or ""
+            lengths = [len(ids) for ids in model.tokenizer([prefix + text for text in texts], truncation=True,
+                                                            max_length=model.max_seq_length)["input_ids"]]
+            vectors = self.batcher.run(lengths, lambda batch: self._forward(model, [texts[i] for i in batch], prompt),
+                                       batch_size)
+        return np.stack(vectors)
+
+    @staticmethod
+    def _default_prompt(model: Any) -> Optional[str]:
+        """模型配置的默认提示词（SentenceTransformer的default_prompt_name），没有时返回None"""
+        name = getattr(model, "default_prompt_name", None)
+        return (getattr(model, "prompts", None) or {}).get(name) if name else None
+
+    def _forward(self, model: Any, texts: List[str], prompt: Optional[str] = None) -> np.ndarray:
+        """对一个批次的文本分词、填充后做前向计算"""
+        if self.backend != "torch":
+            return model.forward(model.tokenize([(prompt or "") + text for text in texts]))
+        if hasattr(model, "preprocess"):
+            # sentence-transformers 5.x 由preprocess加入提示词
+            features = model.preprocess(texts, prompt=prompt)
+        else:
+            features = model.tokenize([(prompt or "") + text for text in texts])
+            if prompt:
+                # 池化层不计入提示词时需要提示词的token数，与SentenceTransformer.encode一致
+                prompt_ids = model.tokenize([prompt]).get("input_ids")
+                if prompt_ids is not None:
+                    features["prompt_length"] = prompt_ids.shape[-1] - 1
+        features = {key: value.to(model.device) if hasattr(value, "to") else value for key, value in features.items()}
+        with torch.no_grad():
+            return model(features)["sentence_embedding"].float().cpu().numpy()
+
+    def split_text(self, text: str, overlap: int) -> List[Tuple[int, int, int]]:
+        """按模型最大序列长度把文本切分为相互重叠的token窗口（在执行器中调用）
+
+        整个文本只分词一次，通过字符偏移把每个窗口映射回原文。
+
+        Args:
+            text: 文本
+            overlap: 相邻窗口重叠的token数，最多为窗口长度的一半
+
+        Returns:
+            List[Tuple[int, int, int]]: 每个窗口在原文中的起止字符位置和token数
+        """
+        with model_registry.use("embedding") as model:
+            tokenizer = model.tokenizer
+            window = model.max_seq_length - tokenizer.num_special_tokens_to_add()
+        overlap = max(0, min(overlap, window // 2))
+        offsets = tokenizer(text, add_special_tokens=False, truncation=False,
+                            return_offsets_mapping=True)["offset_mapping"]
+        if len(offsets) <= window:
+            return [(0, len(text), len(offsets))]
+        spans = []
+        for start in range(0, len(offsets), window - overlap):
+            end = min(start + window, len(offsets))
+            spans.append((offsets[start][0], offsets[end - 1][1], end - start))
+            if end == len(offsets):
+                break
+        return spans
+
+    async def generate_long_embedding(self, text: str, overlap: Optional[int] = None,
+                                      pooling: str = "mean") -> Tuple[np.ndarray, List[Tuple[int, int, int]], np.ndarray]:
+        """长文本Embedding：切分为重叠的token窗口，所有窗口一次批量编码后池化为一个向量
+
+        Args:
+            text: 文本
+            overlap: 相邻窗口重叠的token数，为None时使用EMBEDDING_CHUNK_OVERLAP
+            pooling: mean（各窗口平均）或 weighted（按窗口token数加权）
+
+        Returns:
+            Tuple: 归一化后的池化向量、每个窗口的 (起始字符, 结束字符, token数)、各窗口向量组成的矩阵
+
+        Raises:
+            ValueError: 分块数超过EMBEDDING_LONG_TEXT_MAX_CHUNKS
+        """
+        overlap = self.chunk_overlap if overlap is None else overlap
+        spans = await self.executor.call(self, "split_text", text, overlap)
+        if len(spans) > self.max_chunks:
+            raise ValueError(f"文本切分为 {len(spans)} 块，超过上限 {self.max_chunks}")
+        logger.info(f"长文本Embedding: 文本长度 {len(text)}, 分块数 {len(spans)}")
+        matrix = await self.generate_embeddings_array([text[start:end] for start, end, _ in spans])
+        weights = np.array([tokens for _, _, tokens in spans], dtype=np.float32) if pooling == "weighted" else None
+        pooled = np.average(matrix, axis=0, weights=weights if weights is not None and weights.sum() else None)
+        norm = np.linalg.norm(pooled)
+        return (pooled / norm if norm else pooled).astype(np.float32), spans, matrix
+
+    async def generate_embedding(self, text: str, dimensions: Optional[int] = None) -> List[float]:
+        """生成文本的embedding向量，dimensions指定时截取前dimensions维并重新归一化"""
         logger.info(f"Embedding文本: {len(text)}")
-        embeddings = self.model.encode([text])
-        return embeddings.tolist()[0]
\ No newline at end of file
+        embeddings = await self.generate_embeddings([text], dimensions)
+        return embeddings[0]
+
+    async def generate_embeddings_array(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """批量生成文本的embedding向量，返回 (文本数, 维度) 的数组，不转换为Python列表
+
+        开启缓存时只对未命中缓存的文本（批内相同文本只算一次）调用模型，结果写回缓存。
+        缓存读写持有线程锁并可能访问磁盘，在线程中进行。
+        """
+        if self.cache is None or not texts:
+            return await self._encode(texts, batch_size)
+        vectors = await asyncio.to_thread(self.cache.get_many, texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            computed = np.asarray(await self._encode(missing, batch_size), dtype=np.float32)
+            await asyncio.to_thread(self.cache.put_many, missing, computed)
+            rows = dict(zip(missing, computed))
+            vectors = [rows[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return np.stack(vectors)
+
+    async def generate_embeddings(self, texts: List[str], dimensions: Optional[int] = None) -> List[List[float]]:
+        """批量生成文本的embedding向量，一次encode处理整批文本"""
+        embeddings = await self.generate_embeddings_array(texts)
+        return truncate_dimensions(embeddings, dimensions).tolist()
\ No newline at end of file
@@ -1,5 +1,6 @@
 import re
 import os
+import threading
 
 from typing import  List, Dict
 from paddlenlp import Taskflow
@@ -14,6 +15,8 @@ class InfoExtractor:
         self.CONVERT_MAP = CONVERT_MAP
         logger.info(f"信息抽取模型加载, 模型路径: uie-medium")
         self.information_extract = Taskflow('information_extraction', schema=["临时schema"], model='uie-medium', padding='max_length')
+        # Taskflow的schema是实例状态，多线程调用时需要串行化set_schema和推理
+        self.schema_lock = threading.Lock()
         logger.info(f"信息抽取模型加载完成, 模型路径: uie-medium")
     def extract_by_pattern(self, text, pattern):
         """统一的正则表达式提取方法"""
@@ -107,8 +110,9 @@ class InfoExtractor:
     
     def extract_by_other_type(self, text, info_types)-> (List[List[str]], Dict):
         schema_set = set(info_types)
-        self.information_extract.set_schema(schema_set)
-        result = self.information_extract(text)
+        with self.schema_lock:
+            self.information_extract.set_schema(schema_set)
+            result = self.information_extract(text)
         results = []
         for info_type in info_types:
             type_results = []
@@ -9,6 +9,8 @@ import datasets
 from .info_extract.info_extractor import InfoExtractor
 
 from app.utils.logger import logger
+from app.utils.inference_executor import InferenceExecutor
+from app.utils.model_registry import model_registry
 from .faker.faker import Faker
 
 
@@ -17,17 +19,23 @@ default_schema = ['身份证号','姓名','出生日期','民族/种族','社交
 
 class MaskService:
     def __init__(self, embedding_model=None):
-        self.information_extract = InfoExtractor()  
+        # 信息抽取模型（UIE）和相似文本生成模型（bge-small-zh）由全局注册表在第一次使用时加载，进程内共享
+        model_registry.register("mask_extractor", InfoExtractor)
+        model_registry.register("mask_faker", Faker)
         logger.info("MaskService initialized, embedding model: {}".format(embedding_model))  
-        self.faker_generate = Faker()
+        # 模型推理在独立的执行器中进行，避免阻塞事件循环
+        self.executor = InferenceExecutor("mask", factory=MaskService)
+
     def extract_keywords(self, schema: List[str], text: str) -> (Dict[str, List[str]], Dict[str, List[str]]):
-        keys_dict, keys_map = self.information_extract.extract_by_type(text, schema)
+        with model_registry.use("mask_extractor") as information_extract:
+            keys_dict, keys_map = information_extract.extract_by_type(text, schema)
         # 使用列表推导式将所有值合并成一个列表
         return keys_dict, keys_map
 
     def _generate_similar_text(self, data_type: str, texts: List[str]) -> List[str]:
         """生成相似文本"""
-        faker_data = self.faker_generate.generate(data_type, len(texts)) 
+        with model_registry.use("mask_faker") as faker_generate:
+            faker_data = faker_generate.generate(data_type, len(texts))
         return faker_data
 
     def _type_replacement(self, type: str, texts: List[str]) -> List[str]:
@@ -61,6 +69,10 @@ class MaskService:
 
     async def mask_text(self, text: str, mask_type: str = "similar", mask_model: str = "paddle", mask_field: List[str] = None, force_convert: List[List[str]] = None) -> (str, Dict[str, str], Dict[str, List[str]]):
         """对文本进行脱敏处理"""
+        return await self.executor.call(self, "apply_mask", text, mask_type, mask_model, mask_field, force_convert)
+
+    def apply_mask(self, text: str, mask_type: str = "similar", mask_model: str = "paddle", mask_field: List[str] = None, force_convert: List[List[str]] = None) -> (str, Dict[str, str], Dict[str, List[str]]):
+        """同步执行脱敏处理（在执行器中调用）"""
         # 首先处理强制转换
         masked_text = text
         mapping = {}
@@ -4,6 +4,7 @@ import numpy as np
 import requests
 from pdf2image import convert_from_bytes
 from app.utils.logger import logger
+from app.utils.inference_executor import InferenceExecutor
 from app.services.ocr.ocr_core import OCRQAnything
 
 class OCRService:
@@ -14,6 +15,8 @@ class OCRService:
         except Exception as e:
             logger.error(f"OCR模型加载失败: {str(e)}")
             raise Exception(f"OCR模型加载失败: {str(e)}")
+        # 下载、解析和模型推理在独立的执行器中进行，避免阻塞事件循环
+        self.executor = InferenceExecutor("ocr", factory=OCRService)
 
     async def extract_pdf_text(self, pdf_url: str, page_num: int = -1) -> list:
         """从PDF文件中提取文本
@@ -25,6 +28,10 @@ class OCRService:
         Returns:
             list: 提取的文本列表，每个元素对应一个页面的文本
         """
+        return await self.executor.call(self, "pdf_to_text", pdf_url, page_num)
+
+    def pdf_to_text(self, pdf_url: str, page_num: int = -1) -> list:
+        """同步从PDF文件中提取文本（在执行器中调用）"""
         try:
             response = requests.get(pdf_url)
             if response.status_code != 200:
@@ -71,6 +78,10 @@ class OCRService:
         Raises:
             ValueError: 当图片数据无效或无法解析时
         """
+        return await self.executor.call(self, "image_to_text", image_data)
+
+    def image_to_text(self, image_data: bytes) -> str:
+        """同步从图片数据中提取文本（在执行器中调用）"""
         try:
             if not image_data:
                 raise ValueError("空的图片数据")
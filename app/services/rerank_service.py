@@ -4,21 +4,31 @@ import torch
 from transformers import AutoModelForSequenceClassification, AutoTokenizer,AutoModel
 import os
 from app.utils.logger import logger
+from app.utils.inference_executor import InferenceExecutor
+from app.utils.token_batching import TokenBatcher
+from app.utils.model_registry import model_registry
 from sentence_transformers import SentenceTransformer
 
 class RerankService:
+    model_name = "Alibaba-NLP/gte-multilingual-reranker-base"
+
     def __init__(self):
-        logger.info(f"Rerank模型加载, 模型: Alibaba-NLP/gte-multilingual-reranker-base")
-        # Load model directly
-        # model = AutoModelForSequenceClassification.from_pretrained("Alibaba-NLP/gte-multilingual-reranker-base", trust_remote_code=True)
-        # model = SentenceTransformer("Alibaba-NLP/gte-multilingual-reranker-base", trust_remote_code=True)
-        # self.tokenizer = model.tokenizer
-        self.tokenizer = AutoTokenizer.from_pretrained("Alibaba-NLP/gte-multilingual-reranker-base", trust_remote_code=True)
-        model = AutoModelForSequenceClassification.from_pretrained("Alibaba-NLP/gte-multilingual-reranker-base", trust_remote_code=True)
+        # 模型由全局注册表在第一次推理时加载，进程内共享
+        model_registry.register("rerank", self._load_model)
+        # 模型推理在独立的执行器中进行，避免阻塞事件循环
+        self.executor = InferenceExecutor("rerank", factory=RerankService)
+        # 按token长度分批，每批填充后的token总数不超过RERANK_MAX_BATCH_TOKENS
+        self.batcher = TokenBatcher("rerank")
+
+    def _load_model(self) -> Tuple[Any, Any]:
+        """加载Rerank分词器和模型（由模型注册表调用）"""
+        logger.info(f"Rerank模型加载, 模型: {self.model_name}")
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name, trust_remote_code=True)
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_name, trust_remote_code=True)
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = model.to(device)
-        # 初始化 tokenizer
-        logger.info(f"Rerank模型加载完成, 模型: Alibaba-NLP/gte-multilingual-reranker-base")
+        model = model.to(device)
+        logger.info(f"Rerank模型加载完成, 模型: {self.model_name}")
+        return tokenizer, model
 
     async def rerank_texts(self, query: str, texts: List[str], top_k: int) -> List[Tuple[str, float]]:
         """对文本进行重排序
@@ -31,43 +41,51 @@ class RerankService:
         Returns:
             Tuple[List[str], List[float]]: 排序后的文本列表和对应的相似度得分
         """
-        device = self.model.device
         logger.info(f"正在对查询文本进行重排序: {query[:10]}, 候选文本数量: {len(texts)}")
+        scores = await self.executor.call(self, "compute_scores", query, texts)
+
+        text_score_pairs = list(zip(texts, scores))
+        sorted_pairs = sorted(text_score_pairs, key=lambda x: x[1], reverse=True)
+
+        return sorted_pairs[:top_k]
+
+    def compute_scores(self, query: str, texts: List[str]) -> List[float]:
+        """同步计算查询文本与每个候选文本的相关性得分（在执行器中调用）"""
+        with model_registry.use("rerank") as (tokenizer, model):
+            return self._compute_scores(tokenizer, model, query, texts)
+
+    def _compute_scores(self, tokenizer: Any, model: Any, query: str, texts: List[str]) -> List[float]:
+        device = model.device
         logger.info(f"使用设备: {device}")
-        pairs = [(query, text) for text in texts]
-        scores = []
+        if not texts:
+            return []
 
         # 根据设备动态调整批处理大小
         batch_size = 32 if device.type == "cuda" else 8
 
-        try:
-            for i in range(0, len(pairs), batch_size):
-                batch_pairs = pairs[i:i+batch_size]
-                features = self.tokenizer(
-                    batch_pairs,
-                    padding=True,
-                    truncation=True,
-                    return_tensors="pt",
-                    max_length=512
-                )
-                features = {k: v.to(device) for k, v in features.items()}
+        # 所有查询-文本对只分词一次，按token长度分批，得分按原始顺序返回
+        encoded = tokenizer([query] * len(texts), texts, truncation=True, max_length=512)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
 
-                with torch.no_grad():
-                    outputs = self.model(**features)
-                    batch_scores = torch.sigmoid(outputs.logits).squeeze(-1).cpu().tolist()
-                    scores.extend(batch_scores)
+        def forward(batch: List[int]) -> List[float]:
+            subset = {key: [values[i] for i in batch] for key, values in encoded.items()}
+            features = tokenizer.pad(subset, return_tensors="pt")
+            features = {k: v.to(device) for k, v in features.items()}
+            with torch.no_grad():
+                outputs = model(**features)
+                return torch.sigmoid(outputs.logits).view(-1).cpu().tolist()
+
+        try:
+            scores = self.batcher.run(lengths, forward, batch_size)
 
         except RuntimeError as e:
             if "CUDA out of memory" in str(e):
                 logger.info(f"GPU内存不足, 正在尝试减小批处理大小")
                 if device.type == "cuda":
                     logger.info(f"正在将模型转移到CPU并重试...")
-                    model = self.model.cpu()
-                    device = torch.device("cpu")
-                    return rerank_texts(query, texts, top_k)
+                    # 就地转移，注册表中的共享模型随之转移
+                    model.cpu()
+                    return self._compute_scores(tokenizer, model, query, texts)
             raise e
 
-        text_score_pairs = list(zip(texts, scores))
-        sorted_pairs = sorted(text_score_pairs, key=lambda x: x[1], reverse=True)
-
-        return sorted_pairs[:top_k]
+        return scores
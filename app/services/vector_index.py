@@ -0,0 +1,519 @@
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from app.utils.logger import logger
+
+load_dotenv()
+
+METRICS = ("cosine", "ip", "l2")
+SEARCH_MODES = ("auto", "exact", "ivf")
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# 精确检索时每次参与矩阵乘法的行数，限制中间结果的内存占用
+_BLOCK_ROWS = 65536
+
+
+class VectorCollection:
+    """向量集合
+
+    目录结构：
+
+        meta.json    维度和距离度量
+        vectors.f32  (容量, 维度) 的float32矩阵，通过np.memmap读写，容量不足时按倍数扩容
+        ids.log      ID与行号的追加日志，每行一个JSON，启动时重放，过长时压缩
+
+    有效向量始终连续存放在前count行：删除时把最后一行移到被删除的位置。
+    cosine度量在写入时归一化，检索时用内积；l2度量的得分为负的平方欧氏距离（越大越相似）。
+
+    检索分两种：精确检索对所有向量分块做矩阵乘法；IVF检索先用k-means把向量分到若干倒排列表，
+    只在与查询最接近的nprobe个列表中精确计算。mode为auto时向量数达到VECTOR_INDEX_IVF_THRESHOLD才使用IVF。
+    IVF的聚类中心不持久化：写入后向量数达到阈值、或比上次训练时增长一倍时在后台线程中训练，
+    训练完成前auto检索使用精确检索（或上一次的聚类中心）。k-means在集合锁之外进行，训练期间写入不被阻塞，
+    训练期间写入或移动的行在安装聚类中心时重新分配列表。
+    """
+
+    def __init__(self, name: str, directory: Path, dimensions: Optional[int] = None, metric: str = "cosine"):
+        self.name = name
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.ivf_threshold = int(os.getenv("VECTOR_INDEX_IVF_THRESHOLD", 50000))
+        self.ivf_lists = int(os.getenv("VECTOR_INDEX_IVF_LISTS", 0))
+        self.default_nprobe = int(os.getenv("VECTOR_INDEX_IVF_NPROBE", 8))
+
+        meta_path = directory / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if dimensions is not None and dimensions != meta["dimensions"]:
+                raise ValueError(f"集合 {name} 的维度为 {meta['dimensions']}，与 {dimensions} 不一致")
+            self.dimensions, self.metric = meta["dimensions"], meta["metric"]
+        else:
+            if not dimensions:
+                raise ValueError(f"集合 {name} 不存在")
+            if metric not in METRICS:
+                raise ValueError(f"不支持的距离度量：{metric}，可选值: {list(METRICS)}")
+            directory.mkdir(parents=True, exist_ok=True)
+            self.dimensions, self.metric = dimensions, metric
+            meta_path.write_text(json.dumps({"name": name, "dimensions": dimensions, "metric": metric}),
+                                 encoding="utf-8")
+
+        # ID -> 行号，行号 -> ID，ID -> 元数据
+        self.rows: Dict[str, int] = {}
+        self.metadata: Dict[str, Any] = {}
+        self.log_lines = 0
+        self._replay()
+        self.count = len(self.rows)
+        self.row_ids: List[Optional[str]] = [None] * self.count
+        for item_id, row in self.rows.items():
+            self.row_ids[row] = item_id
+
+        vectors_path = directory / "vectors.f32"
+        if not vectors_path.exists():
+            with open(vectors_path, "wb") as f:
+                f.truncate(1024 * self.dimensions * 4)
+        self.capacity = os.path.getsize(vectors_path) // (self.dimensions * 4)
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dimensions))
+        self.log = open(directory / "ids.log", "a", encoding="utf-8")
+
+        self.centroids: Optional[np.ndarray] = None
+        self.assign = np.zeros(self.capacity, dtype=np.int32)
+        self.trained_count = 0
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        # 同一时间只有一次训练；训练期间被写入或移动的行
+        self._train_lock = threading.Lock()
+        self._pending_rows: Optional[set] = None
+
+    def _replay(self) -> None:
+        """重放ID日志，恢复ID、行号和元数据"""
+        log_path = self.directory / "ids.log"
+        if not log_path.exists():
+            return
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 写入中途崩溃留下的不完整记录
+                    logger.warning(f"向量集合 {self.name} 的ID日志有不完整记录，已忽略")
+                    continue
+                self.log_lines += 1
+                if record.get("delete"):
+                    self.rows.pop(record["id"], None)
+                    self.metadata.pop(record["id"], None)
+                else:
+                    self.rows[record["id"]] = record["row"]
+                    if "metadata" in record:
+                        self.metadata[record["id"]] = record["metadata"]
+
+    def _write_log(self, records: List[Dict[str, Any]]) -> None:
+        self.log.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        self.log.flush()
+        self.log_lines += len(records)
+        if self.log_lines > 2 * self.count + 10000:
+            self._compact()
+
+    def _compact(self) -> None:
+        """用当前的ID和行号重写日志"""
+        tmp_path = self.directory / "ids.log.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row in range(self.count):
+                item_id = self.row_ids[row]
+                record = {"id": item_id, "row": row}
+                if item_id in self.metadata:
+                    record["metadata"] = self.metadata[item_id]
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.log.close()
+        os.replace(tmp_path, self.directory / "ids.log")
+        self.log = open(self.directory / "ids.log", "a", encoding="utf-8")
+        self.log_lines = self.count
+
+    def _ensure_capacity(self, size: int) -> None:
+        """容量不足时扩大向量文件并重新映射"""
+        if size <= self.capacity:
+            return
+        capacity = max(size, self.capacity * 2)
+        self.vectors.flush()
+        del self.vectors
+        with open(self.directory / "vectors.f32", "r+b") as f:
+            f.truncate(capacity * self.dimensions * 4)
+        self.vectors = np.memmap(self.directory / "vectors.f32", dtype=np.float32, mode="r+",
+                                 shape=(capacity, self.dimensions))
+        self.assign = np.resize(self.assign, capacity)
+        self.capacity = capacity
+
+    def _prepare(self, vectors: Any) -> np.ndarray:
+        try:
+            vectors = np.asarray(vectors, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise ValueError("向量必须是数值列表")
+        if vectors.ndim != 2 or vectors.shape[1] != self.dimensions:
+            raise ValueError(f"向量维度必须为 {self.dimensions}")
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        return vectors
+
+    def add(self, ids: Sequence[str], vectors: Any, metadata: Optional[Sequence[Any]] = None,
+            upsert: bool = True) -> Dict[str, int]:
+        """写入向量
+
+        Args:
+            ids: 向量ID
+            vectors: (数量, 维度) 的向量
+            metadata: 与ID一一对应的元数据，可选
+            upsert: ID已存在时是否覆盖，为False时已存在的ID报错
+
+        Returns:
+            Dict[str, int]: 新增和覆盖的数量
+
+        Raises:
+            ValueError: 维度不一致、ID重复或ID已存在
+        """
+        vectors = self._prepare(vectors)
+        if len(ids) != len(vectors) or (metadata is not None and len(metadata) != len(ids)):
+            raise ValueError("ids、向量和metadata的数量必须一致")
+        if len(set(ids)) != len(ids):
+            raise ValueError("ids中有重复的ID")
+        with self.lock:
+            if not upsert:
+                existing = [item_id for item_id in ids if item_id in self.rows]
+                if existing:
+                    raise ValueError(f"ID已存在: {existing[:10]}")
+            self._ensure_capacity(self.count + len(ids))
+            records, added = [], 0
+            for index, item_id in enumerate(ids):
+                row = self.rows.get(item_id)
+                if row is None:
+                    row = self.count
+                    self.count += 1
+                    self.rows[item_id] = row
+                    self.row_ids.append(item_id)
+                    added += 1
+                self.vectors[row] = vectors[index]
+                record = {"id": item_id, "row": row}
+                if metadata is not None:
+                    self.metadata[item_id] = record["metadata"] = metadata[index]
+                records.append(record)
+            rows = [self.rows[item_id] for item_id in ids]
+            if self.centroids is not None:
+                self.assign[rows] = self._nearest_centroids(vectors)
+            if self._pending_rows is not None:
+                self._pending_rows.update(rows)
+            self._lists = None
+            self._write_log(records)
+            needs_training = self._needs_training()
+        if needs_training:
+            self.train_in_background()
+        return {"added": added, "updated": len(ids) - added}
+
+    def delete(self, ids: Sequence[str]) -> int:
+        """删除向量，返回实际删除的数量"""
+        with self.lock:
+            records = []
+            for item_id in ids:
+                row = self.rows.pop(item_id, None)
+                if row is None:
+                    continue
+                self.metadata.pop(item_id, None)
+                last = self.count - 1
+                if row != last:
+                    # 把最后一行移到被删除的位置，保持有效向量连续
+                    moved = self.row_ids[last]
+                    self.vectors[row] = self.vectors[last]
+                    self.assign[row] = self.assign[last]
+                    if self._pending_rows is not None:
+                        self._pending_rows.add(row)
+                    self.rows[moved] = row
+                    self.row_ids[row] = moved
+                    record = {"id": moved, "row": row}
+                    if moved in self.metadata:
+                        record["metadata"] = self.metadata[moved]
+                    records.append(record)
+                self.row_ids.pop()
+                self.count -= 1
+                records.append({"id": item_id, "delete": True})
+            if records:
+                self._lists = None
+                self._write_log(records)
+            return sum(1 for record in records if record.get("delete"))
+
+    def _scores(self, queries: np.ndarray, block: np.ndarray) -> np.ndarray:
+        """计算查询与一组向量的得分，越大越相似"""
+        dots = queries @ block.T
+        if self.metric != "l2":
+            return dots
+        return 2 * dots - (block * block).sum(axis=1)[None, :] - (queries * queries).sum(axis=1)[:, None]
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, rows: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if scores.shape[0] > top_k:
+            keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            scores, rows = scores[keep], rows[keep]
+        order = np.argsort(-scores, kind="stable")
+        return scores[order], rows[order]
+
+    def _exact(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """精确检索：分块计算所有向量的得分并合并各块的top_k"""
+        best: List[Tuple[np.ndarray, np.ndarray]] = [(np.empty(0, np.float32), np.empty(0, np.int64))] * len(queries)
+        for start in range(0, self.count, _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, self.count)
+            scores = self._scores(queries, np.asarray(self.vectors[start:end]))
+            rows = np.arange(start, end)
+            for i in range(len(queries)):
+                block_scores, block_rows = self._top_k(scores[i], rows, top_k)
+                best[i] = self._top_k(np.concatenate([best[i][0], block_scores]),
+                                      np.concatenate([best[i][1], block_rows]), top_k)
+        return best
+
+    def _nearest_centroids(self, vectors: np.ndarray, centroids: Optional[np.ndarray] = None) -> np.ndarray:
+        centroids = self.centroids if centroids is None else centroids
+        return np.argmax(self._scores(vectors, centroids), axis=1).astype(np.int32)
+
+    def _needs_training(self) -> bool:
+        """向量数达到IVF阈值且尚未训练，或比上次训练时增长了一倍（调用方持有锁）"""
+        return self.count >= self.ivf_threshold and (self.centroids is None or self.count > 2 * self.trained_count)
+
+    def train_in_background(self) -> None:
+        """在后台线程中训练IVF聚类中心，已有训练在进行时不重复启动"""
+        if self._train_lock.locked():
+            return
+        threading.Thread(target=self.train_ivf, args=(False,), name=f"ivf-train-{self.name}", daemon=True).start()
+
+    def train_ivf(self, wait: bool = True) -> bool:
+        """训练IVF聚类中心并为所有向量分配列表
+
+        k-means和列表分配都在集合锁之外计算，只在复制样本、复制向量块和安装结果时短暂持有锁。
+
+        Args:
+            wait: 已有训练在进行时是否等待其完成（不再重复训练）
+
+        Returns:
+            bool: 是否进行了训练
+        """
+        if not self._train_lock.acquire(blocking=wait):
+            return False
+        try:
+            with self.lock:
+                if wait and self.centroids is not None and self.count <= 2 * self.trained_count:
+                    # 等待期间其他训练已经完成
+                    return False
+                count = self.count
+                if not count:
+                    return False
+                self._pending_rows = set()
+                nlist = self.ivf_lists or int(min(4096, max(1, 4 * np.sqrt(count))))
+                rng = np.random.default_rng(0)
+                sample_rows = np.sort(rng.choice(count, size=min(count, nlist * 64), replace=False))
+                sample = np.array(self.vectors[sample_rows])
+
+            centroids = sample[rng.choice(len(sample), size=min(nlist, len(sample)), replace=False)].copy()
+            for _ in range(10):
+                labels = self._nearest_centroids(sample, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                counts = np.bincount(labels, minlength=len(centroids))[:, None]
+                centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+                if self.metric == "cosine":
+                    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+            centroids = centroids.astype(np.float32)
+
+            assign = np.zeros(count, dtype=np.int32)
+            for start in range(0, count, _BLOCK_ROWS):
+                with self.lock:
+                    block = np.array(self.vectors[start:min(start + _BLOCK_ROWS, count, self.count)])
+                assign[start:start + len(block)] = self._nearest_centroids(block, centroids)
+
+            with self.lock:
+                # 训练期间写入、移动或新增的行用新的聚类中心重新分配
+                stale = {row for row in self._pending_rows if row < self.count}
+                stale.update(range(min(count, self.count), self.count))
+                limit = min(count, self.count)
+                self.assign[:limit] = assign[:limit]
+                if stale:
+                    rows = np.array(sorted(stale))
+                    self.assign[rows] = self._nearest_centroids(np.asarray(self.vectors[rows]), centroids)
+                self.centroids = centroids
+                self.trained_count = self.count
+                self._lists = None
+                self._pending_rows = None
+            logger.info(f"向量集合 {self.name} 的IVF索引训练完成, 向量数: {count}, 列表数: {len(centroids)}")
+            return True
+        except Exception as e:
+            with self.lock:
+                self._pending_rows = None
+            logger.error(f"向量集合 {self.name} 的IVF索引训练失败: {str(e)}")
+            raise
+        finally:
+            self._train_lock.release()
+
+    def _ivf(self, queries: np.ndarray, top_k: int, nprobe: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """IVF检索：只在最接近查询的nprobe个倒排列表中精确计算（调用方持有锁且聚类中心已训练）"""
+        if self._lists is None:
+            order = np.argsort(self.assign[:self.count], kind="stable")
+            bounds = np.searchsorted(self.assign[:self.count][order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+        order, bounds = self._lists
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argsort(-self._scores(queries, self.centroids), axis=1)[:, :nprobe]
+        results = []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([order[bounds[i]:bounds[i + 1]] for i in lists])
+            if not len(rows):
+                results.append((np.empty(0, np.float32), rows))
+                continue
+            scores = self._scores(query[None, :], np.asarray(self.vectors[np.sort(rows)]))[0]
+            results.append(self._top_k(scores, np.sort(rows), top_k))
+        return results
+
+    def search(self, queries: Any, top_k: int = 10, mode: str = "auto",
+               nprobe: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """检索与每个查询向量最相似的top_k个向量
+
+        Args:
+            queries: (查询数, 维度) 的查询向量
+            top_k: 每个查询返回的结果数
+            mode: auto、exact 或 ivf
+            nprobe: IVF检索的列表数，为None时使用VECTOR_INDEX_IVF_NPROBE
+
+        Returns:
+            List[List[Dict]]: 每个查询的结果，按得分从高到低，包含 id、score 和 metadata
+
+        Raises:
+            ValueError: 检索方式、top_k或nprobe不合法，或查询向量的维度不一致
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"不支持的检索方式：{mode}，可选值: {list(SEARCH_MODES)}")
+        for name, value in (("top_k", top_k), ("nprobe", nprobe)):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+                raise ValueError(f"{name}必须是正整数")
+        queries = self._prepare(queries)
+        if mode == "ivf" and self.centroids is None:
+            # 明确要求IVF检索时在当前线程中训练（不持有集合锁）
+            self.train_ivf()
+        with self.lock:
+            if not self.count:
+                return [[] for _ in queries]
+            use_ivf = mode == "ivf" or (mode == "auto" and self.count >= self.ivf_threshold)
+            if use_ivf and self._needs_training():
+                self.train_in_background()
+            if use_ivf and self.centroids is not None:
+                found = self._ivf(queries, top_k, nprobe or self.default_nprobe)
+            else:
+                found = self._exact(queries, top_k)
+            return [[{"id": self.row_ids[row], "score": float(score),
+                      "metadata": self.metadata.get(self.row_ids[row])}
+                     for score, row in zip(scores, rows)] for scores, rows in found]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "dimensions": self.dimensions,
+            "metric": self.metric,
+            "count": self.count,
+            "capacity": self.capacity,
+            "ivf_lists": len(self.centroids) if self.centroids is not None else 0
+        }
+
+    def close(self) -> None:
+        """把向量和日志写回文件"""
+        with self.lock:
+            self.vectors.flush()
+            self.log.close()
+
+
+class VectorIndex:
+    """进程内向量索引，管理VECTOR_INDEX_DIR下的各个命名集合，通过VECTOR_INDEX_ENABLED开启
+
+    集合在首次访问时从磁盘加载。写入和检索是同步的CPU计算，由调用方放到线程中执行。
+    索引文件只允许一个进程写入：首次访问时对VECTOR_INDEX_DIR/lock加排他文件锁，
+    其他进程（例如WORKERS>1时的其余工作进程）访问时抛出RuntimeError。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("VECTOR_INDEX_ENABLED", "false").lower() == "true"
+        self.directory = Path(os.getenv("VECTOR_INDEX_DIR", "data/vector_index"))
+        self.collections: Dict[str, VectorCollection] = {}
+        self._lock = threading.Lock()
+        self._lock_fd: Optional[int] = None
+
+    def _acquire_directory(self) -> None:
+        """对索引目录加排他文件锁，保证只有一个进程读写索引文件（调用方持有self._lock）
+
+        Raises:
+            RuntimeError: 目录已被其他进程使用
+        """
+        if self._lock_fd is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.directory / "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            raise RuntimeError(f"向量索引目录 {self.directory} 已被其他进程使用，多工作进程部署时只有一个进程可以提供向量索引")
+        self._lock_fd = fd
+
+    @staticmethod
+    def _check_name(name: str) -> None:
+        if not _NAME_PATTERN.match(name):
+            raise ValueError("集合名称只能包含字母、数字、下划线和连字符，最长64个字符")
+
+    def get(self, name: str, dimensions: Optional[int] = None, metric: str = "cosine") -> Optional[VectorCollection]:
+        """获取集合，不存在时dimensions不为空则创建，否则返回None
+
+        Raises:
+            ValueError: 名称不合法，或维度与已有集合不一致
+            RuntimeError: 索引目录已被其他进程使用
+        """
+        self._check_name(name)
+        with self._lock:
+            self._acquire_directory()
+            collection = self.collections.get(name)
+            if collection is None:
+                if not (self.directory / name / "meta.json").exists() and not dimensions:
+                    return None
+                collection = VectorCollection(name, self.directory / name, dimensions, metric)
+                self.collections[name] = collection
+            elif dimensions is not None and dimensions != collection.dimensions:
+                raise ValueError(f"集合 {name} 的维度为 {collection.dimensions}，与 {dimensions} 不一致")
+            return collection
+
+    def drop(self, name: str) -> bool:
+        """删除集合及其文件"""
+        self._check_name(name)
+        with self._lock:
+            self._acquire_directory()
+            collection = self.collections.pop(name, None)
+            if collection is not None:
+                collection.close()
+            path = self.directory / name
+            if not path.exists():
+                return False
+            shutil.rmtree(path)
+            logger.info(f"向量集合 {name} 已删除")
+            return True
+
+    def list(self) -> List[Dict[str, Any]]:
+        """列出所有集合的统计"""
+        names = sorted(path.name for path in self.directory.iterdir()
+                       if (path / "meta.json").exists()) if self.directory.exists() else []
+        return [self.get(name).stats() for name in names]
+
+    def close(self) -> None:
+        with self._lock:
+            for collection in self.collections.values():
+                collection.close()
+            self.collections.clear()
+            if self._lock_fd is not None:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+
+# 创建全局向量索引实例
+vector_index = VectorIndex()
@@ -0,0 +1,72 @@
+import json
+import tempfile
+from pathlib import Path
+import unittest
+from aiohttp import web
+from app.utils.callback_dispatcher import CallbackDispatcher
+
+
+class TestCallbackDispatcher(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """启动本地回调服务器，前fail_times次请求返回503"""
+        self.received = []
+        self.fail_times = 0
+
+        async def handle(request):
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                return web.Response(status=503)
+            self.received.append(await request.json())
+            return web.Response(status=200)
+
+        async def bad_request(request):
+            return web.Response(status=400)
+
+        app = web.Application()
+        app.router.add_post("/callback", handle)
+        app.router.add_post("/bad", bad_request)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dispatcher = CallbackDispatcher()
+        self.dispatcher.backoff_base = 0.01
+        self.dispatcher.max_retries = 2
+        self.dispatcher.dead_letter_path = Path(self.tmp_dir.name) / "dead_letter.jsonl"
+
+    async def asyncTearDown(self):
+        await self.dispatcher.close(timeout=1)
+        await self.runner.cleanup()
+        self.tmp_dir.cleanup()
+
+    async def test_retry_then_deliver(self):
+        """测试回调失败后按退避重试并最终投递成功"""
+        self.fail_times = 2
+        delivered = []
+
+        async def on_delivered():
+            delivered.append(True)
+
+        await self.dispatcher.dispatch(f"{self.base_url}/callback", {"task_id": "a"}, on_delivered)
+        await self.dispatcher.close(timeout=2)
+        self.assertEqual(self.received, [{"task_id": "a"}])
+        self.assertEqual(delivered, [True])
+        self.assertEqual(self.dispatcher.stats["retried"], 2)
+
+    async def test_dead_letter(self):
+        """测试不可重试的回调写入死信文件"""
+        await self.dispatcher.dispatch(f"{self.base_url}/bad", {"task_id": "b"})
+        await self.dispatcher.close(timeout=2)
+        with open(self.dispatcher.dead_letter_path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["payload"], {"task_id": "b"})
+        self.assertEqual(records[0]["error"], "HTTP 400")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from app.services.embedding_cache import _ENTRY_OVERHEAD, EmbeddingCache
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.vectors = np.random.rand(3, 8).astype(np.float32)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.tmp.cleanup()
+
+    def test_memory_and_disk_hits(self):
+        """测试先命中内存层，重启后命中磁盘层"""
+        cache = EmbeddingCache("m1", self.tmp.name)
+        self.assertEqual(cache.get_many(["a", "b"]), [None, None])
+        cache.put_many(["a", "b", "c"], self.vectors)
+        hits = cache.get_many([" a", "c"])
+        np.testing.assert_array_equal(hits[0], self.vectors[0])
+        np.testing.assert_array_equal(hits[1], self.vectors[2])
+        cache.close()
+
+        cache = EmbeddingCache("m1", self.tmp.name)
+        np.testing.assert_array_equal(cache.get_many(["b"])[0], self.vectors[1])
+        stats = cache.stats()
+        self.assertEqual((stats["memory_hits"], stats["disk_hits"], stats["misses"]), (0, 1, 0))
+        self.assertEqual(stats["disk_entries"], 3)
+        cache.close()
+
+    def test_model_change_invalidates_disk(self):
+        """测试模型变化后磁盘缓存失效"""
+        cache = EmbeddingCache("m1", self.tmp.name)
+        cache.put_many(["a"], self.vectors[:1])
+        cache.close()
+        cache = EmbeddingCache("m2", self.tmp.name)
+        self.assertEqual(cache.get_many(["a"]), [None])
+        cache.put_many(["b"], self.vectors[1:2])
+        self.assertEqual(cache.stats()["disk_entries"], 1)
+        cache.close()
+
+    def test_set_model(self):
+        """测试更换模型指纹后旧向量不再命中"""
+        cache = EmbeddingCache("m1:onnx-int8", self.tmp.name)
+        cache.put_many(["a"], self.vectors[:1])
+        cache.set_model("m1:onnx")
+        self.assertEqual(cache.get_many(["a"]), [None])
+        cache.put_many(["a"], self.vectors[1:2])
+        np.testing.assert_array_equal(cache.get_many(["a"])[0], self.vectors[1])
+        self.assertEqual(cache.stats()["disk_entries"], 1)
+        cache.close()
+
+    def test_memory_limit_and_ring_buffer(self):
+        """测试内存层按容量淘汰，磁盘层写满后覆盖最早的条目"""
+        cache = EmbeddingCache("m1", self.tmp.name, memory_mb=200 / 1024 / 1024, disk_entries=2)
+        cache.put_many(["a", "b", "c"], self.vectors)
+        self.assertEqual(len(cache.memory), 1)
+        cache.close()
+
+        cache = EmbeddingCache("m1", self.tmp.name, disk_entries=2)
+        hits = cache.get_many(["a", "b", "c"])
+        self.assertIsNone(hits[0])
+        np.testing.assert_array_equal(hits[2], self.vectors[2])
+        cache.put_many(["d"], self.vectors[:1])
+        self.assertIsNone(cache.disk.get(cache.key("b")))
+        cache.close()
+
+    def test_open_existing_disk(self):
+        """测试启动时打开已有的磁盘层并加载键索引"""
+        cache = EmbeddingCache("m1", self.tmp.name, disk_entries=4)
+        cache.put_many(["a", "b", "c"], self.vectors)
+        cache.close()
+
+        cache = EmbeddingCache("m1", self.tmp.name, disk_entries=4)
+        cache.open()
+        self.assertEqual(len(cache.disk), 3)
+        self.assertEqual((cache.disk.next_seq, cache.disk.next_row), (4, 3))
+        np.testing.assert_array_equal(cache.get_many(["b"])[0], self.vectors[1])
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        cache.close()
+
+    def test_concurrent_access(self):
+        """测试多个推理线程同时读写时每个文本都对应自己的向量，内存占用统计一致"""
+        cache = EmbeddingCache("m1", self.tmp.name, memory_mb=64 / 1024, disk_entries=64)
+
+        def worker(offset):
+            for i in range(200):
+                text = f"t{offset}-{i % 40}"
+                vector = np.full((1, 8), offset * 1000 + i % 40, dtype=np.float32)
+                cache.put_many([text], vector)
+                hit = cache.get_many([text])[0]
+                if hit is not None:
+                    self.assertEqual(hit[0], offset * 1000 + i % 40)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(worker, range(8)))
+        expected = sum(vector.nbytes + _ENTRY_OVERHEAD for vector in cache.memory.values())
+        self.assertEqual(cache.memory_bytes, expected)
+        for key, row in cache.disk.index.items():
+            self.assertEqual(cache.disk.row_keys[row].tobytes(), key)
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
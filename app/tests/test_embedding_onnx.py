@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+import numpy as np
+
+try:
+    import onnxruntime
+    from sentence_transformers import SentenceTransformer
+    from app.services.embedding_onnx import OnnxEmbeddingModel, cosine_similarity, create_session
+    from app.tests.test_embedding_service import build_tiny_model
+except ImportError:
+    onnxruntime = None
+
+
+@unittest.skipIf(onnxruntime is None, "需要安装onnxruntime和sentence-transformers")
+class TestOnnxEmbeddingModel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """保存一个本地小模型，作为导出的原模型"""
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.model_name = os.path.join(cls.tmp.name, "tiny")
+        os.makedirs(cls.model_name)
+        model = build_tiny_model(cls.model_name)
+        model.prompts, model.default_prompt_name = {}, None
+        model.save(cls.model_name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp(dir=self.tmp.name)
+        self.texts = ["abc", "  Hello World ", "数据脱敏", "向量检索 " * 6]
+
+    def test_export_matches_torch(self):
+        """测试导出的float32模型与torch输出一致，再次加载时不重新导出"""
+        with mock.patch.dict(os.environ, {"EMBEDDING_ONNX_MIN_COSINE": "0.9999"}):
+            model = OnnxEmbeddingModel(self.model_name, self.model_dir, quantize=False)
+        self.assertEqual(model.variant, "onnx")
+        expected = SentenceTransformer(self.model_name, device="cpu").encode(self.texts)
+        cosine = cosine_similarity(expected, model.encode(self.texts, batch_size=2))
+        self.assertGreater(cosine.min(), 0.9999)
+
+        exported_at = (Path(self.model_dir) / "model.onnx").stat().st_mtime_ns
+        OnnxEmbeddingModel(self.model_name, self.model_dir, quantize=False)
+        self.assertEqual((Path(self.model_dir) / "model.onnx").stat().st_mtime_ns, exported_at)
+
+    def test_quantized_model(self):
+        """测试int8量化模型通过精度校验后使用"""
+        with mock.patch.dict(os.environ, {"EMBEDDING_ONNX_MIN_COSINE": "0.5"}):
+            model = OnnxEmbeddingModel(self.model_name, self.model_dir, quantize=True)
+        self.assertEqual(model.variant, "onnx-int8")
+        self.assertTrue((Path(self.model_dir) / "model.int8.onnx").exists())
+        self.assertEqual(model.encode(self.texts).shape, (4, 32))
+
+    def test_accuracy_gate_and_fallback(self):
+        """测试精度校验：int8未通过时改用float32，float32未通过时报错且不保留导出的模型"""
+        # 随机权重的小模型量化误差较大，float32的误差在1e-6量级
+        with mock.patch.dict(os.environ, {"EMBEDDING_ONNX_MIN_COSINE": "0.999999"}):
+            model = OnnxEmbeddingModel(self.model_name, self.model_dir, quantize=True)
+        self.assertEqual(model.variant, "onnx")
+        self.assertFalse((Path(self.model_dir) / "model.int8.onnx").exists())
+
+        model_dir = tempfile.mkdtemp(dir=self.tmp.name)
+        with mock.patch.dict(os.environ, {"EMBEDDING_ONNX_MIN_COSINE": "1.01"}):
+            with self.assertRaises(ValueError):
+                OnnxEmbeddingModel(self.model_name, model_dir, quantize=False)
+        self.assertFalse((Path(model_dir) / "model.onnx").exists())
+
+    def test_session_threads_split_by_workers(self):
+        """测试默认的算子内线程数按执行器并发数平分CPU核数"""
+        OnnxEmbeddingModel(self.model_name, self.model_dir, quantize=False)
+        with mock.patch.dict(os.environ, {"EMBEDDING_ONNX_THREADS": "0", "EMBEDDING_EXECUTOR_WORKERS": "4"}), \
+                mock.patch("os.cpu_count", return_value=8), \
+                mock.patch("onnxruntime.InferenceSession") as session:
+            create_session(Path(self.model_dir) / "model.onnx")
+        self.assertEqual(session.call_args.kwargs["sess_options"].intra_op_num_threads, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
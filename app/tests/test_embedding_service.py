@@ -0,0 +1,179 @@
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from app.utils.model_registry import ModelRegistry
+from app.utils.token_batching import TokenBatcher
+
+try:
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+except ImportError:
+    SentenceTransformer = None
+
+
+def build_tiny_model(directory: str) -> "SentenceTransformer":
+    """在本地构建一个随机初始化的小模型（不下载），含小写化、默认提示词、均值池化和归一化"""
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "abc", "hello", "world", "q1", "w2", "e3"] + \
+        list("abcdefghijklmnopqrstuvwxyz0123456789") + ["数", "据", "脱", "敏", "向", "量", "检", "索"]
+    vocab_file = os.path.join(directory, "vocab.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+    tokenizer = BertTokenizerFast(vocab_file, do_lower_case=False)
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=4,
+                        intermediate_size=64, max_position_embeddings=128)
+    BertModel(config).save_pretrained(directory)
+    tokenizer.save_pretrained(directory)
+    transformer = models.Transformer(directory, max_seq_length=64, do_lower_case=True)
+    # 池化时不计入提示词，需要prompt_length
+    pooling = models.Pooling(32, "mean", include_prompt=False)
+    return SentenceTransformer(modules=[transformer, pooling, models.Normalize()], device="cpu",
+                               prompts={"query": "q1 w2 "}, default_prompt_name="query")
+
+
+@unittest.skipIf(SentenceTransformer is None, "需要安装sentence-transformers")
+class TestEmbeddingServiceEncode(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作：用本地小模型替换注册表中的Embedding模型"""
+        from app.services.embedding_service import EmbeddingService
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model = build_tiny_model(self.tmp_dir.name)
+        registry = ModelRegistry(budget_mb=0)
+        registry.register("embedding", lambda: self.model)
+        patches = [
+            mock.patch("app.services.embedding_service.model_registry", registry),
+            mock.patch.dict(os.environ, {"EMBEDDING_BACKEND": "torch", "EMBEDDING_CACHE_ENABLED": "false"})
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.service = EmbeddingService()
+        # 较小的token上限，使输入分为多个批次
+        self.service.batcher = TokenBatcher("test", max_tokens=96)
+
+    def tearDown(self):
+        self.service.executor.shutdown()
+        self.tmp_dir.cleanup()
+
+    def test_matches_sentence_transformer_encode(self):
+        """测试按长度分批的encode与SentenceTransformer.encode的结果一致（含首尾空白、大写和默认提示词）"""
+        texts = ["abc", "  数据脱敏 ABC  ", "x" * 60, "向量检索 " * 8, "Hello World", "a", "\tQ1 w2 E3\n", "abc " * 40]
+        expected = self.model.encode(texts, batch_size=32)
+        actual = self.service.encode(texts, batch_size=3)
+        self.assertEqual(actual.shape, expected.shape)
+        np.testing.assert_allclose(actual, expected, atol=1e-5)
+        self.assertGreater(self.service.batcher.stats()["batches"], 1)
+
+
+class StubTokenizer:
+    """按空白切分的分词器桩，每个词一个token，开头和结尾各加一个特殊token"""
+
+    def num_special_tokens_to_add(self) -> int:
+        return 2
+
+    def __call__(self, text, add_special_tokens=True, truncation=False, return_offsets_mapping=False):
+        return {"offset_mapping": [match.span() for match in re.finditer(r"\S+", text)]}
+
+
+@unittest.skipIf(SentenceTransformer is None, "需要安装sentence-transformers")
+class TestLongTextEmbedding(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """测试前的准备工作：注册表中的模型替换为最大长度6（窗口4个token）的桩"""
+        from app.services.embedding_service import EmbeddingService
+
+        registry = ModelRegistry(budget_mb=0)
+        registry.register("embedding", lambda: mock.Mock(tokenizer=StubTokenizer(), max_seq_length=6))
+        patches = [
+            mock.patch("app.services.embedding_service.model_registry", registry),
+            mock.patch.dict(os.environ, {"EMBEDDING_BACKEND": "torch", "EMBEDDING_CACHE_ENABLED": "false",
+                                         "EMBEDDING_EXECUTOR": "thread"})
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.service = EmbeddingService()
+        self.text = " ".join(f"w{i}" for i in range(10))
+
+    def tearDown(self):
+        self.service.executor.shutdown()
+
+    def test_window_boundaries(self):
+        """测试窗口按 窗口长度-重叠 的步长切分，最后一个窗口在文本末尾截止"""
+        self.assertEqual(self.service.split_text(self.text, 1), [(0, 11, 4), (9, 20, 4), (18, 29, 4)])
+        self.assertEqual(self.service.split_text(self.text, 0), [(0, 11, 4), (12, 23, 4), (24, 29, 2)])
+        # 重叠最多为窗口长度的一半
+        self.assertEqual(self.service.split_text(self.text, 3), self.service.split_text(self.text, 2))
+        self.assertEqual(len(self.service.split_text(self.text, 2)), 4)
+        for start, end, tokens in self.service.split_text(self.text, 1):
+            self.assertEqual(len(self.text[start:end].split()), tokens)
+
+    def test_single_window(self):
+        """测试不超过窗口长度的文本不切分，返回整个原文"""
+        text = " w0 w1 w2 w3 "
+        self.assertEqual(self.service.split_text(text, 1), [(0, len(text), 4)])
+        self.assertEqual(self.service.split_text("", 1), [(0, 0, 0)])
+
+    async def test_max_chunks(self):
+        """测试分块数超过上限时抛出ValueError，不调用模型"""
+        self.service.max_chunks = 2
+        with mock.patch.object(self.service, "generate_embeddings_array") as embed:
+            with self.assertRaises(ValueError):
+                await self.service.generate_long_embedding(self.text, overlap=1)
+        embed.assert_not_called()
+
+    async def test_pooling(self):
+        """测试mean对各窗口平均、weighted按窗口token数加权，结果归一化"""
+        matrix = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        embed = mock.AsyncMock(return_value=matrix)
+        with mock.patch.object(self.service, "generate_embeddings_array", embed):
+            mean, spans, chunks = await self.service.generate_long_embedding(self.text, overlap=0)
+            weighted, _, _ = await self.service.generate_long_embedding(self.text, overlap=0, pooling="weighted")
+        embed.assert_awaited_with(["w0 w1 w2 w3", "w4 w5 w6 w7", "w8 w9"])
+        self.assertEqual([tokens for _, _, tokens in spans], [4, 4, 2])
+        np.testing.assert_array_equal(chunks, matrix)
+        np.testing.assert_allclose(mean, np.array([2, 1]) / np.sqrt(5), atol=1e-6)
+        np.testing.assert_allclose(weighted, np.array([4, 1]) / np.sqrt(17), atol=1e-6)
+        self.assertEqual(weighted.dtype, np.float32)
+
+
+@unittest.skipIf(SentenceTransformer is None, "需要安装sentence-transformers")
+class TestBackendFallback(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """测试前的准备工作：开启int8量化和向量缓存，执行器替换为桩"""
+        from app.services.embedding_service import EmbeddingService
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        patch = mock.patch.dict(os.environ, {"EMBEDDING_BACKEND": "onnx", "EMBEDDING_ONNX_QUANTIZE": "true",
+                                             "EMBEDDING_CACHE_ENABLED": "true",
+                                             "EMBEDDING_CACHE_DIR": self.tmp_dir.name})
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.service = EmbeddingService()
+        self.service.executor.shutdown()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def test_variant_reported_by_executor(self):
+        """测试执行器（进程池模式下的子进程）改用float32模型时，当前实例的后端和缓存指纹随之更新"""
+        self.assertTrue(self.service.cache.fingerprint.startswith(f"{self.service.model_name}:onnx-int8@"))
+        matrix = np.array([[0.6, 0.8], [1.0, 0.0]], dtype=np.float32)
+        self.service.executor = mock.Mock(call=mock.AsyncMock(return_value=(matrix, "onnx")))
+
+        result = await self.service.generate_embeddings_array(["a", "b"])
+        np.testing.assert_array_equal(result, matrix)
+        self.service.executor.call.assert_awaited_once_with(self.service, "encode_variant", ["a", "b"], 32)
+        self.assertEqual(self.service.backend, "onnx")
+        self.assertTrue(self.service.cache.fingerprint.startswith(f"{self.service.model_name}:onnx@"))
+        # 结果写入新指纹下的缓存
+        np.testing.assert_array_equal(await self.service.generate_embeddings_array(["b", "a"]), matrix[::-1])
+        self.assertEqual(self.service.executor.call.await_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+from app.utils.inference_executor import InferenceExecutor
+
+
+class EchoService:
+    """测试用服务，进程池模式下在子进程内构建（需在模块顶层定义以便pickle）"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+
+    def echo(self, value, scale=1):
+        return {"value": value * scale, "pid": self.pid}
+
+
+class ConcurrencyProbe:
+    """记录同时执行的任务数和执行线程"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.threads = set()
+
+    def work(self, seconds):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.threads.add(threading.get_ident())
+        time.sleep(seconds)
+        with self.lock:
+            self.active -= 1
+        return threading.get_ident()
+
+
+class TestThreadExecutor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.executor = InferenceExecutor("test", kind="thread", max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    async def test_runs_off_event_loop(self):
+        """测试同步推理在执行器线程中运行，等待期间事件循环仍可调度其他协程"""
+        probe = ConcurrencyProbe()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        thread_id = await self.executor.call(probe, "work", 0.2)
+        ticking.cancel()
+        self.assertNotEqual(thread_id, threading.get_ident())
+        self.assertGreater(ticks, 5)
+
+    async def test_concurrency_limit(self):
+        """测试同时执行的任务数不超过执行器并发数"""
+        probe = ConcurrencyProbe()
+        await asyncio.gather(*[self.executor.run(probe.work, 0.05) for _ in range(6)])
+        self.assertEqual(probe.peak, 2)
+        self.assertLessEqual(len(probe.threads), 2)
+
+    async def test_exception_propagates(self):
+        """测试推理中的异常传递给调用方"""
+        def fail():
+            raise ValueError("推理失败")
+
+        with self.assertRaises(ValueError):
+            await self.executor.run(fail)
+
+
+class TestProcessExecutor(unittest.IsolatedAsyncioTestCase):
+    async def test_round_trip_and_shutdown(self):
+        """测试进程池模式：子进程内构建服务实例，调用结果回传，关闭后子进程退出"""
+        executor = InferenceExecutor("test", factory=EchoService, kind="process", max_workers=1)
+        try:
+            self.assertEqual(executor.kind, "process")
+            result = await executor.call(None, "echo", [1, 2], scale=3)
+            self.assertEqual(result["value"], [1, 2, 1, 2, 1, 2])
+            self.assertNotEqual(result["pid"], os.getpid())
+            # 子进程内的服务实例只构建一次
+            self.assertEqual((await executor.call(None, "echo", 1))["pid"], result["pid"])
+            processes = list(executor._executor._processes.values())
+        finally:
+            executor.shutdown()
+        self.assertTrue(processes)
+        self.assertFalse(any(process.is_alive() for process in processes))
+        with self.assertRaises(RuntimeError):
+            await executor.call(None, "echo", 1)
+
+    def test_process_without_factory_falls_back_to_threads(self):
+        """测试进程池模式未提供服务构建函数时改用线程池"""
+        executor = InferenceExecutor("test", kind="process", max_workers=1)
+        self.assertEqual(executor.kind, "thread")
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
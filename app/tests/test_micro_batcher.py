@@ -0,0 +1,42 @@
+import unittest
+from app.utils.micro_batcher import MicroBatcher
+
+
+class TestMicroBatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_collect_up_to_max_batch_size(self):
+        """测试批次凑满最大批大小后立即返回"""
+        batcher = MicroBatcher("test", max_batch_size=3, max_wait_ms=1000)
+        pending = [2, 3, 4, 5]
+
+        async def fetch(timeout):
+            return pending.pop(0) if pending else None
+
+        batch = await batcher.collect(1, fetch)
+        self.assertEqual(batch, [1, 2, 3])
+        self.assertEqual(pending, [4, 5])
+
+    async def test_collect_until_timeout(self):
+        """测试队列为空时等待超时后返回不完整的批次"""
+        batcher = MicroBatcher("test", max_batch_size=8, max_wait_ms=5)
+
+        async def fetch(timeout):
+            return None
+
+        batch = await batcher.collect("only", fetch)
+        self.assertEqual(batch, ["only"])
+
+    async def test_stats(self):
+        """测试批大小统计"""
+        batcher = MicroBatcher("test", max_batch_size=4, max_wait_ms=0)
+        batcher.record(1)
+        batcher.record(4)
+        batcher.record(4)
+        stats = batcher.stats()
+        self.assertEqual(stats["batches"], 3)
+        self.assertEqual(stats["tasks"], 9)
+        self.assertEqual(stats["histogram"], {1: 1, 4: 2})
+        self.assertEqual(stats["avg_batch_size"], 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import threading
+import unittest
+from app.utils.model_registry import ModelRegistry
+
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.registry = ModelRegistry(budget_mb=100)
+        self.loads = {"a": 0, "b": 0, "c": 0}
+
+        def loader(name):
+            def load():
+                self.loads[name] += 1
+                return {"name": name}
+            return load
+
+        for name in self.loads:
+            self.registry.register(name, loader(name), size_mb=40)
+
+    def test_lazy_and_shared(self):
+        """测试模型在第一次使用时才加载，之后共享同一实例"""
+        self.assertEqual(self.loads["a"], 0)
+        first = self.registry.get("a")
+        with self.registry.use("a") as second:
+            self.assertIs(first, second)
+        self.assertEqual(self.loads["a"], 1)
+        # 重复注册不覆盖加载函数
+        self.registry.register("a", lambda: {"name": "other"})
+        self.assertIs(self.registry.get("a"), first)
+
+    def test_concurrent_load_once(self):
+        """测试多个线程同时使用时只加载一次"""
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            with self.registry.use("b"):
+                pass
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.loads["b"], 1)
+
+    def test_evict_least_recently_used(self):
+        """测试超出预算时卸载最久未使用的空闲模型"""
+        with self.registry.use("a"):
+            pass
+        with self.registry.use("b"):
+            pass
+        with self.registry.use("a"):
+            pass
+        with self.registry.use("c"):
+            pass
+        stats = self.registry.stats()
+        self.assertFalse(stats["models"]["b"]["loaded"])
+        self.assertTrue(stats["models"]["a"]["loaded"])
+        self.assertEqual(stats["loaded_mb"], 80)
+        with self.registry.use("b"):
+            pass
+        self.assertEqual(self.loads["b"], 2)
+
+    def test_in_use_not_evicted(self):
+        """测试正在使用的模型不会被卸载"""
+        with self.registry.use("a"):
+            with self.registry.use("b"):
+                with self.registry.use("c"):
+                    self.assertTrue(all(m["loaded"] for m in self.registry.stats()["models"].values()))
+                self.assertFalse(self.registry.evict("a"))
+        self.assertLessEqual(self.registry.stats()["loaded_mb"], 100)
+
+    def test_single_model_over_budget(self):
+        """测试单个模型超过预算时保留最近使用的模型，不反复加载"""
+        registry = ModelRegistry(budget_mb=10)
+        registry.register("big", lambda: object(), size_mb=50)
+        for _ in range(3):
+            with registry.use("big"):
+                pass
+        self.assertEqual(registry.stats()["models"]["big"]["loads"], 1)
+        self.assertTrue(registry.evict("big"))
+        self.assertFalse(registry.stats()["models"]["big"]["loaded"])
+
+    def test_unknown_model(self):
+        """测试使用未注册的模型"""
+        with self.assertRaises(KeyError):
+            self.registry.get("missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
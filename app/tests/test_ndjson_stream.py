@@ -0,0 +1,67 @@
+import asyncio
+import json
+import unittest
+from app.utils.ndjson_stream import process_ndjson_stream, read_ndjson_batches
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class TestNdjsonStream(unittest.IsolatedAsyncioTestCase):
+    async def test_batches_across_chunk_boundaries(self):
+        """测试跨数据块的行被正确拼接，按批次大小分批"""
+        data = b"".join(json.dumps({"id": i, "text": f"文本{i}"}, ensure_ascii=False).encode() + b"\n"
+                        for i in range(5))
+        batches = [batch async for batch in read_ndjson_batches(chunked(data, 7), 2, 1024)]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[2][0][1], {"id": 4, "text": "文本4"})
+
+    async def test_invalid_and_long_lines(self):
+        """测试无效行和超长行输出错误，不中断后续行"""
+        data = b'{"id": 1, "text": "a"}\nnot json\n' + b"x" * 50 + b'\n{"id": 2, "text": "b"}'
+
+        async def handler(records):
+            return [{"id": record["id"], "length": len(record["text"])} for record in records]
+
+        output = b"".join([line async for line in process_ndjson_stream(chunked(data, 8), handler, 10, 32)])
+        lines = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(lines[0], {"id": 1, "length": 1})
+        self.assertEqual((lines[1]["line"], "error" in lines[1]), (2, True))
+        self.assertEqual((lines[2]["line"], "error" in lines[2]), (3, True))
+        self.assertEqual(lines[3], {"id": 2, "length": 1})
+
+    async def test_handler_errors_include_line(self):
+        """测试处理函数返回的错误结果带有行号"""
+        data = b'{"id": 1, "text": "a"}\n{"id": 2, "text": 3}\n'
+
+        async def handler(records):
+            return [{"id": record["id"], "error": "text必须是字符串"} if not isinstance(record["text"], str)
+                    else {"id": record["id"]} for record in records]
+
+        output = b"".join([line async for line in process_ndjson_stream(chunked(data, 8), handler, 10, 1024)])
+        lines = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(lines, [{"id": 1}, {"line": 2, "id": 2, "error": "text必须是字符串"}])
+
+    async def test_backpressure(self):
+        """测试消费方不读取时，预读的批次数有上限"""
+        read = []
+
+        async def source():
+            for i in range(100):
+                read.append(i)
+                yield json.dumps({"id": i, "text": "t"}).encode() + b"\n"
+
+        async def handler(records):
+            return records
+
+        stream = process_ndjson_stream(source(), handler, 1, 1024, depth=2)
+        await stream.__anext__()
+        await asyncio.sleep(0.05)
+        self.assertLess(len(read), 10)
+        await stream.aclose()
+
+
+if __name__ == '__main__':
+    unittest.main()
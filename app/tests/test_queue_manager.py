@@ -0,0 +1,323 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from app.utils.queue_backends import MemoryQueueBackend, RedisQueueBackend, SQLiteQueueBackend
+from app.utils.queue_journal import QueueJournal
+from app.utils.queue_manager import TaskQueue, WeightedFairScheduler
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class TestTaskQueue(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.queue = TaskQueue()
+
+    async def test_get_task_by_type(self):
+        """测试按任务类型获取任务"""
+        await self.queue.add_task("mask-1", "mask")
+        await self.queue.add_task("embedding-1", "embedding")
+
+        task = await self.queue.get_task("embedding")
+        self.assertEqual(task, {"task_id": "embedding-1", "type": "embedding", "priority": "normal"})
+        self.assertIsNone(await self.queue.get_task("rerank", timeout=0))
+
+        task = await self.queue.get_task("mask")
+        self.assertEqual(task["task_id"], "mask-1")
+
+    async def test_get_task_wakes_on_add(self):
+        """测试消费者阻塞等待，新任务入队后立即被唤醒"""
+        consumer = asyncio.create_task(self.queue.get_task("rerank"))
+        await asyncio.sleep(0)
+        self.assertFalse(consumer.done())
+
+        await self.queue.add_task("rerank-1", "rerank")
+        task = await asyncio.wait_for(consumer, timeout=1)
+        self.assertEqual(task["task_id"], "rerank-1")
+
+    async def test_get_task_timeout(self):
+        """测试等待超时返回None"""
+        self.assertIsNone(await self.queue.get_task("mask", timeout=0.01))
+
+    async def test_shared_capacity(self):
+        """测试所有任务类型共享队列容量"""
+        self.queue.maxsize = 2
+        self.assertTrue(await self.queue.add_task("a", "mask"))
+        self.assertTrue(await self.queue.add_task("b", "rerank"))
+        self.assertFalse(await self.queue.add_task("c", "embedding"))
+
+    async def test_priority_lanes(self):
+        """测试同类型任务中高优先级通道获得更多调度机会"""
+        for i in range(10):
+            await self.queue.add_task(f"low-{i}", "mask", priority="low")
+            await self.queue.add_task(f"high-{i}", "mask", priority="high")
+
+        order = [(await self.queue.get_task("mask"))["priority"] for _ in range(10)]
+        self.assertEqual(order.count("high"), 8)
+        self.assertEqual(order.count("low"), 2)
+
+        status = await self.queue.get_queue_status()
+        self.assertEqual(status["lanes"], {"mask:low": 8, "mask:high": 2})
+
+    async def test_priority_lanes_with_interleaved_types(self):
+        """测试其他类型频繁调度时，同类型的各优先级通道仍按权重比例获得调度"""
+        for i in range(200):
+            await self.queue.add_task(f"mask-low-{i}", "mask", priority="low")
+            await self.queue.add_task(f"mask-high-{i}", "mask", priority="high")
+        for i in range(500):
+            await self.queue.add_task(f"rerank-{i}", "rerank")
+
+        order = []
+        for _ in range(50):
+            for _ in range(10):
+                await self.queue.get_task("rerank")
+            order.append((await self.queue.get_task("mask"))["priority"])
+        self.assertEqual(order.count("high"), 40)
+        self.assertEqual(order.count("low"), 10)
+
+    async def test_invalid_priority(self):
+        """测试不支持的优先级"""
+        with self.assertRaises(ValueError):
+            await self.queue.add_task("a", "mask", priority="urgent")
+
+    async def test_complete_task(self):
+        """测试完成任务后从处理中列表移除"""
+        await self.queue.add_task("rerank-1", "rerank")
+        await self.queue.get_task("rerank")
+        status = await self.queue.get_queue_status()
+        self.assertEqual(status["processing"], ["rerank-1"])
+
+        await self.queue.complete_task("rerank-1")
+        status = await self.queue.get_queue_status()
+        self.assertEqual(status["processing"], [])
+        self.assertEqual(status["waiting"], 0)
+
+    async def test_admission_control(self):
+        """测试估计等待时间超过上限时拒绝新任务并给出重试时间"""
+        self.queue.slo_seconds = {"rerank": 10}
+        self.queue.set_capacity("rerank", 2)
+        self.assertIsNone(await self.queue.check_admission("rerank"))
+
+        self.queue.record_service_time("rerank", 4.0, count=2)
+        for i in range(10):
+            await self.queue.add_task(f"rerank-{i}", "rerank")
+        # (10 + 1) x 2秒 / 2个工作协程 = 11秒
+        self.assertEqual(await self.queue.estimate_wait("rerank"), 11.0)
+        self.assertEqual(await self.queue.check_admission("rerank"), 1)
+        self.assertIsNone(await self.queue.check_admission("mask"))
+
+        await self.queue.get_task("rerank")
+        await self.queue.get_task("rerank")
+        self.assertEqual(await self.queue.estimate_wait("rerank"), 11.0)
+        await self.queue.complete_task("rerank-0")
+        self.assertIsNone(await self.queue.check_admission("rerank"))
+
+        status = await self.queue.get_queue_status()
+        self.assertEqual(status["estimates"]["rerank"]["estimated_wait"], 10.0)
+        self.assertEqual(status["estimates"]["rerank"]["rejected"], 1)
+
+
+class TestQueueRecovery(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.tmp_dir.name, "queue.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def test_recover_pending_and_inflight(self):
+        """测试重启后按原顺序恢复排队中和处理中的任务"""
+        queue = TaskQueue(backend=MemoryQueueBackend(QueueJournal(self.journal_path)))
+        await queue.add_task("a", "mask")
+        await queue.add_task("b", "mask")
+        await queue.add_task("c", "rerank")
+        await queue.get_task("mask")
+        await queue.get_task("rerank")
+        await queue.complete_task("c")
+        # 模拟进程被杀死：任务a处理中，任务b排队中
+        queue.close()
+
+        restarted = TaskQueue(backend=MemoryQueueBackend(QueueJournal(self.journal_path)))
+        abandoned = await restarted.recover()
+        self.assertEqual(abandoned, [])
+        self.assertEqual((await restarted.get_task("mask", timeout=0))["task_id"], "a")
+        self.assertEqual((await restarted.get_task("mask", timeout=0))["task_id"], "b")
+        self.assertIsNone(await restarted.get_task("rerank", timeout=0))
+        restarted.close()
+
+    async def test_journal_writes_off_event_loop(self):
+        """测试内存后端的队列日志写入在线程中执行"""
+        journal = QueueJournal(self.journal_path)
+        queue = TaskQueue(backend=MemoryQueueBackend(journal))
+        threads = []
+        for name in ("append", "mark_inflight", "remove"):
+            original = getattr(journal, name)
+
+            def record(*args, _original=original):
+                threads.append(threading.current_thread())
+                return _original(*args)
+
+            setattr(journal, name, record)
+        await queue.add_task("a", "mask")
+        await queue.get_task("mask")
+        await queue.complete_task("a")
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.main_thread(), threads)
+        queue.close()
+
+    async def test_abandon_after_max_attempts(self):
+        """测试被中断次数达到上限的任务被放弃"""
+        for _ in range(2):
+            queue = TaskQueue(backend=MemoryQueueBackend(QueueJournal(self.journal_path)))
+            queue.max_attempts = 2
+            await queue.recover()
+            if not await queue.qsize():
+                await queue.add_task("a", "embedding")
+            await queue.get_task("embedding")
+            queue.close()
+
+        queue = TaskQueue(backend=MemoryQueueBackend(QueueJournal(self.journal_path)))
+        queue.max_attempts = 2
+        abandoned = await queue.recover()
+        self.assertEqual([entry["task_id"] for entry in abandoned], ["a"])
+        self.assertEqual(await queue.qsize(), 0)
+        queue.close()
+
+
+class SharedBackendTests:
+    """共享队列后端的公共测试，子类实现create_backend"""
+
+    def create_backend(self):
+        raise NotImplementedError
+
+    def create_queue(self):
+        queue = TaskQueue(backend=self.create_backend())
+        queue.poll_interval = 0.01
+        return queue
+
+    async def test_each_task_leased_once(self):
+        """测试多个进程共享队列时每个任务只被租用一次"""
+        producer, consumer_a, consumer_b = self.create_queue(), self.create_queue(), self.create_queue()
+        for i in range(6):
+            await producer.add_task(f"task-{i}", "embedding")
+
+        leased = []
+        for consumer in (consumer_a, consumer_b, consumer_a, consumer_b, consumer_a, consumer_b):
+            leased.append((await consumer.get_task("embedding", timeout=0))["task_id"])
+        self.assertEqual(leased, [f"task-{i}" for i in range(6)])
+        self.assertIsNone(await consumer_a.get_task("embedding", timeout=0))
+
+    async def test_poll_finds_task_from_other_process(self):
+        """测试等待中的消费者能发现其他进程入队的任务"""
+        producer, consumer = self.create_queue(), self.create_queue()
+        waiter = asyncio.create_task(consumer.get_task("rerank", timeout=1))
+        await asyncio.sleep(0.02)
+        await producer.add_task("rerank-1", "rerank")
+        task = await waiter
+        self.assertEqual(task["task_id"], "rerank-1")
+
+    async def test_expired_lease_is_reclaimed(self):
+        """测试租约过期的任务被其他进程回收，超过尝试次数后被放弃"""
+        crashed, survivor = self.create_queue(), self.create_queue()
+        crashed.lease_seconds = 0
+        survivor.max_attempts = 2
+        await crashed.add_task("mask-1", "mask")
+        await crashed.get_task("mask", timeout=0)
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(await survivor.recover(), [])
+        task = await survivor.get_task("mask", timeout=0)
+        self.assertEqual(task["task_id"], "mask-1")
+
+        survivor.lease_seconds = 0
+        await survivor.renew_leases()
+        await asyncio.sleep(0.01)
+        abandoned = await survivor.recover()
+        self.assertEqual([entry["task_id"] for entry in abandoned], ["mask-1"])
+        self.assertIsNone(await survivor.get_task("mask", timeout=0))
+
+    async def test_ack_removes_task(self):
+        """测试确认后的任务不会被回收"""
+        queue = self.create_queue()
+        queue.lease_seconds = 0
+        await queue.add_task("a", "mask")
+        await queue.get_task("mask", timeout=0)
+        await queue.complete_task("a")
+        await asyncio.sleep(0.01)
+        self.assertEqual(await queue.recover(), [])
+        self.assertIsNone(await queue.get_task("mask", timeout=0))
+
+
+class TestSQLiteQueueBackend(SharedBackendTests, unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.backends = []
+
+    def tearDown(self):
+        for backend in self.backends:
+            backend.close()
+        self.tmp_dir.cleanup()
+
+    def create_backend(self):
+        backend = SQLiteQueueBackend(os.path.join(self.tmp_dir.name, "queue.db"))
+        self.backends.append(backend)
+        return backend
+
+
+@unittest.skipIf(fakeredis is None, "需要安装fakeredis")
+class TestRedisQueueBackend(SharedBackendTests, unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        """测试前的准备工作，所有后端连接同一个本地替身服务"""
+        self.server = fakeredis.FakeServer()
+
+    def create_backend(self):
+        client = fakeredis.FakeAsyncRedis(server=self.server, decode_responses=True)
+        return RedisQueueBackend(client=client, prefix="test:queue")
+
+    async def test_renewed_lease_not_reclaimed(self):
+        """测试查询到过期租约之后、回收之前被续租的任务不会重新入队"""
+        owner, other = self.create_backend(), self.create_backend()
+        await owner.push("embed-1", "embedding", "normal")
+        self.assertEqual(await owner.lease(("embedding", "normal"), 0), "embed-1")
+        await asyncio.sleep(0.01)
+
+        query = other.client.zrangebyscore
+
+        async def renew_after_query(*args, **kwargs):
+            expired = await query(*args, **kwargs)
+            await owner.renew(["embed-1"], 60)
+            return expired
+
+        other.client.zrangebyscore = renew_after_query
+        self.assertEqual(await other.reclaim_expired(3), ([], []))
+        self.assertIsNone(await other.lease(("embedding", "normal"), 60))
+
+
+class TestWeightedFairScheduler(unittest.TestCase):
+    def test_weighted_share(self):
+        """测试各通道按权重比例获得调度"""
+        scheduler = WeightedFairScheduler()
+        weights = {("rerank", "normal"): 4, ("mask", "low"): 1}
+        picks = [scheduler.pick(weights.keys(), weights) for _ in range(50)]
+        self.assertEqual(picks.count(("rerank", "normal")), 40)
+        self.assertEqual(picks.count(("mask", "low")), 10)
+
+    def test_idle_lane_does_not_burst(self):
+        """测试空闲后重新就绪的通道不会连续插队"""
+        scheduler = WeightedFairScheduler()
+        weights = {("a", "normal"): 1, ("b", "normal"): 1}
+        for _ in range(20):
+            scheduler.pick([("a", "normal")], weights)
+        picks = [scheduler.pick(weights.keys(), weights) for _ in range(4)]
+        self.assertEqual(picks.count(("b", "normal")), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import base64
+import threading
+import unittest
+from unittest import mock
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.embedding_router import router as embedding_router, sync_limiter as embedding_limiter
+from app.api.rerank_router import router as rerank_router, sync_limiter as rerank_limiter
+from app.utils.concurrency_limiter import ConcurrencyLimiter
+from app.utils.task_processor import task_processor
+
+
+class TestConcurrencyLimiter(unittest.TestCase):
+    def test_reject_when_full(self):
+        """测试并发数达到上限时拒绝，释放后可再次占用"""
+        limiter = ConcurrencyLimiter("test", limit=2)
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        limiter.release()
+        self.assertTrue(limiter.try_acquire())
+        self.assertEqual(limiter.stats(), {"limit": 2, "active": 2, "accepted": 3, "rejected": 1})
+
+
+class TestSyncEndpoints(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作：只挂载路由，推理服务替换为桩函数"""
+        app = FastAPI()
+        app.include_router(embedding_router, prefix="/api/v1/embedding")
+        app.include_router(rerank_router, prefix="/api/v1/rerank")
+        self.client = TestClient(app)
+        self.embed = mock.AsyncMock(side_effect=lambda texts, *args: np.array([[3.0, 4.0, 0.0, 0.0]] * len(texts),
+                                                                                dtype=np.float32))
+        self.rerank = mock.AsyncMock(return_value=[["b", 0.9]])
+        mock.patch.object(task_processor.embedding_service, "generate_embeddings_array", self.embed).start()
+        mock.patch.object(task_processor.rerank_service, "rerank_texts", self.rerank).start()
+        for limiter in (embedding_limiter, rerank_limiter):
+            mock.patch.multiple(limiter, limit=1, active=0, accepted=0, rejected=0).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_embedding_sync(self):
+        """测试同步Embedding直接返回向量，支持向量格式和维度截取"""
+        response = self.client.post("/api/v1/embedding/sync", json={"text": "你好"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["embedding"], [3.0, 4.0, 0.0, 0.0])
+
+        response = self.client.post("/api/v1/embedding/sync",
+                                    json={"text": "你好", "vector_format": "float16", "dimensions": 2})
+        body = response.json()
+        self.assertEqual((body["embedding_format"], body["dimensions"]), ("float16", 2))
+        np.testing.assert_allclose(np.frombuffer(base64.b64decode(body["embedding"]), dtype="<f2"), [0.6, 0.8],
+                                   atol=1e-3)
+        self.assertEqual(embedding_limiter.stats()["active"], 0)
+
+    def test_embedding_sync_errors(self):
+        """测试参数错误返回400，推理失败返回500，并发名额都被释放"""
+        self.assertEqual(self.client.post("/api/v1/embedding/sync", json={"text": 1}).status_code, 400)
+        self.assertEqual(self.client.post("/api/v1/embedding/sync",
+                                          json={"text": "a", "dimensions": 0}).status_code, 400)
+        self.embed.side_effect = RuntimeError("模型加载失败")
+        response = self.client.post("/api/v1/embedding/sync", json={"text": "a"})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(embedding_limiter.stats()["active"], 0)
+
+    def test_long_text_too_many_chunks(self):
+        """测试长文本分块数超过上限返回400，并发名额被释放"""
+        long_embedding = mock.AsyncMock(side_effect=ValueError("文本切分为 3 块，超过上限 2"))
+        with mock.patch.object(task_processor.embedding_service, "generate_long_embedding", long_embedding):
+            response = self.client.post("/api/v1/embedding/sync", json={"text": "a b c", "long_text": "chunk"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("超过上限", response.json()["detail"])
+        self.assertEqual(embedding_limiter.stats()["active"], 0)
+
+    def test_rerank_sync(self):
+        """测试同步Rerank直接返回排序结果"""
+        response = self.client.post("/api/v1/rerank/sync", json={"query": "q", "texts": ["a", "b"], "top_k": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"rankings": [["b", 0.9]]})
+        self.rerank.assert_awaited_once_with(query="q", texts=["a", "b"], top_k=1)
+        self.assertEqual(rerank_limiter.stats()["active"], 0)
+
+    def test_saturated_returns_429(self):
+        """测试并发名额占满时立即返回429和Retry-After，请求完成后恢复"""
+        started, finish = threading.Event(), threading.Event()
+
+        async def slow_rerank(**kwargs):
+            started.set()
+            while not finish.is_set():
+                await asyncio.sleep(0.01)
+            return [["a", 0.5]]
+
+        self.rerank.side_effect = slow_rerank
+        payload = {"query": "q", "texts": ["a"], "top_k": 1}
+        results = []
+        worker = threading.Thread(target=lambda: results.append(self.client.post("/api/v1/rerank/sync", json=payload)))
+        worker.start()
+        self.assertTrue(started.wait(5))
+
+        response = self.client.post("/api/v1/rerank/sync", json=payload)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        finish.set()
+        worker.join(5)
+        self.assertEqual(results[0].status_code, 200)
+        self.assertEqual(rerank_limiter.stats()["rejected"], 1)
+        self.assertEqual(self.client.post("/api/v1/rerank/sync", json=payload).status_code, 200)
+
+        embedding_limiter.active = 1
+        response = self.client.post("/api/v1/embedding/sync", json={"text": "a"})
+        self.assertEqual((response.status_code, response.headers["Retry-After"]), (429, "1"))
+        self.embed.assert_not_awaited()
+
+
+if __name__ == '__main__':
+    unittest.main()
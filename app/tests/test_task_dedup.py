@@ -0,0 +1,91 @@
+import os
+import unittest
+from unittest import mock
+from app.utils.task_dedup import TaskDeduplicator
+
+
+class TestTaskDeduplicator(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.dedup = TaskDeduplicator()
+        self.dedup.enabled = True
+
+    def test_make_key(self):
+        """测试任务键只取决于类型、模型和参数"""
+        key = self.dedup.make_key("embedding", "m1", {"text": "你好", "pooling": "mean"})
+        self.assertEqual(key, self.dedup.make_key("embedding", "m1", {"pooling": "mean", "text": "你好"}))
+        self.assertNotEqual(key, self.dedup.make_key("embedding", "m2", {"text": "你好"}))
+        self.assertNotEqual(key, self.dedup.make_key("mask", "m1", {"text": "你好"}))
+        self.dedup.enabled = False
+        self.assertIsNone(self.dedup.make_key("embedding", "m1", {"text": "你好"}))
+
+    def test_whitespace_variant_not_shared(self):
+        """测试只差空白或规范形式的脱敏文本不共用结果（结果中包含原文）"""
+        key = self.dedup.make_key("mask", "paddle", {"text": "Jos\u00e9的电话是13800138000", "mask_type": "similar"})
+        self.assertEqual(self.dedup.claim(key, "mask", "t1"), ("leader", None))
+        for text in (" Jos\u00e9的电话是13800138000\n", "Jose\u0301的电话是13800138000"):
+            variant = self.dedup.make_key("mask", "paddle", {"text": text, "mask_type": "similar"})
+            self.assertNotEqual(variant, key)
+            self.assertEqual(self.dedup.claim(variant, "mask", f"t-{len(text)}")[0], "leader")
+        self.assertEqual(self.dedup.resolve("t1", {"masked_text": "某某的电话是13900000000"}), [])
+
+    def test_disabled_for_shared_queue(self):
+        """测试共享队列后端下不去重"""
+        with mock.patch.dict(os.environ, {"TASK_DEDUP_ENABLED": "true", "QUEUE_BACKEND": "redis"}):
+            self.assertFalse(TaskDeduplicator().enabled)
+        with mock.patch.dict(os.environ, {"TASK_DEDUP_ENABLED": "true", "QUEUE_BACKEND": "memory"}):
+            self.assertTrue(TaskDeduplicator().enabled)
+
+    def test_inflight_then_recent_result(self):
+        """测试处理中的相同任务挂起等待，完成后的相同任务直接使用缓存结果"""
+        key = self.dedup.make_key("rerank", "m", {"query": "q", "texts": ["a"], "top_k": 1})
+        self.assertEqual(self.dedup.claim(key, "rerank", "t1"), ("leader", None))
+        self.assertEqual(self.dedup.claim(key, "rerank", "t2"), ("inflight", None))
+        self.assertEqual(self.dedup.claim(key, "rerank", "t3"), ("inflight", None))
+
+        result = {"rankings": [["a", 0.9]]}
+        self.assertEqual(self.dedup.resolve("t1", result), ["t2", "t3"])
+        self.assertEqual(self.dedup.claim(key, "rerank", "t4"), ("result", result))
+
+        stats = self.dedup.stats("rerank")
+        self.assertEqual((stats["misses"], stats["inflight_hits"], stats["result_hits"]), (1, 2, 1))
+        self.assertEqual(stats["hit_rate"], 0.75)
+
+    def test_restore_after_restart(self):
+        """测试重启后恢复处理中的任务及挂在其上的任务，完成时一起交付"""
+        key = self.dedup.make_key("rerank", "m", {"query": "q", "texts": ["a"], "top_k": 1})
+        self.dedup.claim(key, "rerank", "t1")
+        self.dedup.claim(key, "rerank", "t2")
+        self.assertEqual(self.dedup.leader_of(key), "t1")
+        self.assertEqual(self.dedup.followers(key), ["t2"])
+
+        restarted = TaskDeduplicator()
+        restarted.enabled = True
+        restarted.restore("t1", key, ["t2"])
+        self.assertEqual(restarted.claim(key, "rerank", "t3"), ("inflight", None))
+        # 另一个恢复的相同任务改挂到已恢复的任务上
+        restarted.restore("t4", key, ["t5"])
+        self.assertEqual(restarted.resolve("t4", None), [])
+        self.assertEqual(restarted.resolve("t1", None), ["t2", "t3", "t5"])
+        self.assertIsNone(restarted.leader_of(key))
+
+    def test_failed_result_not_cached(self):
+        """测试失败的任务不缓存结果，入队失败时释放任务键"""
+        key = self.dedup.make_key("mask", "paddle", {"text": "x"})
+        self.dedup.claim(key, "mask", "t1")
+        self.assertEqual(self.dedup.resolve("t1", None), [])
+        self.assertEqual(self.dedup.claim(key, "mask", "t2"), ("leader", None))
+        self.dedup.claim(key, "mask", "t3")
+        self.assertEqual(self.dedup.release("t2"), ["t3"])
+        self.assertFalse(self.dedup.has(key))
+
+    def test_result_expires(self):
+        """测试最近结果超过有效期后不再复用"""
+        key = self.dedup.make_key("embedding", "m", {"text": "x"})
+        self.dedup.results[key] = ({"embedding": ""}, 0)
+        self.assertIsNone(self.dedup.cached_result(key))
+        self.assertNotIn(key, self.dedup.results)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from app.models.embedding_batch import EmbeddingBatchTask
+from app.models.rerank import RerankTask
+from app.models.task_store import JsonFileTaskStore
+from app.utils import task_processor as task_processor_module
+from app.utils.queue_backends import MemoryQueueBackend
+from app.utils.queue_journal import QueueJournal
+from app.utils.queue_manager import TaskQueue
+from app.utils.task_dedup import TaskDeduplicator
+from app.utils.task_processor import TaskProcessor
+
+
+class TaskProcessorTestCase(unittest.IsolatedAsyncioTestCase):
+    """替换任务队列、任务存储、去重和回调分发器的公共准备"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.tmp_dir.name, "queue.db")
+        self.store = JsonFileTaskStore(os.path.join(self.tmp_dir.name, "tasks"))
+        self.processor = TaskProcessor()
+        self.processor.task_models["rerank"] = RerankTask(store=self.store)
+        self.processor.task_models["embedding_batch"] = EmbeddingBatchTask(store=self.store)
+        self.callbacks = []
+
+        async def dispatch(handle, data, on_delivered=None, callback_format="json"):
+            self.callbacks.append(data)
+            if on_delivered:
+                await on_delivered()
+
+        mock.patch.object(task_processor_module.callback_dispatcher, "dispatch", side_effect=dispatch).start()
+        self.use_queue(TaskQueue(backend=MemoryQueueBackend(QueueJournal(self.journal_path))))
+        self.use_dedup()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        self.queue.close()
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def use_queue(self, queue: TaskQueue) -> None:
+        self.queue = queue
+        mock.patch.object(task_processor_module, "task_queue", queue).start()
+
+    def use_dedup(self) -> None:
+        self.dedup = TaskDeduplicator()
+        self.dedup.enabled = True
+        mock.patch.object(task_processor_module, "task_dedup", self.dedup).start()
+
+
+class TestDedupRecovery(TaskProcessorTestCase):
+    async def test_followers_recovered_after_restart(self):
+        """测试重启后挂起的相同任务随处理中的任务恢复，处理完成时收到结果"""
+        model = self.processor.task_models["rerank"]
+        params = {"query": "q", "texts": ["a", "b"], "top_k": 1, "handle": "http://callback"}
+        key = self.dedup.make_key("rerank", "m", {"query": "q", "texts": ["a", "b"], "top_k": 1})
+        for task_id in ("t1", "t2", "t3"):
+            await model.create(task_id, params)
+            self.assertTrue(await self.processor.submit_task(task_id, "rerank", dedup_key=key))
+        self.assertEqual((await self.queue.get_queue_status())["waiting"], 1)
+
+        # 模拟进程重启：队列从日志恢复，去重状态从任务记录恢复
+        self.queue.close()
+        self.use_queue(TaskQueue(backend=MemoryQueueBackend(QueueJournal(self.journal_path))))
+        self.use_dedup()
+        await self.processor.recover_tasks()
+
+        task = await self.queue.get_task("rerank", timeout=0)
+        self.assertEqual(task["task_id"], "t1")
+        with mock.patch.object(self.processor.rerank_service, "rerank_texts",
+                               new=mock.AsyncMock(return_value=[["a", 0.9]])):
+            await self.processor.process_rerank_task(task)
+        self.assertEqual(sorted(c["task_id"] for c in self.callbacks), ["t1", "t2", "t3"])
+        self.assertTrue(all(c["status"] == "completed" and c["rankings"] == [["a", 0.9]] for c in self.callbacks))
+        for task_id in ("t1", "t2", "t3"):
+            self.assertIsNone(await model.get(task_id))
+
+
+class TestEmbeddingBatch(TaskProcessorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.model = self.processor.task_models["embedding_batch"]
+        embed = mock.AsyncMock(side_effect=lambda texts, *args: np.array(
+            [[float(len(text)), 0.0] for text in texts], dtype=np.float32))
+        mock.patch.object(self.processor.embedding_service, "generate_embeddings_array", embed).start()
+
+    async def run_batch(self, task_id: str, texts, chunk_size: int) -> None:
+        await self.model.create(task_id, {"texts": texts, "ids": [f"id{i}" for i in range(len(texts))],
+                                          "handle": "http://callback", "chunk_size": chunk_size})
+        await self.queue.add_task(task_id, "embedding_batch")
+        await self.processor.process_embedding_batch_task(await self.queue.get_task("embedding_batch", timeout=0))
+
+    async def test_chunked_callbacks(self):
+        """测试分块回调按顺序投递，进度更新不重写输入文本，全部投递后删除任务和输入记录"""
+        texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+        with mock.patch.object(self.store, "update", wraps=self.store.update) as update:
+            await self.run_batch("b1", texts, chunk_size=2)
+        self.assertEqual([(c["chunk"], c["chunks"], c["offset"]) for c in self.callbacks],
+                         [(0, 3, 0), (1, 3, 2), (2, 3, 4)])
+        self.assertEqual([c["ids"] for c in self.callbacks], [["id0", "id1"], ["id2", "id3"], ["id4"]])
+        self.assertEqual([c["embeddings"] for c in self.callbacks],
+                         [[[1.0, 0.0], [2.0, 0.0]], [[3.0, 0.0], [4.0, 0.0]], [[5.0, 0.0]]])
+        self.assertEqual([call.args[1] for call in update.call_args_list], [
+            {"status": "processing", "processed": 2},
+            {"status": "processing", "processed": 4},
+            {"status": "completed", "processed": 5},
+        ])
+        self.assertIsNone(await self.model.get("b1"))
+        self.assertEqual(await self.model.get_inputs("b1"), (None, None))
+
+    async def test_single_chunk(self):
+        """测试只有一块时结果和进度保存在任务记录中，回调投递后删除任务"""
+        with mock.patch.object(self.model, "delete", new=mock.AsyncMock(return_value=True)) as delete:
+            await self.run_batch("b2", ["a", "bb"], chunk_size=10)
+        self.assertEqual(len(self.callbacks), 1)
+        self.assertNotIn("chunk", self.callbacks[0])
+        self.assertEqual(self.callbacks[0]["ids"], ["id0", "id1"])
+        delete.assert_awaited_once_with("b2")
+        task = await self.model.get("b2")
+        self.assertEqual((task["status"], task["processed"], task["embedding_format"]), ("completed", 2, "float32"))
+        self.assertNotIn("texts", task)
+        self.assertEqual(await self.model.get_inputs("b2"), (["a", "bb"], ["id0", "id1"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
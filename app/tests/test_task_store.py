@@ -0,0 +1,173 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from datetime import datetime
+from app.models.embedding import EmbeddingTask
+from app.models.task_store import CachedTaskStore, JsonFileTaskStore, SQLiteTaskStore, create_task_store
+
+
+class TaskStoreTests:
+    """任务存储的公共测试，子类实现create_store"""
+
+    def create_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = self.create_store()
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    async def test_create_get_update_delete(self):
+        """测试任务的增删改查"""
+        model = EmbeddingTask(store=self.store)
+        self.assertTrue(await model.create("task-1", {"text": "你好", "handle": None}))
+
+        task = await model.get("task-1")
+        self.assertEqual(task["status"], "pending")
+        self.assertEqual(task["text"], "你好")
+
+        self.assertTrue(await model.update("task-1", {"status": "completed", "embedding": [0.1, 0.2]}))
+        task = await model.get("task-1")
+        self.assertEqual(task["status"], "completed")
+        self.assertEqual(task["embedding"], [0.1, 0.2])
+        self.assertEqual(task["text"], "你好")
+
+        self.assertTrue(await model.delete("task-1"))
+        self.assertIsNone(await model.get("task-1"))
+        self.assertFalse(await model.delete("task-1"))
+
+    async def test_expire(self):
+        """测试按状态和最后更新时间分批清理过期任务"""
+        updated_at = datetime.utcnow().isoformat()
+        for i in range(5):
+            await self.store.put(f"done-{i}", "embedding_task",
+                                 {"task_id": f"done-{i}", "status": "completed", "updated_at": updated_at})
+            await self.store.put(f"wait-{i}", "embedding_task",
+                                 {"task_id": f"wait-{i}", "status": "pending", "updated_at": updated_at})
+        await asyncio.sleep(0.05)
+        now = time.time()
+        removed, reclaimed = [], 0
+        for _ in range(20):
+            result = await self.store.expire({"completed": now}, now - 3600, limit=3)
+            removed += result["task_ids"]
+            reclaimed += result["bytes"]
+            if result["done"]:
+                break
+        self.assertEqual(sorted(removed), [f"done-{i}" for i in range(5)])
+        self.assertGreater(reclaimed, 0)
+        self.assertIsNone(await self.store.get("done-0"))
+        self.assertEqual((await self.store.get("wait-0"))["status"], "pending")
+
+    async def test_update_missing_task(self):
+        """测试更新不存在的任务"""
+        self.assertFalse(await self.store.update("missing", {"status": "failed"}))
+
+    async def test_concurrent_writes(self):
+        """测试并发写入后所有任务都能读到"""
+        model = EmbeddingTask(store=self.store)
+        await asyncio.gather(*[model.create(f"task-{i}", {"text": str(i)}) for i in range(50)])
+        await asyncio.gather(*[model.update(f"task-{i}", {"status": "completed"}) for i in range(0, 50, 2)])
+        for i in range(50):
+            task = await model.get(f"task-{i}")
+            self.assertEqual(task["text"], str(i))
+            self.assertEqual(task["status"], "completed" if i % 2 == 0 else "pending")
+
+
+class TestSQLiteTaskStore(TaskStoreTests, unittest.IsolatedAsyncioTestCase):
+    def create_store(self):
+        return SQLiteTaskStore(os.path.join(self.tmp_dir.name, "tasks.db"))
+
+    async def test_reopen(self):
+        """测试关闭后重新打开数据库，已提交的任务仍然存在"""
+        await self.store.put("task-1", "embedding_task", {"task_id": "task-1", "status": "pending"})
+        self.store.close()
+        self.store = self.create_store()
+        self.assertEqual((await self.store.get("task-1"))["status"], "pending")
+
+
+class TestJsonFileTaskStore(TaskStoreTests, unittest.IsolatedAsyncioTestCase):
+    def create_store(self):
+        return JsonFileTaskStore(self.tmp_dir.name)
+
+    async def test_concurrent_updates_same_task(self):
+        """测试并发修改同一任务时不丢失更新，也不残留临时文件"""
+        await self.store.put("task-1", "embedding_task", {"task_id": "task-1"})
+        await asyncio.gather(*[self.store.update("task-1", {f"key-{i}": i}) for i in range(20)])
+        task = await self.store.get("task-1")
+        self.assertEqual([task[f"key-{i}"] for i in range(20)], list(range(20)))
+        self.assertEqual([path.name for path in self.store.data_dir.rglob("*.json")], ["task-1.json"])
+        self.assertEqual(list(self.store.data_dir.rglob(".*.tmp")), [])
+
+    async def test_sharded_layout_and_legacy_files(self):
+        """测试任务文件按哈希前缀分目录保存，并兼容旧的平铺文件"""
+        await self.store.put("task-1", "embedding_task", {"task_id": "task-1"})
+        path = self.store._get_file_path("task-1")
+        self.assertEqual(len(path.relative_to(self.store.data_dir).parts), 3)
+        self.assertTrue(path.exists())
+
+        legacy_path = self.store._get_legacy_path("task-2")
+        legacy_path.write_text('{"task_id": "task-2", "status": "pending"}', encoding="utf-8")
+        self.assertEqual((await self.store.get("task-2"))["status"], "pending")
+        self.assertTrue(await self.store.update("task-2", {"status": "completed"}))
+        self.assertFalse(legacy_path.exists())
+        self.assertEqual((await self.store.get("task-2"))["status"], "completed")
+
+
+class TestCachedTaskStore(TaskStoreTests, unittest.IsolatedAsyncioTestCase):
+    def create_store(self):
+        self.backend = SQLiteTaskStore(os.path.join(self.tmp_dir.name, "tasks.db"))
+        return CachedTaskStore(self.backend, max_size=4, ttl=60)
+
+    async def asyncTearDown(self):
+        await self.store.flush()
+
+    async def test_write_behind(self):
+        """测试新任务直接写入底层存储，之后的修改先进入缓存再批量写入"""
+        model = EmbeddingTask(store=self.store)
+        await model.create("task-1", {"text": "a"})
+        self.assertEqual((await self.backend.get("task-1"))["status"], "pending")
+        await model.update("task-1", {"status": "processing"})
+        self.assertEqual((await self.backend.get("task-1"))["status"], "pending")
+        self.assertEqual((await model.get("task-1"))["status"], "processing")
+
+        await self.store.flush()
+        self.assertEqual((await self.backend.get("task-1"))["status"], "processing")
+        self.assertEqual(self.store.get_stats()["flushed_writes"], 1)
+
+        await model.delete("task-1")
+        self.assertIsNone(await model.get("task-1"))
+        await self.store.flush()
+        self.assertIsNone(await self.backend.get("task-1"))
+
+    async def test_shared_queue_disables_cache(self):
+        """测试共享队列后端下不使用任务缓存"""
+        with mock.patch.dict(os.environ, {"QUEUE_BACKEND": "sqlite", "TASK_STORE": "sqlite", "TASK_STORE_PATH":
+                                          os.path.join(self.tmp_dir.name, "shared.db")}):
+            store = create_task_store()
+        try:
+            self.assertIsInstance(store, SQLiteTaskStore)
+        finally:
+            store.close()
+
+    async def test_lru_eviction_keeps_dirty(self):
+        """测试超过容量时只淘汰已写入的数据"""
+        for i in range(6):
+            await self.store.put(f"task-{i}", "embedding_task", {"task_id": f"task-{i}"})
+            await self.store.update(f"task-{i}", {"status": "processing"})
+        self.assertEqual(len(self.store.cache), 6)
+        await self.store.flush()
+        self.assertEqual(list(self.store.cache), ["task-2", "task-3", "task-4", "task-5"])
+        misses = self.store.get_stats()["misses"]
+        self.assertEqual((await self.store.get("task-0"))["task_id"], "task-0")
+        self.assertEqual(self.store.get_stats()["misses"], misses + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
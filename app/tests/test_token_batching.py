@@ -0,0 +1,37 @@
+import unittest
+from app.utils.token_batching import TokenBatcher
+
+
+class TestTokenBatcher(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.batcher = TokenBatcher("test", max_tokens=1024)
+
+    def test_plan_under_token_budget(self):
+        """测试按长度排序分批，每批填充后的token数不超过上限"""
+        lengths = [500, 10, 12, 480, 11, 9, 300]
+        batches = self.batcher.plan(lengths, max_batch_size=4)
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(lengths))))
+        for batch in batches:
+            self.assertLessEqual(len(batch), 4)
+            self.assertLessEqual(len(batch) * max(lengths[i] for i in batch), 1024)
+        self.assertEqual(sorted(batches[0]), [1, 2, 4, 5])
+
+    def test_single_long_input(self):
+        """测试超过上限的单个输入单独成批"""
+        self.assertEqual(self.batcher.plan([4096, 8], max_batch_size=8), [[1], [0]])
+
+    def test_run_restores_order(self):
+        """测试结果按原始顺序返回，并统计填充比例"""
+        lengths = [400, 5, 300, 5]
+        results = self.batcher.run(lengths, lambda batch: [lengths[i] * 2 for i in batch], max_batch_size=2)
+        self.assertEqual(results, [800, 10, 600, 10])
+        stats = self.batcher.stats()
+        self.assertEqual((stats["items"], stats["tokens"]), (4, 710))
+        # [5, 5] 和 [300, 400] 两批，300的文本填充到400
+        self.assertEqual(stats["padded_tokens"], 5 * 2 + 400 * 2)
+        self.assertAlmostEqual(stats["padding_ratio"], 100 / 810)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import base64
+import unittest
+import numpy as np
+from app.utils.vector_codec import (convert_chunks, decode_matrix, decode_octet_stream, decode_result, decode_vector,
+                                    dequantize, encode_callback, encode_vector, format_chunks, format_matrix, format_vector, pack_vector,
+                                    truncate_dimensions, validate_formats)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class TestVectorCodec(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.vector = np.array([0.25, -1.5, 3.0, 0.1], dtype=np.float32)
+
+    def test_round_trip(self):
+        """测试float32无损、float16近似还原"""
+        self.assertEqual(decode_vector(encode_vector(self.vector, "float32"), "float32"), self.vector.tolist())
+        restored = decode_vector(encode_vector(self.vector, "float16"), "float16")
+        np.testing.assert_allclose(restored, self.vector, rtol=1e-3)
+        self.assertEqual(len(pack_vector(self.vector, "float32")), 16)
+        self.assertEqual(len(pack_vector(self.vector, "float16")), 8)
+
+    def test_format_vector(self):
+        """测试按格式生成结果字段"""
+        self.assertEqual(format_vector(self.vector, "list"), {"embedding": self.vector.tolist()})
+        result = format_vector(self.vector, "float16")
+        self.assertEqual(result["embedding_format"], "float16")
+        self.assertEqual(result["dimensions"], 4)
+
+    def test_matrix_round_trip(self):
+        """测试批量结果矩阵按行打包后还原"""
+        matrix = np.arange(12, dtype=np.float32).reshape(3, 4)
+        result = format_matrix(matrix, "float16")
+        self.assertEqual((result["count"], result["dimensions"]), (3, 4))
+        restored = decode_matrix(result["embeddings"], "float16", result["dimensions"])
+        np.testing.assert_array_equal(restored, matrix)
+        self.assertEqual(format_matrix(matrix, "list")["embeddings"], matrix.tolist())
+
+        body, headers = encode_callback({"task_id": "t1", **result}, "octet-stream")
+        meta, data = decode_octet_stream(body)
+        self.assertEqual(data, pack_vector(matrix, "float16"))
+        self.assertEqual(meta["count"], 3)
+
+    def test_quantized_formats(self):
+        """测试int8按向量标量量化、binary按符号位打包"""
+        result = format_vector(self.vector, "int8")
+        self.assertEqual(len(base64.b64decode(result["embedding"])), 4)
+        np.testing.assert_allclose(decode_result(result), self.vector, atol=result["scale"])
+
+        result = format_vector(self.vector, "binary")
+        self.assertEqual(len(base64.b64decode(result["embedding"])), 1)
+        self.assertEqual(decode_result(result), [1.0, -1.0, 1.0, 1.0])
+
+        matrix = np.random.randn(5, 19).astype(np.float32)
+        for vector_format in ("int8", "binary"):
+            result = format_matrix(matrix, vector_format)
+            restored = decode_matrix(result["embeddings"], vector_format, result["dimensions"], result.get("scales"))
+            self.assertEqual(restored.shape, (5, 19))
+        np.testing.assert_array_equal(restored, np.where(matrix > 0, 1, -1))
+
+    def test_truncate_dimensions(self):
+        """测试截取前几维后重新归一化"""
+        truncated = truncate_dimensions(np.array([[3.0, 4.0, 12.0], [0.0, 0.0, 1.0]]), 2)
+        np.testing.assert_allclose(truncated, [[0.6, 0.8], [0.0, 0.0]])
+        self.assertEqual(truncate_dimensions(self.vector, None).tolist(), self.vector.tolist())
+
+    def test_chunks_round_trip(self):
+        """测试长文本分块结果保存为二进制后转换为其他格式"""
+        spans = [(0, 500, 510), (400, 900, 420)]
+        matrix = np.arange(8, dtype=np.float32).reshape(2, 4)
+        stored = format_chunks(spans, matrix, "float32")
+        self.assertEqual((stored[1]["start"], stored[1]["end"], stored[1]["tokens"]), (400, 900, 420))
+        chunks = convert_chunks(stored, "list")
+        self.assertEqual([chunk["embedding"] for chunk in chunks], matrix.tolist())
+
+    def test_validate_formats(self):
+        """测试格式协商校验"""
+        self.assertEqual(validate_formats(None, None), ("list", "json"))
+        with self.assertRaises(ValueError):
+            validate_formats("float64", "json")
+        with self.assertRaises(ValueError):
+            validate_formats("list", "octet-stream")
+
+    def test_octet_stream_callback(self):
+        """测试octet-stream回调：请求体为 元数据长度 + 元数据JSON + 向量原始字节"""
+        payload = {"task_id": "t1", "status": "completed", **format_vector(self.vector, "float32")}
+        body, headers = encode_callback(payload, "octet-stream")
+        self.assertEqual(headers, {"Content-Type": "application/octet-stream"})
+        meta, data = decode_octet_stream(body)
+        self.assertEqual(data, pack_vector(self.vector, "float32"))
+        self.assertEqual(meta, {"task_id": "t1", "status": "completed", "embedding_format": "float32", "dimensions": 4})
+        with self.assertRaises(ValueError):
+            decode_octet_stream(body[:10])
+
+    def test_octet_stream_large_metadata(self):
+        """测试int8批量结果的scales等大体积元数据放在请求体中，请求头大小不随批次增长"""
+        matrix = np.random.default_rng(0).standard_normal((1000, 64)).astype(np.float32)
+        payload = {"task_id": "t1", "status": "completed", **format_matrix(matrix, "int8")}
+        body, headers = encode_callback(payload, "octet-stream")
+        self.assertLess(sum(len(k) + len(v) for k, v in headers.items()), 256)
+        meta, data = decode_octet_stream(body)
+        self.assertEqual(len(meta["scales"]), 1000)
+        restored = dequantize(data, "int8", meta["dimensions"], meta["scales"])
+        self.assertEqual(restored.shape, (1000, 64))
+
+    @unittest.skipIf(msgpack is None, "需要安装msgpack")
+    def test_msgpack_callback(self):
+        """测试msgpack回调中的向量为原始字节"""
+        payload = {"task_id": "t1", "status": "completed", **format_vector(self.vector, "float16")}
+        body, headers = encode_callback(payload, "msgpack")
+        data = msgpack.unpackb(body, raw=False)
+        self.assertEqual(headers["Content-Type"], "application/msgpack")
+        self.assertEqual(data["embedding"], base64.b64decode(payload["embedding"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
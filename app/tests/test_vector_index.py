@@ -0,0 +1,122 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from app.services.vector_index import VectorCollection, VectorIndex
+
+
+class TestVectorCollection(unittest.TestCase):
+    def setUp(self):
+        """测试前的准备工作"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "docs"
+        self.rng = np.random.default_rng(42)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.tmp.cleanup()
+
+    def test_add_upsert_delete_search(self):
+        """测试写入、覆盖、删除后精确检索的结果"""
+        collection = VectorCollection("docs", self.path, dimensions=3)
+        collection.add(["a", "b", "c"], [[1, 0, 0], [0, 1, 0], [0, 0, 1]], metadata=[{"n": 1}, {"n": 2}, {"n": 3}])
+        self.assertEqual(collection.add(["a", "d"], [[0, 1, 0.1], [1, 0, 0]]), {"added": 1, "updated": 1})
+        with self.assertRaises(ValueError):
+            collection.add(["b"], [[1, 1, 1]], upsert=False)
+
+        results = collection.search([[0, 1, 0]], top_k=2)[0]
+        self.assertEqual([r["id"] for r in results], ["b", "a"])
+        self.assertEqual(results[0]["metadata"], {"n": 2})
+
+        self.assertEqual(collection.delete(["b", "missing"]), 1)
+        self.assertEqual(collection.count, 3)
+        self.assertEqual(collection.search([[0, 0, 1]], top_k=1)[0][0]["id"], "c")
+        self.assertEqual([r["id"] for r in collection.search([[0, 1, 0]], top_k=3)[0]][0], "a")
+        collection.close()
+
+        # 重新加载后ID、行号和向量保持一致
+        collection = VectorCollection("docs", self.path)
+        self.assertEqual(collection.count, 3)
+        self.assertEqual(sorted(collection.rows), ["a", "c", "d"])
+        self.assertEqual(collection.search([[0, 0, 1]], top_k=1)[0][0]["id"], "c")
+        collection.close()
+
+    def test_ivf_recall(self):
+        """测试IVF检索与精确检索的召回一致性"""
+        vectors = self.rng.standard_normal((3000, 16)).astype(np.float32)
+        collection = VectorCollection("docs", self.path, dimensions=16, metric="l2")
+        collection.add([str(i) for i in range(len(vectors))], vectors)
+        queries = vectors[:20] + 0.01
+        exact = collection.search(queries, top_k=10, mode="exact")
+        approx = collection.search(queries, top_k=10, mode="ivf", nprobe=16)
+        recall = np.mean([len({r["id"] for r in e} & {r["id"] for r in a}) / 10 for e, a in zip(exact, approx)])
+        self.assertGreaterEqual(recall, 0.8)
+        self.assertEqual([r["id"] for r in exact[0]][0], "0")
+        collection.close()
+
+    def test_ivf_trained_in_background(self):
+        """测试写入达到阈值后在后台训练IVF，训练期间的写入不被阻塞且重新分配列表"""
+        vectors = self.rng.standard_normal((3000, 16)).astype(np.float32)
+        collection = VectorCollection("docs", self.path, dimensions=16, metric="l2")
+        collection.ivf_threshold = 1000
+        blocked = []
+        train = collection._nearest_centroids
+
+        def nearest(batch, centroids=None):
+            # k-means进行中时从另一个线程写入和删除，集合锁不应被训练占用
+            if centroids is not None and not blocked:
+                writer = threading.Thread(target=lambda: (collection.add(["new"], vectors[:1] + 5),
+                                                          collection.delete(["0"])))
+                writer.start()
+                writer.join(timeout=5)
+                blocked.append(writer.is_alive())
+            return train(batch, centroids)
+
+        with mock.patch.object(collection, "train_in_background"):
+            collection.add([str(i) for i in range(len(vectors))], vectors)
+        self.assertIsNone(collection.centroids)
+        # 未训练时auto检索回退为精确检索并安排后台训练
+        with mock.patch.object(collection, "train_in_background") as scheduled:
+            self.assertEqual(collection.search(vectors[5:6], top_k=1)[0][0]["id"], "5")
+            scheduled.assert_called_once()
+
+        with mock.patch.object(collection, "_nearest_centroids", side_effect=nearest):
+            self.assertTrue(collection.train_ivf())
+        self.assertEqual(blocked, [False])
+        self.assertEqual(collection.trained_count, collection.count)
+        expected = train(np.asarray(collection.vectors[:collection.count]))
+        np.testing.assert_array_equal(collection.assign[:collection.count], expected)
+        self.assertEqual(collection.search(vectors[:1] + 5, top_k=1, mode="ivf", nprobe=4)[0][0]["id"], "new")
+        collection.close()
+
+    def test_invalid_search_parameters(self):
+        """测试不合法的nprobe、top_k和查询向量"""
+        collection = VectorCollection("docs", self.path, dimensions=3)
+        collection.add(["a"], [[1, 0, 0]])
+        for kwargs in ({"nprobe": 0}, {"nprobe": "8"}, {"nprobe": True}, {"top_k": 0}):
+            with self.assertRaises(ValueError):
+                collection.search([[1, 0, 0]], mode="ivf", **kwargs)
+        with self.assertRaises(ValueError):
+            collection.search([[{"x": 1}, 0, 0]])
+        collection.close()
+
+
+class TestVectorIndex(unittest.TestCase):
+    def test_single_writer(self):
+        """测试同一索引目录只允许一个实例（进程）使用"""
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict("os.environ", {"VECTOR_INDEX_DIR": tmp}):
+            first, second = VectorIndex(), VectorIndex()
+            first.get("docs", dimensions=3)
+            with self.assertRaises(RuntimeError):
+                second.get("docs")
+            with self.assertRaises(RuntimeError):
+                second.drop("docs")
+            first.close()
+            self.assertIsNotNone(second.get("docs"))
+            second.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import aiohttp
+from dotenv import load_dotenv
+from app.utils.logger import logger
+from app.utils.vector_codec import encode_callback
+
+load_dotenv()
+
+
+class CallbackJob:
+    """一次待发送的回调"""
+
+    def __init__(self, handle: str, payload: Dict[str, Any],
+                 on_delivered: Optional[Callable[[], Awaitable[Any]]] = None, callback_format: str = "json"):
+        self.handle = handle
+        self.payload = payload
+        self.on_delivered = on_delivered
+        self.callback_format = callback_format
+        self.attempts = 0
+
+
+class CallbackDispatcher:
+    """回调分发器
+
+    推理工作协程只负责把回调放入分发队列，由独立的发送协程负责投递：
+
+    - 共享的aiohttp会话，按主机保持长连接（CALLBACK_LIMIT_PER_HOST）
+    - 并发发送数有上限（CALLBACK_CONCURRENCY）
+    - 网络错误、超时、5xx和429按指数退避重试（CALLBACK_MAX_RETRIES、CALLBACK_BACKOFF_BASE、CALLBACK_BACKOFF_MAX）
+    - 重试后仍失败或不可重试的回调写入死信文件（CALLBACK_DEAD_LETTER_PATH），每行一个JSON
+    - 回调数据按请求协商的格式编码（json、msgpack 或 octet-stream），见 vector_codec.encode_callback
+    """
+
+    def __init__(self):
+        self.concurrency = int(os.getenv("CALLBACK_CONCURRENCY", 16))
+        self.limit_per_host = int(os.getenv("CALLBACK_LIMIT_PER_HOST", 8))
+        self.timeout = float(os.getenv("CALLBACK_TIMEOUT", 30))
+        self.max_retries = int(os.getenv("CALLBACK_MAX_RETRIES", 5))
+        self.backoff_base = float(os.getenv("CALLBACK_BACKOFF_BASE", 1))
+        self.backoff_max = float(os.getenv("CALLBACK_BACKOFF_MAX", 60))
+        self.queue_size = int(os.getenv("CALLBACK_QUEUE_SIZE", 10000))
+        self.dead_letter_path = Path(os.getenv("CALLBACK_DEAD_LETTER_PATH", "data/callbacks/dead_letter.jsonl"))
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.senders: List[asyncio.Task] = []
+        # 等待退避后重新入队的回调
+        self.retrying: Dict[asyncio.Task, CallbackJob] = {}
+        self.stats = {"delivered": 0, "retried": 0, "dead_lettered": 0}
+
+    def _start(self) -> None:
+        """在事件循环内创建会话和发送协程"""
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.limit_per_host,
+                                         keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.senders = [asyncio.create_task(self._sender(i)) for i in range(self.concurrency)]
+        logger.info(f"回调分发器启动, 并发数: {self.concurrency}, 每主机连接数: {self.limit_per_host}")
+
+    async def dispatch(self, handle: str, payload: Dict[str, Any],
+                       on_delivered: Optional[Callable[[], Awaitable[Any]]] = None,
+                       callback_format: str = "json") -> None:
+        """提交回调，立即返回，不等待投递结果
+
+        Args:
+            handle: 回调地址
+            payload: 回调数据（可JSON序列化，二进制向量以base64字符串保存）
+            on_delivered: 投递成功后执行的协程函数
+            callback_format: 回调格式，json、msgpack 或 octet-stream
+        """
+        if self.session is None:
+            self._start()
+        await self.queue.put(CallbackJob(handle, payload, on_delivered, callback_format))
+
+    async def _sender(self, sender_id: int) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._deliver(job)
+            except Exception as e:
+                logger.error(f"回调发送协程 {sender_id} 处理回调时发生错误: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, job: CallbackJob) -> None:
+        """发送一次回调，失败时安排重试或写入死信"""
+        job.attempts += 1
+        task_id = job.payload.get("task_id")
+        try:
+            body, headers = encode_callback(job.payload, job.callback_format)
+        except Exception as e:
+            await self._dead_letter(job, f"回调数据编码失败: {str(e)}")
+            return
+        try:
+            async with self.session.post(job.handle, data=body, headers=headers) as response:
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error, retryable = f"{type(e).__name__}: {str(e)}", True
+        else:
+            if 200 <= status < 300:
+                logger.info(f"返回结果到接口 {job.handle} 成功, 任务: {task_id}")
+                self.stats["delivered"] += 1
+                if job.on_delivered:
+                    await job.on_delivered()
+                return
+            error, retryable = f"HTTP {status}", status >= 500 or status in (408, 429)
+
+        logger.error(f"返回结果到接口 {job.handle} 失败: {error}, 任务: {task_id}, 第 {job.attempts} 次")
+        if retryable and job.attempts <= self.max_retries:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (job.attempts - 1))
+            retry = asyncio.create_task(self._retry_later(job, delay))
+            self.retrying[retry] = job
+            retry.add_done_callback(lambda task: self.retrying.pop(task, None))
+            self.stats["retried"] += 1
+        else:
+            await self._dead_letter(job, error)
+
+    async def _retry_later(self, job: CallbackJob, delay: float) -> None:
+        """退避等待后重新放入分发队列，等待期间不占用发送协程"""
+        await asyncio.sleep(delay)
+        await self.queue.put(job)
+
+    async def _dead_letter(self, job: CallbackJob, error: str) -> None:
+        """将最终失败的回调写入死信文件"""
+        record = {
+            "handle": job.handle,
+            "payload": job.payload,
+            "format": job.callback_format,
+            "error": error,
+            "attempts": job.attempts,
+            "failed_at": time.time()
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+
+        def append():
+            self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+        await asyncio.to_thread(append)
+        self.stats["dead_lettered"] += 1
+        logger.error(f"回调写入死信: 任务 {job.payload.get('task_id')}, 地址 {job.handle}, 原因: {error}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取回调投递统计"""
+        return {
+            **self.stats,
+            "pending": self.queue.qsize() if self.queue else 0,
+            "retrying": len(self.retrying)
+        }
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """停止分发器
+
+        在超时时间内等待队列中和退避等待中的回调发送完；超时后仍未发送的回调写入死信。
+        """
+        if self.session is None:
+            return
+        timeout = timeout if timeout is not None else float(os.getenv("SHUTDOWN_GRACE_SECONDS", 30))
+
+        async def drain():
+            while True:
+                await self.queue.join()
+                if not self.retrying:
+                    return
+                await asyncio.wait(list(self.retrying))
+
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"回调分发器停止时仍有 {self.queue.qsize()} 个回调未发送")
+        pending = list(self.retrying.values())
+        for task in list(self.retrying) + self.senders:
+            task.cancel()
+        await asyncio.gather(*self.retrying, *self.senders, return_exceptions=True)
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for job in pending:
+            await self._dead_letter(job, "服务停止时未发送")
+        await self.session.close()
+        self.session = None
+        logger.info("回调分发器已停止")
+
+
+# 创建全局回调分发器实例
+callback_dispatcher = CallbackDispatcher()
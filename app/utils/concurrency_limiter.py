@@ -0,0 +1,42 @@
+import os
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class ConcurrencyLimiter:
+    """非阻塞的并发限制器
+
+    用于同步接口：并发数达到上限时立即拒绝请求，而不是排队等待。
+    上限通过环境变量 SYNC_{NAME}_CONCURRENCY 配置，默认 4。
+    """
+
+    def __init__(self, name: str, limit: Optional[int] = None):
+        self.name = name
+        self.limit = limit or int(os.getenv(f"SYNC_{name.upper()}_CONCURRENCY", 4))
+        self.active = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        """尝试占用一个并发名额，已满时返回False"""
+        if self.active >= self.limit:
+            self.rejected += 1
+            return False
+        self.active += 1
+        self.accepted += 1
+        return True
+
+    def release(self) -> None:
+        """释放并发名额"""
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """获取并发使用情况"""
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "accepted": self.accepted,
+            "rejected": self.rejected
+        }
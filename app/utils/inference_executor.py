@@ -0,0 +1,83 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from dotenv import load_dotenv
+from app.utils.logger import logger
+
+load_dotenv()
+
+# 进程池模式下，每个子进程内持有的服务实例
+_process_service = None
+
+
+def _init_process_service(factory: Callable[[], Any]) -> None:
+    """子进程初始化函数：在子进程内构建服务实例（加载模型）"""
+    global _process_service
+    _process_service = factory()
+
+
+def _call_process_service(method: str, *args, **kwargs) -> Any:
+    """在子进程内调用服务实例的同步方法"""
+    return getattr(_process_service, method)(*args, **kwargs)
+
+
+class InferenceExecutor:
+    """模型推理执行器
+
+    将同步的模型推理放到有界线程池或进程池中执行，避免阻塞事件循环。
+    每个服务使用独立的执行器，通过环境变量配置：
+
+        {NAME}_EXECUTOR          thread 或 process，默认 thread
+        {NAME}_EXECUTOR_WORKERS  执行器并发数，默认 1
+    """
+
+    def __init__(self, name: str, factory: Optional[Callable[[], Any]] = None,
+                 kind: Optional[str] = None, max_workers: Optional[int] = None):
+        """
+        Args:
+            name: 执行器名称，同时作为环境变量前缀
+            factory: 进程池模式下在子进程内构建服务实例的可调用对象（需可pickle）
+            kind: thread 或 process，为None时读取环境变量
+            max_workers: 并发数，为None时读取环境变量
+        """
+        prefix = name.upper()
+        self.name = name
+        self.kind = (kind or os.getenv(f"{prefix}_EXECUTOR", "thread")).lower()
+        self.max_workers = max_workers or int(os.getenv(f"{prefix}_EXECUTOR_WORKERS", 1))
+        if self.kind == "process" and factory is None:
+            logger.warning(f"{name} 执行器未提供服务构建函数，改用线程池")
+            self.kind = "thread"
+        self._executor = self._create_executor(factory)
+        logger.info(f"{name} 推理执行器创建完成, 类型: {self.kind}, 并发数: {self.max_workers}")
+
+    def _create_executor(self, factory: Optional[Callable[[], Any]]) -> Executor:
+        if self.kind == "process":
+            # 使用spawn避免fork已初始化的torch/paddle运行时
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_service,
+                initargs=(factory,)
+            )
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{self.name}-inference")
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在执行器中运行同步函数并等待结果"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def call(self, service: Any, method: str, *args, **kwargs) -> Any:
+        """调用服务的同步方法
+
+        线程池模式下直接调用当前实例的方法；进程池模式下调用子进程内实例的同名方法。
+        """
+        if self.kind == "process":
+            return await self.run(_call_process_service, method, *args, **kwargs)
+        return await self.run(getattr(service, method), *args, **kwargs)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """关闭执行器"""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,65 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class MicroBatcher:
+    """微批处理器
+
+    从队列中收集同类型的待处理任务，凑满最大批大小或等待超过最大时长后，
+    将这一批任务交给模型一次性处理。通过环境变量配置：
+
+        {NAME}_BATCH_SIZE     最大批大小，默认 32
+        {NAME}_BATCH_WAIT_MS  收集批次的最长等待时间（毫秒），默认 10
+    """
+
+    def __init__(self, name: str, max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None):
+        prefix = name.upper()
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size or int(os.getenv(f"{prefix}_BATCH_SIZE", 32)))
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else float(os.getenv(f"{prefix}_BATCH_WAIT_MS", 10))
+        # 实际批大小分布：批大小 -> 批次数
+        self.histogram: Dict[int, int] = {}
+        self.batches = 0
+        self.items = 0
+
+    async def collect(self, first: Any, fetch: Callable[[float], Awaitable[Optional[Any]]]) -> List[Any]:
+        """以first为首收集一个批次
+
+        Args:
+            first: 已取到的第一个任务
+            fetch: 获取下一个任务的协程函数，参数为最长等待秒数，超时返回None
+
+        Returns:
+            List[Any]: 本批次的任务列表
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_ms / 1000
+        batch = [first]
+        while len(batch) < self.max_batch_size:
+            item = await fetch(max(0.0, deadline - loop.time()))
+            if item is None:
+                break
+            batch.append(item)
+        self.record(len(batch))
+        return batch
+
+    def record(self, batch_size: int) -> None:
+        """记录一次实际的批大小"""
+        self.histogram[batch_size] = self.histogram.get(batch_size, 0) + 1
+        self.batches += 1
+        self.items += batch_size
+
+    def stats(self) -> Dict[str, Any]:
+        """获取批处理配置和批大小统计"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": self.batches,
+            "tasks": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "histogram": dict(sorted(self.histogram.items()))
+        }
@@ -0,0 +1,223 @@
+import gc
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+from dotenv import load_dotenv
+from app.utils.logger import logger
+
+load_dotenv()
+
+
+def _resident_bytes() -> int:
+    """当前进程的常驻内存字节数，无法获取时返回0"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+def _parameter_bytes(model: Any) -> int:
+    """torch模型的参数和缓冲区字节数（GPU上的模型不计入常驻内存），元组和列表逐项累加"""
+    if isinstance(model, (tuple, list)):
+        return sum(_parameter_bytes(item) for item in model)
+    if not hasattr(model, "parameters") or not hasattr(model, "buffers"):
+        return 0
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return 0
+
+
+class ModelEntry:
+    """一个已注册的模型"""
+
+    def __init__(self, name: str, loader: Callable[[], Any], size_mb: Optional[float] = None):
+        self.name = name
+        self.loader = loader
+        self.size_mb = size_mb
+        self.model: Any = None
+        self.size_bytes = 0
+        self.in_use = 0
+        self.last_used = 0.0
+        self.loads = 0
+        self.evictions = 0
+        # 同一模型的加载串行化，不同模型可以并行加载
+        self.load_lock = threading.Lock()
+
+
+class ModelRegistry:
+    """进程内共享的模型注册表
+
+    各服务按名称注册模型的加载函数，模型在第一次使用时才加载，同一进程内只加载一次，
+    所有使用方共享同一个实例。推理期间通过 use() 持有模型，持有中的模型不会被卸载。
+
+    已加载模型的总内存超过 MODEL_MEMORY_BUDGET_MB（0为不限制）时，按最近最少使用的顺序卸载空闲模型，
+    最近使用的模型始终保留，单个模型超过预算时不会反复加载卸载。
+    模型内存按加载前后常驻内存的增量与torch参数字节数的较大值估计，也可在注册时直接给出。
+    进程池模式下每个子进程有各自的注册表。
+    """
+
+    def __init__(self, budget_mb: Optional[float] = None):
+        """
+        Args:
+            budget_mb: 已加载模型的内存预算（MB），为None时读取环境变量
+        """
+        if budget_mb is None:
+            budget_mb = float(os.getenv("MODEL_MEMORY_BUDGET_MB", 0))
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.entries: Dict[str, ModelEntry] = {}
+        # 已加载的模型，按最近使用时间从旧到新排列
+        self.loaded: "OrderedDict[str, ModelEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any], size_mb: Optional[float] = None) -> None:
+        """注册模型的加载函数，已注册的名称不重复注册
+
+        Args:
+            name: 模型名称
+            loader: 加载并返回模型的函数
+            size_mb: 模型占用的内存（MB），为None时在加载时估计
+        """
+        with self._lock:
+            if name not in self.entries:
+                self.entries[name] = ModelEntry(name, loader, size_mb)
+
+    def _entry(self, name: str) -> ModelEntry:
+        entry = self.entries.get(name)
+        if entry is None:
+            raise KeyError(f"模型 {name} 未注册")
+        return entry
+
+    def _load(self, entry: ModelEntry) -> Any:
+        """加载模型（调用方持有entry.load_lock）"""
+        logger.info(f"模型注册表加载模型: {entry.name}")
+        start = time.perf_counter()
+        resident = _resident_bytes()
+        model = entry.loader()
+        if entry.size_mb is not None:
+            size = int(entry.size_mb * 1024 * 1024)
+        else:
+            size = max(_resident_bytes() - resident, _parameter_bytes(model), 0)
+        with self._lock:
+            entry.model = model
+            entry.size_bytes = size
+            entry.loads += 1
+            self.loaded[entry.name] = entry
+        logger.info(f"模型注册表加载完成: {entry.name}, 内存: {size / 1024 / 1024:.1f} MB, "
+                    f"耗时: {time.perf_counter() - start:.1f} 秒")
+        return model
+
+    def get(self, name: str) -> Any:
+        """获取模型，未加载时先加载
+
+        不持有模型，推理期间应使用 use() 防止模型被卸载。
+        """
+        entry = self._entry(name)
+        with self._lock:
+            if entry.model is not None:
+                entry.last_used = time.monotonic()
+                self.loaded.move_to_end(name)
+                return entry.model
+        with entry.load_lock:
+            model = entry.model
+            if model is None:
+                model = self._load(entry)
+        with self._lock:
+            entry.last_used = time.monotonic()
+            if name in self.loaded:
+                self.loaded.move_to_end(name)
+        return model
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[Any]:
+        """持有模型直到退出上下文，期间模型不会被卸载，退出后按预算卸载空闲模型"""
+        entry = self._entry(name)
+        with self._lock:
+            entry.in_use += 1
+        try:
+            model = self.get(name)
+            self._enforce_budget()
+            yield model
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+            self._enforce_budget()
+
+    def _enforce_budget(self) -> None:
+        """已加载模型的总内存超过预算时，从最久未使用的空闲模型开始卸载"""
+        if self.budget_bytes <= 0:
+            return
+        evicted = []
+        with self._lock:
+            total = sum(entry.size_bytes for entry in self.loaded.values())
+            # 最近使用的模型不参与卸载
+            for name, entry in list(self.loaded.items())[:-1]:
+                if total <= self.budget_bytes:
+                    break
+                if entry.in_use:
+                    continue
+                total -= entry.size_bytes
+                self._unload(entry)
+                evicted.append(name)
+        if evicted:
+            self._release_memory()
+            logger.info(f"模型注册表超出内存预算，已卸载: {', '.join(evicted)}")
+
+    def _unload(self, entry: ModelEntry) -> None:
+        """卸载模型（调用方持有self._lock）"""
+        entry.model = None
+        entry.size_bytes = 0
+        entry.evictions += 1
+        self.loaded.pop(entry.name, None)
+
+    @staticmethod
+    def _release_memory() -> None:
+        """回收被卸载模型的内存，已使用torch时同时释放显存缓存"""
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def evict(self, name: str) -> bool:
+        """卸载指定的空闲模型
+
+        Returns:
+            bool: 是否卸载，模型未加载或正在使用时返回False
+        """
+        entry = self._entry(name)
+        with self._lock:
+            if entry.model is None or entry.in_use:
+                return False
+            self._unload(entry)
+        self._release_memory()
+        logger.info(f"模型注册表已卸载: {name}")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """获取各模型的加载状态和内存占用"""
+        with self._lock:
+            return {
+                "budget_mb": self.budget_bytes / 1024 / 1024,
+                "loaded_mb": sum(entry.size_bytes for entry in self.loaded.values()) / 1024 / 1024,
+                "models": {
+                    name: {
+                        "loaded": entry.model is not None,
+                        "size_mb": entry.size_bytes / 1024 / 1024,
+                        "in_use": entry.in_use,
+                        "loads": entry.loads,
+                        "evictions": entry.evictions
+                    }
+                    for name, entry in self.entries.items()
+                }
+            }
+
+
+# 全局模型注册表实例
+model_registry = ModelRegistry()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# 一行输入的解析结果：(行号, 解析后的对象, 错误信息)
+ParsedLine = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+async def read_ndjson_batches(chunks: AsyncIterator[bytes], batch_size: int,
+                              max_line_bytes: int) -> AsyncIterator[List[ParsedLine]]:
+    """把字节流按行解析为NDJSON对象，每batch_size行组成一批
+
+    只缓存当前未结束的一行和当前批次，内存占用与输入总大小无关。
+    无法解析或不是对象的行以错误信息返回，不中断整个流；超过max_line_bytes的行被丢弃并返回错误。
+    """
+    buffer = b""
+    batch: List[ParsedLine] = []
+    line_no = 0
+    skipping = False
+
+    def parse(line: bytes) -> ParsedLine:
+        try:
+            record = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            return line_no, None, f"无法解析的JSON: {str(e)}"
+        if not isinstance(record, dict):
+            return line_no, None, "每行必须是JSON对象"
+        return line_no, record, None
+
+    async for chunk in chunks:
+        buffer += chunk
+        while True:
+            end = buffer.find(b"\n")
+            if end < 0:
+                if len(buffer) > max_line_bytes and not skipping:
+                    # 超长行：丢弃到下一个换行为止
+                    line_no += 1
+                    batch.append((line_no, None, f"单行超过 {max_line_bytes} 字节"))
+                    skipping = True
+                if skipping:
+                    buffer = b""
+                break
+            line, buffer = buffer[:end], buffer[end + 1:]
+            if skipping:
+                skipping = False
+                continue
+            if not line.strip():
+                continue
+            line_no += 1
+            batch.append(parse(line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if buffer.strip() and not skipping:
+        line_no += 1
+        batch.append(parse(buffer))
+    if batch:
+        yield batch
+
+
+async def prefetch(batches: AsyncIterator[Any], depth: int) -> AsyncIterator[Any]:
+    """在后台提前读取最多depth个批次
+
+    当前批次处理（推理）的同时读取和解析后续输入；消费方变慢时队列填满，读取随之暂停，
+    输入端的背压由此传导到客户端。
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+    done = object()
+
+    async def produce():
+        try:
+            async for batch in batches:
+                await queue.put(batch)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+async def process_ndjson_stream(chunks: AsyncIterator[bytes], handler: Callable[[List[Dict[str, Any]]],
+                                Awaitable[List[Dict[str, Any]]]], batch_size: int, max_line_bytes: int,
+                                depth: int = 2) -> AsyncIterator[bytes]:
+    """逐批处理NDJSON输入并以NDJSON输出
+
+    Args:
+        chunks: 请求体字节流
+        handler: 处理一批有效记录，返回与记录一一对应的结果对象，包含error的结果会补上行号
+        batch_size: 每批的行数
+        max_line_bytes: 单行最大字节数
+        depth: 预读的批次数
+
+    Yields:
+        bytes: 每批的输出行，无效行和处理失败的行输出 {"line": 行号, "id": ..., "error": ...}
+    """
+    async for batch in prefetch(read_ndjson_batches(chunks, batch_size, max_line_bytes), depth):
+        valid = [(line_no, record) for line_no, record, error in batch if error is None]
+        results: Dict[int, Dict[str, Any]] = {}
+        for line_no, _, error in batch:
+            if error is not None:
+                results[line_no] = {"line": line_no, "error": error}
+        if valid:
+            try:
+                outputs = await handler([record for _, record in valid])
+                for (line_no, _), output in zip(valid, outputs):
+                    results[line_no] = {"line": line_no, **output} if "error" in output else output
+            except Exception as e:
+                for line_no, record in valid:
+                    results[line_no] = {"line": line_no, "id": record.get("id"), "error": str(e)}
+        yield "".join(json.dumps(results[line_no], ensure_ascii=False) + "\n"
+                      for line_no, _, _ in batch).encode("utf-8")
@@ -0,0 +1,276 @@
+import asyncio
+import os
+import socket
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.utils.logger import logger
+from app.utils.queue_journal import QueueJournal
+
+load_dotenv()
+
+# 队列通道：(任务类型, 优先级)
+Lane = Tuple[str, str]
+
+
+class QueueBackend:
+    """任务队列后端接口
+
+    后端负责保存排队中的任务并提供租约/确认语义：消费者租用（lease）任务后开始处理，
+    处理完成后确认（ack）；租约过期仍未确认的任务会被回收并重新入队。
+    """
+
+    # 是否可被多个进程共享，共享后端需要轮询其他进程入队的任务
+    shared = False
+
+    async def push(self, task_id: str, task_type: str, priority: str) -> None:
+        """任务入队"""
+        raise NotImplementedError
+
+    async def depths(self) -> Dict[Lane, int]:
+        """每个通道中排队的任务数"""
+        raise NotImplementedError
+
+    async def lease(self, lane: Lane, lease_seconds: float) -> Optional[str]:
+        """租用通道中最早入队的任务，通道为空时返回None"""
+        raise NotImplementedError
+
+    async def ack(self, task_id: str) -> None:
+        """确认任务处理完成"""
+        raise NotImplementedError
+
+    async def renew(self, task_ids: List[str], lease_seconds: float) -> None:
+        """续租正在处理的任务"""
+
+    async def reclaim_expired(self, max_attempts: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """回收上次运行遗留或租约过期的任务
+
+        Returns:
+            Tuple[List[Dict], List[Dict]]: 重新入队的任务和被放弃的任务
+        """
+        return [], []
+
+    def close(self) -> None:
+        """关闭后端，之后不再确认任务"""
+
+
+class MemoryQueueBackend(QueueBackend):
+    """进程内存队列后端，可选用队列日志持久化
+
+    只适用于单进程部署，任务在本进程的事件循环中租用和确认，不需要租约过期回收。
+    队列日志的写入（SQLite提交）在线程中执行，不阻塞事件循环；任务先写入日志再对消费者可见。
+    """
+
+    def __init__(self, journal: Optional[QueueJournal] = None):
+        self.lanes: Dict[Lane, Deque[str]] = {}
+        self.journal = journal
+
+    async def push(self, task_id: str, task_type: str, priority: str) -> None:
+        if self.journal:
+            await asyncio.to_thread(self.journal.append, task_id, task_type, priority)
+        self.lanes.setdefault((task_type, priority), deque()).append(task_id)
+
+    async def depths(self) -> Dict[Lane, int]:
+        return {lane: len(queue) for lane, queue in self.lanes.items()}
+
+    async def lease(self, lane: Lane, lease_seconds: float) -> Optional[str]:
+        queue = self.lanes.get(lane)
+        if not queue:
+            return None
+        task_id = queue.popleft()
+        if self.journal:
+            await asyncio.to_thread(self.journal.mark_inflight, task_id)
+        return task_id
+
+    async def ack(self, task_id: str) -> None:
+        if self.journal:
+            await asyncio.to_thread(self.journal.remove, task_id)
+
+    async def reclaim_expired(self, max_attempts: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """启动时从队列日志恢复上次运行遗留的任务"""
+        if self.journal is None:
+            return [], []
+        entries, abandoned = await asyncio.to_thread(self.journal.recover, max_attempts)
+        for entry in entries:
+            self.lanes.setdefault((entry["type"], entry["priority"]), deque()).append(entry["task_id"])
+        return entries, abandoned
+
+    def close(self) -> None:
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+
+class SQLiteQueueBackend(QueueBackend):
+    """SQLite队列后端
+
+    队列保存在SQLite数据库文件中，同一主机上的多个进程（如 uvicorn --workers N）
+    共享同一个文件，依靠SQLite的文件锁保证每个任务只被一个进程租用。
+    数据库操作在线程中执行，不阻塞事件循环。
+    """
+
+    shared = True
+
+    def __init__(self, path: Optional[str] = None):
+        self.journal = QueueJournal(path)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def push(self, task_id: str, task_type: str, priority: str) -> None:
+        await asyncio.to_thread(self.journal.append, task_id, task_type, priority)
+
+    async def depths(self) -> Dict[Lane, int]:
+        return await asyncio.to_thread(self.journal.depths)
+
+    async def lease(self, lane: Lane, lease_seconds: float) -> Optional[str]:
+        task_type, priority = lane
+        return await asyncio.to_thread(self.journal.lease_next, task_type, priority, lease_seconds, self.owner)
+
+    async def ack(self, task_id: str) -> None:
+        if self.journal.conn is not None:
+            await asyncio.to_thread(self.journal.remove, task_id)
+
+    async def renew(self, task_ids: List[str], lease_seconds: float) -> None:
+        await asyncio.to_thread(self.journal.renew, task_ids, lease_seconds, self.owner)
+
+    async def reclaim_expired(self, max_attempts: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        return await asyncio.to_thread(self.journal.reclaim_expired, max_attempts)
+
+    def close(self) -> None:
+        self.journal.close()
+
+
+# 原子地弹出通道头部任务、登记租约并累加尝试次数
+_LEASE_SCRIPT = """
+local task_id = redis.call('LPOP', KEYS[1])
+if not task_id then
+    return false
+end
+redis.call('ZADD', KEYS[2], ARGV[1], task_id)
+redis.call('HINCRBY', ARGV[2] .. task_id, 'attempts', 1)
+return task_id
+"""
+
+# 回收一个过期租约：租约在脚本内仍已过期（未在查询之后被续租）且成功从租约集合中移除的进程负责处理，避免重复回收
+_RECLAIM_SCRIPT = """
+local lease_until = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not lease_until or tonumber(lease_until) > tonumber(ARGV[5]) then
+    return false
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+local entry_key = ARGV[2] .. ARGV[1]
+local entry = redis.call('HMGET', entry_key, 'type', 'priority', 'attempts')
+if not entry[1] then
+    return false
+end
+if tonumber(entry[3] or '0') >= tonumber(ARGV[3]) then
+    redis.call('DEL', entry_key)
+    return {entry[1], entry[2], entry[3] or '0', 'abandoned'}
+end
+redis.call('LPUSH', ARGV[4] .. entry[1] .. ':' .. entry[2], ARGV[1])
+return {entry[1], entry[2], entry[3] or '0', 'requeued'}
+"""
+
+
+class RedisQueueBackend(QueueBackend):
+    """Redis协议队列后端
+
+    多个主机上的进程共享同一个Redis（或兼容Redis协议的服务），键结构：
+
+        {prefix}:lanes              所有通道名称的集合，成员为 "type:priority"
+        {prefix}:lane:{type}:{pri}  通道中排队的任务ID列表
+        {prefix}:leases             租约有序集合，分数为租约到期时间
+        {prefix}:entry:{task_id}    任务元数据哈希（type/priority/attempts）
+
+    依赖redis包（redis.asyncio），只在选用此后端时导入。
+    """
+
+    shared = True
+
+    def __init__(self, url: Optional[str] = None, prefix: Optional[str] = None, client: Any = None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise ImportError("使用Redis队列后端需要安装redis包: pip install redis")
+            client = redis.Redis.from_url(url or os.getenv("QUEUE_REDIS_URL", "redis://localhost:6379/0"),
+                                          decode_responses=True)
+        self.client = client
+        self.prefix = prefix or os.getenv("QUEUE_REDIS_PREFIX", "datanexus:queue")
+        self.closed = False
+
+    def _lane_key(self, lane: Lane) -> str:
+        return f"{self.prefix}:lane:{lane[0]}:{lane[1]}"
+
+    def _entry_prefix(self) -> str:
+        return f"{self.prefix}:entry:"
+
+    async def push(self, task_id: str, task_type: str, priority: str) -> None:
+        lane = (task_type, priority)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self._entry_prefix() + task_id,
+                      mapping={"type": task_type, "priority": priority, "attempts": 0, "enqueued_at": time.time()})
+            pipe.sadd(f"{self.prefix}:lanes", f"{task_type}:{priority}")
+            pipe.rpush(self._lane_key(lane), task_id)
+            await pipe.execute()
+
+    async def depths(self) -> Dict[Lane, int]:
+        names = sorted(await self.client.smembers(f"{self.prefix}:lanes"))
+        lanes = [tuple(name.split(":", 1)) for name in names]
+        async with self.client.pipeline(transaction=False) as pipe:
+            for lane in lanes:
+                pipe.llen(self._lane_key(lane))
+            counts = await pipe.execute()
+        return dict(zip(lanes, counts))
+
+    async def lease(self, lane: Lane, lease_seconds: float) -> Optional[str]:
+        task_id = await self.client.eval(
+            _LEASE_SCRIPT, 2, self._lane_key(lane), f"{self.prefix}:leases",
+            time.time() + lease_seconds, self._entry_prefix()
+        )
+        return task_id or None
+
+    async def ack(self, task_id: str) -> None:
+        if self.closed:
+            return
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(f"{self.prefix}:leases", task_id)
+            pipe.delete(self._entry_prefix() + task_id)
+            await pipe.execute()
+
+    async def renew(self, task_ids: List[str], lease_seconds: float) -> None:
+        if task_ids and not self.closed:
+            lease_until = time.time() + lease_seconds
+            await self.client.zadd(f"{self.prefix}:leases", {task_id: lease_until for task_id in task_ids}, xx=True)
+
+    async def reclaim_expired(self, max_attempts: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        now = time.time()
+        expired = await self.client.zrangebyscore(f"{self.prefix}:leases", "-inf", now)
+        requeued, abandoned = [], []
+        for task_id in expired:
+            result = await self.client.eval(
+                _RECLAIM_SCRIPT, 1, f"{self.prefix}:leases",
+                task_id, self._entry_prefix(), max_attempts, f"{self.prefix}:lane:", now
+            )
+            if not result:
+                continue
+            task_type, priority, attempts, outcome = result
+            entry = {"task_id": task_id, "type": task_type, "priority": priority, "attempts": int(attempts)}
+            (abandoned if outcome == "abandoned" else requeued).append(entry)
+        return requeued, abandoned
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def create_queue_backend() -> QueueBackend:
+    """根据环境变量QUEUE_BACKEND创建队列后端：memory（默认）、sqlite 或 redis"""
+    backend = os.getenv("QUEUE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        logger.info("使用SQLite队列后端")
+        return SQLiteQueueBackend()
+    if backend == "redis":
+        logger.info("使用Redis队列后端")
+        return RedisQueueBackend()
+    persistent = os.getenv("QUEUE_PERSISTENT", "true").lower() == "true"
+    return MemoryQueueBackend(journal=QueueJournal() if persistent else None)
@@ -0,0 +1,196 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.utils.logger import logger
+
+load_dotenv()
+
+PENDING = "pending"
+INFLIGHT = "inflight"
+
+
+class QueueJournal:
+    """任务队列日志
+
+    使用SQLite（WAL模式）记录每个排队中和处理中的任务，进程崩溃或重启后据此恢复队列。
+    任务入队时写入，出队时标记为处理中并累加尝试次数，处理完成后删除。
+
+    同一个数据库文件可以被同一主机上的多个进程同时打开，租约相关的方法
+    （lease_next/renew/reclaim_expired）在写事务中执行，供SQLite队列后端使用。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or os.getenv("QUEUE_JOURNAL_PATH", "data/queue.db"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS queue_entries (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id TEXT NOT NULL UNIQUE,
+                task_type TEXT NOT NULL,
+                priority TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                lease_until REAL,
+                owner TEXT
+            )
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(queue_entries)")}
+        for column, column_type in (("lease_until", "REAL"), ("owner", "TEXT")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE queue_entries ADD COLUMN {column} {column_type}")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_queue_entries_lane ON queue_entries (state, task_type, priority, seq)"
+        )
+
+    def _execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        with self.lock:
+            if self.conn is None:
+                raise RuntimeError("队列日志已关闭")
+            return self.conn.execute(sql, params)
+
+    def append(self, task_id: str, task_type: str, priority: str) -> None:
+        """记录新入队的任务"""
+        self._execute(
+            "INSERT OR REPLACE INTO queue_entries (task_id, task_type, priority, state, attempts, enqueued_at) "
+            "VALUES (?, ?, ?, ?, 0, ?)",
+            (task_id, task_type, priority, PENDING, time.time())
+        )
+
+    def mark_inflight(self, task_id: str) -> None:
+        """标记任务开始处理，并累加尝试次数"""
+        self._execute(
+            "UPDATE queue_entries SET state = ?, attempts = attempts + 1 WHERE task_id = ?",
+            (INFLIGHT, task_id)
+        )
+
+    def remove(self, task_id: str) -> None:
+        """任务处理完成，删除记录"""
+        self._execute("DELETE FROM queue_entries WHERE task_id = ?", (task_id,))
+
+    def recover(self, max_attempts: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """读取上次运行遗留的任务
+
+        处理中的任务视为被中断，尝试次数未达上限的重置为排队状态，达到上限的删除。
+
+        Args:
+            max_attempts: 每个任务最多尝试处理的次数
+
+        Returns:
+            Tuple[List[Dict], List[Dict]]: 需要重新入队的任务（按原入队顺序）和被放弃的任务
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT task_id, task_type, priority, state, attempts FROM queue_entries ORDER BY seq"
+            ).fetchall()
+            entries = [dict(zip(("task_id", "type", "priority", "state", "attempts"), row)) for row in rows]
+            abandoned = [e for e in entries if e["state"] == INFLIGHT and e["attempts"] >= max_attempts]
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM queue_entries WHERE task_id = ?", [(e["task_id"],) for e in abandoned])
+            self.conn.execute("UPDATE queue_entries SET state = ?, lease_until = NULL, owner = NULL", (PENDING,))
+            self.conn.execute("COMMIT")
+        abandoned_ids = {e["task_id"] for e in abandoned}
+        return [e for e in entries if e["task_id"] not in abandoned_ids], abandoned
+
+    def depths(self) -> Dict[Tuple[str, str], int]:
+        """每个(任务类型, 优先级)通道中排队的任务数"""
+        rows = self._execute(
+            "SELECT task_type, priority, COUNT(*) FROM queue_entries WHERE state = ? GROUP BY task_type, priority",
+            (PENDING,)
+        ).fetchall()
+        return {(task_type, priority): count for task_type, priority, count in rows}
+
+    def lease_next(self, task_type: str, priority: str, lease_seconds: float, owner: str) -> Optional[str]:
+        """租用通道中最早入队的任务
+
+        在写事务（BEGIN IMMEDIATE）中选取并标记任务，多个进程同时租用时每个任务只会被一个进程拿到。
+
+        Returns:
+            Optional[str]: 租到的任务ID，通道为空时返回None
+        """
+        with self.lock:
+            if self.conn is None:
+                raise RuntimeError("队列日志已关闭")
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT task_id FROM queue_entries WHERE state = ? AND task_type = ? AND priority = ? "
+                    "ORDER BY seq LIMIT 1",
+                    (PENDING, task_type, priority)
+                ).fetchone()
+                if row:
+                    self.conn.execute(
+                        "UPDATE queue_entries SET state = ?, attempts = attempts + 1, lease_until = ?, owner = ? "
+                        "WHERE task_id = ?",
+                        (INFLIGHT, time.time() + lease_seconds, owner, row[0])
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return row[0] if row else None
+
+    def renew(self, task_ids: List[str], lease_seconds: float, owner: str) -> None:
+        """续租本进程正在处理的任务"""
+        lease_until = time.time() + lease_seconds
+        with self.lock:
+            if self.conn is None:
+                return
+            self.conn.executemany(
+                "UPDATE queue_entries SET lease_until = ? WHERE task_id = ? AND owner = ? AND state = ?",
+                [(lease_until, task_id, owner, INFLIGHT) for task_id in task_ids]
+            )
+
+    def reclaim_expired(self, max_attempts: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """回收租约已过期的任务
+
+        租约过期说明持有任务的进程已经退出或卡死。尝试次数未达上限的任务放回队列，
+        保持原入队顺序；达到上限的删除。
+
+        Returns:
+            Tuple[List[Dict], List[Dict]]: 放回队列的任务和被放弃的任务
+        """
+        now = time.time()
+        with self.lock:
+            if self.conn is None:
+                return [], []
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT task_id, task_type, priority, attempts FROM queue_entries "
+                    "WHERE state = ? AND lease_until < ?",
+                    (INFLIGHT, now)
+                ).fetchall()
+                expired = [dict(zip(("task_id", "type", "priority", "attempts"), row)) for row in rows]
+                abandoned = [e for e in expired if e["attempts"] >= max_attempts]
+                self.conn.executemany(
+                    "DELETE FROM queue_entries WHERE task_id = ?", [(e["task_id"],) for e in abandoned]
+                )
+                self.conn.execute(
+                    "UPDATE queue_entries SET state = ?, lease_until = NULL, owner = NULL "
+                    "WHERE state = ? AND lease_until < ?",
+                    (PENDING, INFLIGHT, now)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [e for e in expired if e["attempts"] < max_attempts], abandoned
+
+    def close(self) -> None:
+        """关闭日志"""
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+                logger.info("队列日志已关闭")
@@ -1,51 +1,353 @@
-from asyncio import Queue, Lock
-from typing import Dict, Any, Optional
+import asyncio
+import math
+import time
+from asyncio import Lock
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 import os
 from dotenv import load_dotenv
 from app.utils.logger import logger
+from app.utils.queue_backends import Lane, MemoryQueueBackend, QueueBackend, create_queue_backend
 
-load_dotenv()
+DEFAULT_PRIORITY = "normal"
+
+
+def parse_weights(value: str, default: Dict[str, float]) -> Dict[str, float]:
+    """解析形如 "high:4,normal:2,low:1" 的权重配置"""
+    if not value:
+        return dict(default)
+    weights = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition(":")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class WeightedFairScheduler:
+    """加权公平调度器（stride scheduling）
+
+    每个通道维护一个虚拟时间，每被调度一次前进 1/权重，每次选择虚拟时间最小的就绪通道。
+    权重为4的通道被调度的次数约为权重为1的通道的4倍，但后者不会被饿死。
+    空闲后重新就绪的通道从当前全局虚拟时间开始计，不能凭空闲期间积累的额度插队。
+    全局虚拟时间只在竞争同一批工作协程的通道之间有意义，每组通道应使用各自的调度器。
+    """
 
-class TaskQueue:
     def __init__(self):
-        self.queue = Queue(maxsize=int(os.getenv("QUEUE_MAX_SIZE", 1000)))
+        self.passes: Dict[Lane, float] = {}
+        self.virtual_time = 0.0
+
+    def pick(self, lanes: Iterable[Lane], weights: Dict[Lane, float]) -> Optional[Lane]:
+        """从就绪通道中选出下一个要服务的通道，并计入一次调度"""
+        best, best_pass = None, None
+        for lane in lanes:
+            lane_pass = max(self.passes.get(lane, 0.0), self.virtual_time)
+            if best is None or lane_pass < best_pass or (lane_pass == best_pass and weights[lane] > weights[best]):
+                best, best_pass = lane, lane_pass
+        if best is None:
+            return None
+        self.passes[best] = best_pass + 1.0 / weights[best]
+        self.virtual_time = best_pass
+        return best
+
+
+class ServiceTimeEstimator:
+    """按任务类型估计新任务的排队等待时间
+
+    以指数加权移动平均（EWMA）记录每种任务类型单个任务的处理耗时，批量处理时按批次耗时除以任务数计算。
+    新任务的等待时间估计为：(排队数 + 处理中数 + 1) x 单任务耗时 / 工作协程数。
+    """
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.service_times: Dict[str, float] = {}
+        self.capacity: Dict[str, int] = {}
+
+    def record(self, task_type: str, elapsed: float, count: int = 1) -> None:
+        """记录一次处理耗时
+
+        Args:
+            task_type: 任务类型
+            elapsed: 处理耗时（秒）
+            count: 本次处理的任务数
+        """
+        if count <= 0:
+            return
+        sample = elapsed / count
+        current = self.service_times.get(task_type)
+        self.service_times[task_type] = sample if current is None else current + self.alpha * (sample - current)
+
+    def set_capacity(self, task_type: str, workers: int) -> None:
+        """设置任务类型的并发处理能力（工作协程数）"""
+        self.capacity[task_type] = max(1, workers)
+
+    def estimate(self, task_type: str, backlog: int) -> Optional[float]:
+        """估计新任务的等待时间（秒），还没有耗时数据时返回None
+
+        Args:
+            task_type: 任务类型
+            backlog: 该类型排队中和处理中的任务数
+        """
+        service_time = self.service_times.get(task_type)
+        if service_time is None:
+            return None
+        return (backlog + 1) * service_time / self.capacity.get(task_type, 1)
+
+
+class TaskQueue:
+    def __init__(self, backend: Optional[QueueBackend] = None):
+        """
+        Args:
+            backend: 队列后端，为None时使用不持久化的内存后端
+        """
+        self.backend = backend or MemoryQueueBackend()
+        # 队列总容量，所有通道共享
+        self.maxsize = int(os.getenv("QUEUE_MAX_SIZE", 1000))
+        # 优先级权重和任务类型权重，通道权重为两者乘积
+        self.priority_weights = parse_weights(os.getenv("QUEUE_PRIORITY_WEIGHTS"), {"high": 4, "normal": 2, "low": 1})
+        self.type_weights = parse_weights(os.getenv("QUEUE_TYPE_WEIGHTS"), {"rerank": 4, "embedding": 4, "embedding_batch": 1, "mask": 1})
+        self.lane_weights: Dict[Lane, float] = {}
+        # 每种任务类型的工作协程只在本类型的通道中选择，各用一个调度器，
+        # 否则其他类型推进的虚拟时间会让本类型的低权重通道永远排在高权重通道之后；键为None时在所有类型中选择
+        self.schedulers: Dict[Optional[str], WeightedFairScheduler] = {}
+        # 本进程正在处理的任务
         self.processing: Dict[str, Any] = {}
         self.lock = Lock()
+        # 被中断的任务最多尝试处理的次数
+        self.max_attempts = int(os.getenv("QUEUE_MAX_ATTEMPTS", 3))
+        # 租约时长，处理中的任务需要在到期前续租，否则会被其他进程回收
+        self.lease_seconds = float(os.getenv("QUEUE_LEASE_SECONDS", 60))
+        # 共享后端轮询其他进程入队任务的间隔
+        self.poll_interval = float(os.getenv("QUEUE_POLL_INTERVAL_MS", 100)) / 1000
+        # 按实测处理速度估计等待时间，超过任务类型的等待时间上限（秒）时拒绝新任务
+        self.estimator = ServiceTimeEstimator(float(os.getenv("QUEUE_EWMA_ALPHA", 0.2)))
+        self.slo_seconds = parse_weights(os.getenv("QUEUE_SLO_SECONDS"), {"embedding": 30, "rerank": 30, "mask": 120})
+        self.rejected: Dict[str, int] = {}
+        # 在事件循环内延迟创建，入队时唤醒等待中的消费者
+        self._not_empty: Optional[asyncio.Condition] = None
+        # 每次入队递增，避免检查队列和开始等待之间漏掉入队通知
+        self._version = 0
+
+    @property
+    def not_empty(self) -> asyncio.Condition:
+        if self._not_empty is None:
+            self._not_empty = asyncio.Condition()
+        return self._not_empty
+
+    def normalize_priority(self, priority: Optional[str]) -> str:
+        """校验优先级，为空时返回默认优先级
+
+        Raises:
+            ValueError: 不支持的优先级
+        """
+        if priority is None or priority == "":
+            return DEFAULT_PRIORITY
+        if priority not in self.priority_weights:
+            raise ValueError(f"不支持的优先级：{priority}，可选值: {list(self.priority_weights)}")
+        return priority
+
+    def _lane_weight(self, lane: Lane) -> float:
+        if lane not in self.lane_weights:
+            task_type, priority = lane
+            self.lane_weights[lane] = self.type_weights.get(task_type, 1) * self.priority_weights.get(priority, 1)
+        return self.lane_weights[lane]
+
+    async def _ready_lanes(self, task_type: Optional[str]) -> List[Lane]:
+        """有待处理任务的通道"""
+        depths = await self.backend.depths()
+        return [lane for lane, depth in depths.items()
+                if depth and (task_type is None or lane[0] == task_type)]
+
+    async def qsize(self) -> int:
+        """等待中的任务总数"""
+        return sum((await self.backend.depths()).values())
 
-    async def add_task(self, task_id: str, task_type: str) -> bool:
-        """添加任务到队列"""
-        if self.queue.full():
+    async def full(self) -> bool:
+        """队列是否已满"""
+        return self.maxsize > 0 and await self.qsize() >= self.maxsize
+
+    async def estimate_wait(self, task_type: str) -> Optional[float]:
+        """估计新提交的指定类型任务的等待时间（秒），还没有耗时数据时返回None
+
+        共享后端中排队数包含所有进程的任务，处理能力只按本进程的工作协程计算，估计值偏保守。
+        """
+        depths = await self.backend.depths()
+        waiting = sum(depth for (lane_type, _), depth in depths.items() if lane_type == task_type)
+        processing = sum(1 for processing_type in self.processing.values() if processing_type == task_type)
+        return self.estimator.estimate(task_type, waiting + processing)
+
+    async def check_admission(self, task_type: str) -> Optional[int]:
+        """准入检查：估计等待时间超过QUEUE_SLO_SECONDS中该类型的上限时拒绝
+
+        Returns:
+            Optional[int]: 拒绝时返回建议的重试等待秒数（Retry-After），接受时返回None
+        """
+        slo = self.slo_seconds.get(task_type)
+        if not slo:
+            return None
+        estimate = await self.estimate_wait(task_type)
+        if estimate is None or estimate <= slo:
+            return None
+        self.rejected[task_type] = self.rejected.get(task_type, 0) + 1
+        # 积压降到上限以内所需的时间
+        retry_after = max(1, math.ceil(estimate - slo))
+        logger.warning(f"{task_type} 任务预计等待 {estimate:.1f} 秒，超过上限 {slo} 秒，拒绝新任务")
+        return retry_after
+
+    def record_service_time(self, task_type: str, elapsed: float, count: int = 1) -> None:
+        """记录任务处理耗时，用于估计等待时间"""
+        self.estimator.record(task_type, elapsed, count)
+
+    def set_capacity(self, task_type: str, workers: int) -> None:
+        """设置任务类型的工作协程数，用于估计等待时间"""
+        self.estimator.set_capacity(task_type, workers)
+
+    async def _notify(self) -> None:
+        async with self.not_empty:
+            self._version += 1
+            self.not_empty.notify_all()
+
+    async def add_task(self, task_id: str, task_type: str, priority: Optional[str] = None) -> bool:
+        """添加任务到队列
+
+        Args:
+            task_id: 任务ID
+            task_type: 任务类型
+            priority: 优先级，为空时使用默认优先级
+        """
+        priority = self.normalize_priority(priority)
+        if await self.full():
             return False
-        
-        await self.queue.put((task_id, task_type))
-        logger.info(f"添加任务到队列: {task_id}, 类型: {task_type}")
+
+        await self.backend.push(task_id, task_type, priority)
+        await self._notify()
+        logger.info(f"添加任务到队列: {task_id}, 类型: {task_type}, 优先级: {priority}")
         return True
 
-    async def get_task(self) -> Optional[Dict[str, Any]]:
-        """从队列获取任务"""
-        if self.queue.empty():
-            return None
-        
-        task_id, task_type = await self.queue.get()
-        task = {"task_id": task_id, "type": task_type}
+    async def _try_lease(self, task_type: Optional[str]) -> Optional[Dict[str, Any]]:
+        """按加权公平调度选择通道并租用任务，没有可用任务时返回None"""
+        lanes = await self._ready_lanes(task_type)
+        scheduler = self.schedulers.setdefault(task_type, WeightedFairScheduler())
+        while lanes:
+            lane = scheduler.pick(lanes, {lane: self._lane_weight(lane) for lane in lanes})
+            task_id = await self.backend.lease(lane, self.lease_seconds)
+            if task_id:
+                return {"task_id": task_id, "type": lane[0], "priority": lane[1]}
+            # 共享后端中任务可能已被其他进程取走
+            lanes.remove(lane)
+        return None
+
+    async def get_task(self, task_type: Optional[str] = None, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """从队列获取任务，队列为空时阻塞等待新任务入队
+
+        多个通道都有任务时，按通道权重进行加权公平调度。本进程入队的任务会立即唤醒等待者，
+        共享后端中其他进程入队的任务按QUEUE_POLL_INTERVAL_MS轮询发现。
+
+        Args:
+            task_type: 只获取指定类型的任务，为None时获取任意类型的任务
+            timeout: 最长等待秒数，为None时一直等待，为0时不等待
+
+        Returns:
+            Optional[Dict[str, Any]]: 任务信息，超时返回None
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            version = self._version
+            task = await self._try_lease(task_type)
+            if task:
+                break
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return None
+            wait = self.poll_interval if self.backend.shared else None
+            if wait is None or (remaining is not None and remaining < wait):
+                wait = remaining
+            async with self.not_empty:
+                try:
+                    await asyncio.wait_for(self.not_empty.wait_for(lambda: self._version != version), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+        task_id = task["task_id"]
         async with self.lock:
-            self.processing[task_id] = task_type
-        logger.info(f"从队列获取任务: {task_id}, 任务类型: {task_type}")
+            self.processing[task_id] = task["type"]
+        logger.info(f"从队列获取任务: {task_id}, 任务类型: {task['type']}, 优先级: {task['priority']}")
         return task
 
     async def complete_task(self, task_id: str) -> None:
         """完成任务处理"""
         async with self.lock:
+            await self.backend.ack(task_id)
             if task_id in self.processing:
                 del self.processing[task_id]
                 logger.info(f"完成任务处理: {task_id}")
 
+    async def renew_leases(self) -> None:
+        """为本进程正在处理的任务续租"""
+        task_ids = list(self.processing.keys())
+        if task_ids:
+            await self.backend.renew(task_ids, self.lease_seconds)
+
+    async def recover(self) -> List[Dict[str, Any]]:
+        """回收上次运行遗留或租约已过期的任务
+
+        内存后端从队列日志按原入队顺序恢复；共享后端回收租约过期（持有进程已退出）的任务。
+        被中断次数达到QUEUE_MAX_ATTEMPTS的任务被放弃。
+
+        Returns:
+            List[Dict[str, Any]]: 被放弃的任务列表
+        """
+        _, abandoned = await self.recover_entries()
+        return abandoned
+
+    async def recover_entries(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """同recover，同时返回重新入队的任务
+
+        Returns:
+            Tuple[List[Dict], List[Dict]]: 重新入队的任务和被放弃的任务
+        """
+        requeued, abandoned = await self.backend.reclaim_expired(self.max_attempts)
+        if requeued:
+            await self._notify()
+        if requeued or abandoned:
+            logger.info(f"恢复任务 {len(requeued)} 个, 放弃任务 {len(abandoned)} 个")
+        return requeued, abandoned
+
+    def close(self) -> None:
+        """关闭队列后端
+
+        关闭后仍在处理中的任务不会再被确认，下次启动或租约过期后会被重新处理。
+        """
+        self.backend.close()
+
     async def get_queue_status(self) -> Dict[str, Any]:
         """获取队列状态"""
+        depths = await self.backend.depths()
+        waiting_by_type: Dict[str, int] = {}
+        for (task_type, _), depth in depths.items():
+            waiting_by_type[task_type] = waiting_by_type.get(task_type, 0) + depth
+        processing_by_type: Dict[str, int] = {}
+        for task_type in self.processing.values():
+            processing_by_type[task_type] = processing_by_type.get(task_type, 0) + 1
+        estimates = {}
+        task_types = set(self.slo_seconds) | set(self.estimator.service_times) | set(waiting_by_type)
+        for task_type in sorted(task_types):
+            backlog = waiting_by_type.get(task_type, 0) + processing_by_type.get(task_type, 0)
+            estimates[task_type] = {
+                "service_time": self.estimator.service_times.get(task_type),
+                "workers": self.estimator.capacity.get(task_type),
+                "estimated_wait": self.estimator.estimate(task_type, backlog),
+                "slo": self.slo_seconds.get(task_type),
+                "rejected": self.rejected.get(task_type, 0)
+            }
         return {
-            "waiting": self.queue.qsize(),
-            "processing": list(self.processing.keys())
+            "waiting": sum(depths.values()),
+            "waiting_by_type": waiting_by_type,
+            "lanes": {f"{task_type}:{priority}": depth for (task_type, priority), depth in depths.items()},
+            "processing": list(self.processing.keys()),
+            "estimates": estimates
         }
 
 # 创建全局任务队列实例
-task_queue = TaskQueue()
\ No newline at end of file
+task_queue = TaskQueue(backend=create_queue_backend())
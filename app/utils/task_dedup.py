@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.utils.logger import logger
+
+load_dotenv()
+
+
+class TaskDeduplicator:
+    """相同任务去重
+
+    以 任务类型 + 模型 + 参数 的哈希作为任务键（不包含回调地址、优先级、返回格式等不影响结果的参数）。
+    参数按原样比较：脱敏结果和重排序结果包含输入文本本身，分块结果包含字符偏移，
+    只差空白或Unicode规范形式的输入不能共用结果（相同文本的向量由Embedding缓存复用）。
+
+    - 相同任务正在处理时，新任务挂到处理中的任务上，不再入队，处理完成后一起交付结果
+    - 相同任务在TASK_DEDUP_TTL秒内已完成时，直接用缓存的结果交付新任务
+
+    每个任务仍有自己的task_id和回调。通过TASK_DEDUP_ENABLED开启。
+    挂起的任务记录在处理中任务的任务记录里（dedup_key、dedup_followers），重启后随该任务一起恢复（restore）。
+    处理中的任务和挂在其上的任务只记录在本进程内，多进程共享队列（QUEUE_BACKEND为sqlite或redis）时
+    任务可能由其他进程处理，挂起的任务收不到结果，因此不去重。
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("TASK_DEDUP_ENABLED", "false").lower() == "true"
+        queue_backend = os.getenv("QUEUE_BACKEND", "memory").lower()
+        if self.enabled and queue_backend in ("sqlite", "redis"):
+            logger.warning(f"队列后端 {queue_backend} 由多个进程共享，任务去重不生效")
+            self.enabled = False
+        self.ttl = float(os.getenv("TASK_DEDUP_TTL", 300))
+        self.max_results = int(os.getenv("TASK_DEDUP_CACHE_SIZE", 10000))
+        # 任务键 -> (结果, 过期时间)
+        self.results: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        # 任务键 -> 挂在处理中任务上的任务ID列表
+        self.inflight: Dict[str, List[str]] = {}
+        # 处理中的任务ID -> 任务键
+        self.leaders: Dict[str, str] = {}
+        # 任务键 -> 处理中的任务ID
+        self.owners: Dict[str, str] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def make_key(self, task_type: str, model: str, params: Dict[str, Any]) -> Optional[str]:
+        """计算任务键，未开启去重时返回None"""
+        if not self.enabled:
+            return None
+        content = json.dumps({"type": task_type, "model": model, "params": params},
+                             ensure_ascii=False, sort_keys=True)
+        return f"{task_type}:{hashlib.sha256(content.encode('utf-8')).hexdigest()}"
+
+    def _count(self, task_type: str, outcome: str) -> None:
+        counters = self.counters.setdefault(task_type, {"result_hits": 0, "inflight_hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    def cached_result(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """查找未过期的最近结果"""
+        if key is None:
+            return None
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self.results[key]
+            return None
+        self.results.move_to_end(key)
+        return entry[0]
+
+    def has(self, key: Optional[str]) -> bool:
+        """是否有相同任务正在处理或有最近结果"""
+        return key is not None and (key in self.inflight or self.cached_result(key) is not None)
+
+    def claim(self, key: str, task_type: str, task_id: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """为新任务查找可复用的结果或处理中的任务
+
+        Returns:
+            Tuple[str, Optional[Dict]]: ("result", 缓存结果)、("inflight", None) 表示已挂到处理中的任务上，
+                ("leader", None) 表示没有可复用的任务，新任务需要入队处理
+        """
+        result = self.cached_result(key)
+        if result is not None:
+            self._count(task_type, "result_hits")
+            return "result", result
+        if key in self.inflight:
+            self.inflight[key].append(task_id)
+            self._count(task_type, "inflight_hits")
+            return "inflight", None
+        self.inflight[key] = []
+        self.leaders[task_id] = key
+        self.owners[key] = task_id
+        self._count(task_type, "misses")
+        return "leader", None
+
+    def leader_of(self, key: str) -> Optional[str]:
+        """处理中的相同任务的ID"""
+        return self.owners.get(key)
+
+    def followers(self, key: str) -> List[str]:
+        """挂在处理中任务上的任务ID"""
+        return list(self.inflight.get(key, []))
+
+    def restore(self, task_id: str, key: str, followers: List[str]) -> None:
+        """重启后恢复处理中的任务和挂在其上的任务
+
+        相同任务已在处理时，挂起的任务改挂到该任务上。
+        """
+        if not self.enabled or task_id in self.leaders:
+            return
+        if key in self.inflight:
+            self.inflight[key].extend(f for f in followers if f not in self.inflight[key])
+            return
+        self.inflight[key] = list(followers)
+        self.leaders[task_id] = key
+        self.owners[key] = task_id
+
+    def release(self, task_id: str) -> List[str]:
+        """入队失败时释放任务键，返回已挂在该任务上的任务ID"""
+        key = self.leaders.pop(task_id, None)
+        if key is None:
+            return []
+        self.owners.pop(key, None)
+        return self.inflight.pop(key, [])
+
+    def resolve(self, task_id: str, result: Optional[Dict[str, Any]]) -> List[str]:
+        """任务处理完成，缓存成功的结果并返回挂在该任务上的任务ID
+
+        Args:
+            task_id: 处理完成的任务ID
+            result: 任务结果，失败时为None（不缓存）
+        """
+        key = self.leaders.pop(task_id, None)
+        if key is None:
+            return []
+        self.owners.pop(key, None)
+        followers = self.inflight.pop(key, [])
+        if result is not None and self.ttl > 0:
+            self.results[key] = (result, time.monotonic() + self.ttl)
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+        if followers:
+            logger.info(f"任务 {task_id} 的结果同时交付给 {len(followers)} 个相同任务")
+        return followers
+
+    def stats(self, task_type: str) -> Dict[str, Any]:
+        """获取任务类型的去重命中统计"""
+        counters = dict(self.counters.get(task_type, {"result_hits": 0, "inflight_hits": 0, "misses": 0}))
+        total = sum(counters.values())
+        hits = counters["result_hits"] + counters["inflight_hits"]
+        return {
+            "enabled": self.enabled,
+            **counters,
+            "hit_rate": hits / total if total else 0.0,
+            "cached_results": len(self.results)
+        }
+
+
+# 创建全局任务去重实例
+task_dedup = TaskDeduplicator()
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from app.models.task_store import TaskStore, task_store
+from app.utils.logger import logger
+from app.utils.queue_manager import parse_weights
+
+load_dotenv()
+
+
+class TaskJanitor:
+    """任务清理器
+
+    定期删除超过保留期限的任务数据（例如回调一直失败而遗留的任务）。保留天数默认为TASK_RETENTION_DAYS，
+    可通过TASK_RETENTION_BY_STATUS按任务状态单独配置，如 "completed:1,failed:14"。
+    每批最多检查TASK_JANITOR_BATCH个任务，批与批之间让出事件循环，不会长时间占用存储。
+    """
+
+    def __init__(self, store: Optional[TaskStore] = None):
+        self.store = store or task_store
+        self.retention_days = float(os.getenv("TASK_RETENTION_DAYS", 14))
+        self.retention_by_status = parse_weights(os.getenv("TASK_RETENTION_BY_STATUS"), {})
+        self.interval = float(os.getenv("TASK_JANITOR_INTERVAL", 3600))
+        self.batch_size = int(os.getenv("TASK_JANITOR_BATCH", 500))
+        self.stats: Dict[str, Any] = {"runs": 0, "removed": 0, "bytes": 0, "last_run": None, "last_removed": 0}
+
+    async def run_once(self) -> Dict[str, int]:
+        """执行一轮完整的清理
+
+        Returns:
+            Dict[str, int]: 本轮删除的任务数和回收的字节数
+        """
+        now = time.time()
+        cutoffs = {status: now - days * 86400 for status, days in self.retention_by_status.items()}
+        default_cutoff = now - self.retention_days * 86400
+        removed = reclaimed = 0
+        while True:
+            result = await self.store.expire(cutoffs, default_cutoff, self.batch_size)
+            removed += result["removed"]
+            reclaimed += result["bytes"]
+            if result["done"]:
+                break
+            await asyncio.sleep(0)
+        self.stats["runs"] += 1
+        self.stats["removed"] += removed
+        self.stats["bytes"] += reclaimed
+        self.stats["last_run"] = now
+        self.stats["last_removed"] = removed
+        if removed:
+            logger.info(f"清理过期任务 {removed} 个, 回收 {reclaimed} 字节")
+        return {"removed": removed, "bytes": reclaimed}
+
+    async def run(self) -> None:
+        """后台循环，每隔TASK_JANITOR_INTERVAL秒清理一轮"""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"清理过期任务时发生错误: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+# 创建全局任务清理器实例
+task_janitor = TaskJanitor()
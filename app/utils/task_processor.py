@@ -1,10 +1,16 @@
 import asyncio
-import aiohttp
-from typing import Dict, Any, Optional, Tuple, Callable, Union, Type
+import math
+import time
+from typing import Dict, Any, List, Optional, Tuple, Callable, Union, Type
 from app.services.embedding_service import EmbeddingService
 from app.services.mask_service import MaskService
 from app.services.rerank_service import RerankService
 from app.utils.queue_manager import task_queue
+from app.utils.micro_batcher import MicroBatcher
+from app.utils.callback_dispatcher import callback_dispatcher
+from app.utils.task_dedup import task_dedup
+from app.utils.vector_codec import (convert_chunks, decode_result, format_chunks, format_matrix, format_vector,
+                                    truncate_dimensions)
 from app.utils.logger import logger
 from app.models import *
 import os
@@ -17,14 +23,42 @@ class TaskProcessor:
         self.embedding_service = EmbeddingService()
         self.mask_service = MaskService()
         self.rerank_service = RerankService()
-        logger.info(f"所用服务模型加载成功！")
+        # 各服务的模型由全局注册表在第一次使用时加载
+        logger.info(f"所用服务初始化成功！")
         self.running = False
         # 任务类型到模型的映射
         self.task_models = {
             "embedding": embedding_task_model,
+            "embedding_batch": embedding_batch_task_model,
             "mask": mask_task_model,
             "rerank": rerank_task_model
         }
+        # 任务类型到处理函数的映射
+        self.task_handlers = {
+            "embedding": self.process_embedding_tasks,
+            "embedding_batch": self.process_embedding_batch_task,
+            "mask": self.process_mask_task,
+            "rerank": self.process_rerank_task
+        }
+        # 每种任务类型的并发工作协程数量
+        self.worker_counts = {
+            "embedding": int(os.getenv("EMBEDDING_WORKERS", 2)),
+            "embedding_batch": int(os.getenv("EMBEDDING_BATCH_WORKERS", 1)),
+            "mask": int(os.getenv("MASK_WORKERS", 1)),
+            "rerank": int(os.getenv("RERANK_WORKERS", 2))
+        }
+        self.workers: List[asyncio.Task] = []
+        self.idle_workers = set()
+        self.lease_keeper: Optional[asyncio.Task] = None
+        # 停止时等待正在处理的任务完成的最长秒数
+        self.shutdown_grace = float(os.getenv("SHUTDOWN_GRACE_SECONDS", 30))
+        # 需要微批处理的任务类型，对应的处理函数接收任务列表
+        self.batchers = {
+            "embedding": MicroBatcher("embedding")
+        }
+        # 批量embedding任务：模型每次前向计算的文本数，以及每个回调分块包含的文本数
+        self.encode_batch_size = int(os.getenv("EMBEDDING_ENCODE_BATCH_SIZE", 64))
+        self.batch_chunk_size = int(os.getenv("EMBEDDING_BATCH_CHUNK_SIZE", 1000))
         # 获取handle URL，如果环境变量为空则使用本地IP
         self.handle = os.getenv("HANDLE_URL")
         if not self.handle:
@@ -37,8 +71,10 @@ class TaskProcessor:
                            task_id: str, 
                            status: str, 
                            data: Dict[str, Any], 
-                           model: Any) -> bool:
-        """发送回调结果到指定接口
+                           model: Any,
+                           callback_format: str = "json",
+                           on_delivered: Optional[Callable[[], Any]] = None) -> bool:
+        """提交回调结果到回调分发器，不等待投递完成
         
         Args:
             handle: 回调地址
@@ -46,12 +82,12 @@ class TaskProcessor:
             status: 任务状态 (completed/failed)
             data: 回调数据
             model: 任务对应的模型
+            callback_format: 回调格式，json、msgpack 或 octet-stream
+            on_delivered: 投递成功后执行的协程函数，默认删除本地任务数据
             
         Returns:
-            bool: 回调是否成功
+            bool: 回调是否已提交
         """
-        logger.info(f"返回结果到接口 {handle}")
-
         if not handle:
             handle = self.handle
         if not handle:
@@ -59,30 +95,15 @@ class TaskProcessor:
             logger.info(f"没有回调地址，直接删除本地任务数据 {task_id}")
             await model.delete(task_id)
             return True
-        logger.info(f"返回结果到接口 {handle}")
+        logger.info(f"提交回调到接口 {handle}, 任务: {task_id}")
         
         callback_data = {"task_id": task_id, "status": status, **data}
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(handle, json=callback_data, timeout=30) as response:
-                    if response.status != 200:
-                        error_msg = f"返回结果到接口 {handle} 失败: {response.status}"
-                        logger.error(error_msg)
-                        return False
-                    # 回调成功后删除本地任务数据
-                    logger.info(f"返回结果到接口 {handle} 成功")
-                    await model.delete(task_id)
-                    return True
-        except Exception as e:
-            error_msg = f"返回结果到接口 {handle} 时发生错误: {str(e)}"
-            logger.error(error_msg)
-            # 更新本地任务状态为失败
-            # await self._update_task_status(task_id, model, "failed", {
-            #     "error": error_msg,
-            #     **data  # 保留原始数据
-            # })
-            return False
+
+        # 回调成功后删除本地任务数据
+        await callback_dispatcher.dispatch(handle, callback_data,
+                                           on_delivered=on_delivered or (lambda: model.delete(task_id)),
+                                           callback_format=callback_format)
+        return True
 
     async def _update_task_status(self, 
                                task_id: str, 
@@ -100,42 +121,271 @@ class TaskProcessor:
         update_data = {"status": status, **data}
         await model.update(task_id, update_data)
 
+    async def submit_task(self, task_id: str, task_type: str, priority: Optional[str] = None,
+                          dedup_key: Optional[str] = None) -> bool:
+        """提交已创建记录的任务
+
+        开启去重时，相同任务有最近结果的直接交付，相同任务正在处理的挂到该任务上，其余任务入队。
+
+        Args:
+            task_id: 任务ID
+            task_type: 任务类型
+            priority: 优先级
+            dedup_key: 去重任务键，为None时不去重
+
+        Returns:
+            bool: 是否提交成功，队列已满时返回False
+        """
+        if dedup_key is not None:
+            outcome, result = task_dedup.claim(dedup_key, task_type, task_id)
+            if outcome == "result":
+                logger.info(f"任务 {task_id} 命中最近结果，直接交付")
+                task_data = await self.task_models[task_type].get(task_id)
+                await self._deliver(task_type, task_data, "completed", result)
+                return True
+            if outcome == "inflight":
+                # 挂起的任务记录在处理中任务的记录里，重启后随该任务恢复
+                leader_id = task_dedup.leader_of(dedup_key)
+                await self.task_models[task_type].update(leader_id, {
+                    "dedup_key": dedup_key, "dedup_followers": task_dedup.followers(dedup_key)})
+                logger.info(f"任务 {task_id} 与处理中的任务 {leader_id} 相同，等待其结果")
+                return True
+        success = await task_queue.add_task(task_id=task_id, task_type=task_type, priority=priority)
+        if not success and dedup_key is not None:
+            await self._resolve_duplicates(task_type, task_id, "failed", {"error": "任务队列已满"},
+                                           followers=task_dedup.release(task_id))
+        return success
+
+    async def _deliver(self, task_type: str, task_data: Dict[str, Any], status: str, result: Dict[str, Any]) -> None:
+        """把另一个相同任务的结果交付给任务：更新或删除任务记录并提交回调
+
+        embedding的结果为float32打包向量（长文本任务可能附带分块向量），按任务协商的格式转换；其余类型的结果即回调数据。
+        """
+        model = self.task_models[task_type]
+        task_id = task_data["task_id"]
+        data = result
+        if task_type == "embedding":
+            if status == "completed":
+                vector = decode_result(result)
+                vector_format = task_data.get("vector_format", "list")
+                store_format = "float32" if vector_format == "list" else vector_format
+                stored, data = format_vector(vector, store_format), format_vector(vector, vector_format)
+                if result.get("chunks"):
+                    stored["chunks"] = convert_chunks(result["chunks"], store_format)
+                    data["chunks"] = convert_chunks(result["chunks"], vector_format)
+                await model.update(task_id, {"status": status, **stored})
+            else:
+                await model.update(task_id, {"status": status, **result})
+        else:
+            await model.delete(task_id)
+        await self._send_callback(task_data.get("handle"), task_id, status, data, model,
+                                  task_data.get("callback_format", "json"))
+
+    async def _resolve_duplicates(self, task_type: str, task_id: str, status: str, result: Dict[str, Any],
+                                  followers: Optional[List[str]] = None) -> None:
+        """任务处理完成后，把结果交付给挂在该任务上的相同任务"""
+        if followers is None:
+            followers = task_dedup.resolve(task_id, result if status == "completed" else None)
+        model = self.task_models[task_type]
+        for follower_id in followers:
+            task_data = await model.get(follower_id)
+            if task_data:
+                await self._deliver(task_type, task_data, status, result)
+
+    @staticmethod
+    def _embedding_result(vector: Any, chunks: Optional[Tuple], vector_format: str) -> Dict[str, Any]:
+        """生成embedding任务的结果字段，长文本任务要求返回分块向量时附带chunks"""
+        data = format_vector(vector, vector_format)
+        if chunks is not None:
+            data["chunks"] = format_chunks(*chunks, vector_format)
+        return data
+
     async def process_embedding_task(self, task: Dict[str, Any], db: None = None) -> None:
         """处理embedding任务"""
-        task_id = task["task_id"]
+        await self.process_embedding_tasks([task])
+
+    async def process_embedding_tasks(self, tasks: List[Dict[str, Any]]) -> None:
+        """批量处理embedding任务，整批文本只调用一次模型
+
+        结果以打包的二进制向量（base64）保存在任务存储中，回调投递成功后删除。
+        """
         model = self.task_models["embedding"]
 
-        # 从任务文件中获取数据
+        # 从任务存储中获取数据
+        batch = []
+        for task in tasks:
+            task_id = task["task_id"]
+            task_data = await model.get(task_id)
+            if not task_data:
+                logger.error(f"任务 {task_id} 数据不存在")
+                await self._resolve_duplicates("embedding", task_id, "failed", {"error": "任务数据不存在"})
+                await task_queue.complete_task(task_id)
+                continue
+            batch.append(task_data)
+        if not batch:
+            return
+
+        # 长文本分块任务各自切分编码，失败时不影响同批的其他任务
+        for task_data in [t for t in batch if t.get("long_text")]:
+            await self._process_long_embedding_task(task_data)
+        batch = [task_data for task_data in batch if not task_data.get("long_text")]
+        if not batch:
+            return
+
+        task_ids = [task_data["task_id"] for task_data in batch]
+        logger.info(f"开始处理Embedding任务批次, 任务数: {len(batch)}, 文本总长度: {sum(len(t['text']) for t in batch)}")
+
+        try:
+            # 生成embedding
+            embeddings = await self.embedding_service.generate_embeddings_array([t["text"] for t in batch])
+            await self._complete_embedding_tasks(batch, [(embedding, None) for embedding in embeddings])
+            logger.info(f"Embedding任务批次处理完成, 任务: {task_ids}")
+
+        except Exception as e:
+            error_msg = str(e)
+            logger.error(f"处理Embedding任务批次时发生错误: {error_msg}")
+            await self._fail_embedding_tasks(batch, error_msg)
+
+        finally:
+            # 标记任务完成
+            for task_id in task_ids:
+                await task_queue.complete_task(task_id)
+
+    async def _process_long_embedding_task(self, task_data: Dict[str, Any]) -> None:
+        """处理长文本分块embedding任务：切分为重叠的token窗口，批量编码后池化"""
+        task_id = task_data["task_id"]
+        options = task_data["long_text"]
+        try:
+            pooled, spans, matrix = await self.embedding_service.generate_long_embedding(
+                task_data["text"], options.get("overlap"), options.get("pooling", "mean"))
+            chunks = (spans, matrix) if options.get("return_chunks") else None
+            await self._complete_embedding_tasks([task_data], [(pooled, chunks)])
+            logger.info(f"长文本Embedding任务 {task_id} 处理完成, 分块数: {len(spans)}")
+        except Exception as e:
+            error_msg = str(e)
+            logger.error(f"处理长文本Embedding任务 {task_id} 时发生错误: {error_msg}")
+            await self._fail_embedding_tasks([task_data], error_msg)
+        finally:
+            await task_queue.complete_task(task_id)
+
+    async def _complete_embedding_tasks(self, batch: List[Dict[str, Any]],
+                                        results: List[Tuple[Any, Optional[Tuple]]]) -> None:
+        """保存embedding结果、发送回调并交付给相同任务
+
+        向量先按任务请求的output_dimensions截取并重新归一化，再按任务的向量格式量化保存和回调。
+
+        Args:
+            batch: 任务数据列表
+            results: 与任务一一对应的 (向量, 分块)，分块为 (各窗口区间, 各窗口向量) 或None
+        """
+        model = self.task_models["embedding"]
+        truncated = []
+        for task_data, (vector, chunks) in zip(batch, results):
+            dimensions = task_data.get("output_dimensions")
+            if chunks is not None:
+                chunks = (chunks[0], truncate_dimensions(chunks[1], dimensions))
+            truncated.append((truncate_dimensions(vector, dimensions), chunks))
+        results = truncated
+        for task_data, (vector, chunks) in zip(batch, results):
+            vector_format = task_data.get("vector_format", "list")
+            await model.update(task_data["task_id"], {
+                "status": "completed",
+                **self._embedding_result(vector, chunks, "float32" if vector_format == "list" else vector_format)
+            })
+
+        # 发送回调
+        await asyncio.gather(*[
+            self._send_callback(task_data.get("handle"), task_data["task_id"], "completed",
+                                self._embedding_result(vector, chunks, task_data.get("vector_format", "list")),
+                                model, task_data.get("callback_format", "json"))
+            for task_data, (vector, chunks) in zip(batch, results)
+        ])
+        for task_data, (vector, chunks) in zip(batch, results):
+            await self._resolve_duplicates("embedding", task_data["task_id"], "completed",
+                                           self._embedding_result(vector, chunks, "float32"))
+
+    async def _fail_embedding_tasks(self, batch: List[Dict[str, Any]], error_msg: str) -> None:
+        """把embedding任务标记为失败，发送错误回调并通知相同任务"""
+        model = self.task_models["embedding"]
+        for task_data in batch:
+            await model.update(task_data["task_id"], {"status": "failed", "error": error_msg})
+        # 发送错误回调
+        await asyncio.gather(*[
+            self._send_callback(task_data.get("handle"), task_data["task_id"], "failed", {"error": error_msg},
+                                model, task_data.get("callback_format", "json"))
+            for task_data in batch
+        ])
+        for task_data in batch:
+            await self._resolve_duplicates("embedding", task_data["task_id"], "failed", {"error": error_msg})
+
+    async def process_embedding_batch_task(self, task: Dict[str, Any], db: None = None) -> None:
+        """处理批量embedding任务
+
+        文本按EMBEDDING_BATCH_CHUNK_SIZE（或请求指定的chunk_size）分块编码，每块编码完成后立即提交该块的回调。
+        只有一块时结果同时保存在任务存储中供查询；所有分块回调投递成功后删除任务数据。
+        """
+        task_id = task["task_id"]
+        model = self.task_models["embedding_batch"]
+
+        # 从任务存储中获取数据
         task_data = await model.get(task_id)
         if not task_data:
             logger.error(f"任务 {task_id} 数据不存在")
+            await task_queue.complete_task(task_id)
             return
 
-        text = task_data["text"]
+        # 输入文本单独保存，每块只更新任务记录中的进度字段
+        texts, ids = await model.get_inputs(task_id)
         handle = task_data.get("handle")
+        vector_format = task_data.get("vector_format", "list")
+        callback_format = task_data.get("callback_format", "json")
+        chunk_size = task_data.get("chunk_size") or self.batch_chunk_size
+        chunks = max(1, math.ceil(len(texts) / chunk_size))
+        logger.info(f"开始处理批量Embedding任务 {task_id}, 文本数: {len(texts)}, 分块数: {chunks}")
+
+        pending_callbacks = {"count": chunks}
 
-        logger.info(f"开始处理Embedding任务 {task_id}, 文本长度: {len(text)}")
+        async def on_chunk_delivered():
+            pending_callbacks["count"] -= 1
+            if pending_callbacks["count"] == 0:
+                await model.delete(task_id)
 
+        processed = 0
         try:
-            # 生成embedding
-            embedding = await self.embedding_service.generate_embedding(text)
-            await model.delete(task_id)
-            
-            # 将NumPy数组转换为Python列表
-            if hasattr(embedding, 'tolist'):
-                embedding = embedding.tolist()
-            
-            logger.info(f"Embedding任务 {task_id} 处理完成")
+            for index in range(chunks):
+                chunk_texts = texts[index * chunk_size:(index + 1) * chunk_size]
+                matrix = await self.embedding_service.generate_embeddings_array(chunk_texts, self.encode_batch_size)
+                matrix = truncate_dimensions(matrix, task_data.get("output_dimensions"))
+                result = format_matrix(matrix, vector_format)
+                if ids:
+                    result["ids"] = ids[processed:processed + len(chunk_texts)]
+                if chunks > 1:
+                    result.update({"chunk": index, "chunks": chunks, "offset": processed})
+                processed += len(chunk_texts)
 
-            # 发送回调
-            await self._send_callback(handle, task_id, "completed", {"embedding": embedding}, model)
+                if chunks == 1:
+                    await model.update(task_id, {
+                        "status": "completed",
+                        "processed": processed,
+                        **format_matrix(matrix, "float32" if vector_format == "list" else vector_format)
+                    })
+                else:
+                    await model.update(task_id, {
+                        "status": "completed" if processed == len(texts) else "processing",
+                        "processed": processed
+                    })
+                await self._send_callback(handle, task_id, "completed", result, model, callback_format,
+                                          on_delivered=on_chunk_delivered)
+            logger.info(f"批量Embedding任务 {task_id} 处理完成")
 
         except Exception as e:
             error_msg = str(e)
-            logger.error(f"处理任务 {task_id} 时发生错误: {error_msg}")
-            
+            logger.error(f"处理批量Embedding任务 {task_id} 时发生错误: {error_msg}")
+
             # 发送错误回调
-            await self._send_callback(handle, task_id, "failed", {"error": error_msg}, model)
+            await model.update(task_id, {"status": "failed", "error": error_msg, "processed": processed})
+            await self._send_callback(handle, task_id, "failed", {"error": error_msg, "processed": processed},
+                                      model, callback_format)
 
         finally:
             # 标记任务完成
@@ -150,6 +400,8 @@ class TaskProcessor:
         task_data = await model.get(task_id)
         if not task_data:
             logger.error(f"任务 {task_id} 数据不存在")
+            await self._resolve_duplicates("mask", task_id, "failed", {"error": "任务数据不存在"})
+            await task_queue.complete_task(task_id)
             return
 
         text = task_data["original_text"]
@@ -181,11 +433,13 @@ class TaskProcessor:
             logger.info(f"Mask任务 {task_id} 处理完成， {len(text)}-->{len(masked_text)}")
 
             # 发送回调
-            await self._send_callback(handle, task_id, "completed", {
+            result = {
                 "masked_text": masked_text,
                 "mapping": mapping,
                 "probability": extract_probability
-            }, model)
+            }
+            await self._send_callback(handle, task_id, "completed", result, model)
+            await self._resolve_duplicates("mask", task_id, "completed", result)
 
         except Exception as e:
             error_msg = str(e)
@@ -193,6 +447,7 @@ class TaskProcessor:
             
             # 发送错误回调
             await self._send_callback(handle, task_id, "failed", {"error": error_msg}, model)
+            await self._resolve_duplicates("mask", task_id, "failed", {"error": error_msg})
 
         finally:
             # 标记任务完成
@@ -207,6 +462,8 @@ class TaskProcessor:
         task_data = await model.get(task_id)
         if not task_data:
             logger.error(f"任务 {task_id} 数据不存在")
+            await self._resolve_duplicates("rerank", task_id, "failed", {"error": "任务数据不存在"})
+            await task_queue.complete_task(task_id)
             return
 
         query = task_data["query"]
@@ -229,6 +486,7 @@ class TaskProcessor:
 
             # 发送回调
             await self._send_callback(handle, task_id, "completed", {"rankings": ranked_pairs}, model)
+            await self._resolve_duplicates("rerank", task_id, "completed", {"rankings": ranked_pairs})
 
         except Exception as e:
             error_msg = str(e)
@@ -236,34 +494,115 @@ class TaskProcessor:
             
             # 发送错误回调
             await self._send_callback(handle, task_id, "failed", {"error": error_msg}, model)
+            await self._resolve_duplicates("rerank", task_id, "failed", {"error": error_msg})
 
         finally:
             # 标记任务完成
             await task_queue.complete_task(task_id)
 
+    async def _worker(self, task_type: str, worker_id: int) -> None:
+        """单个工作协程，只处理指定类型的任务"""
+        handler = self.task_handlers[task_type]
+        current = asyncio.current_task()
+        logger.info(f"{task_type} 工作协程 {worker_id} 启动")
+        try:
+            while self.running:
+                # 阻塞等待任务入队，空闲时可被直接取消
+                self.idle_workers.add(current)
+                try:
+                    task = await task_queue.get_task(task_type)
+                finally:
+                    self.idle_workers.discard(current)
+                tasks = [task]
+                try:
+                    batcher = self.batchers.get(task_type)
+                    if batcher:
+                        tasks = await batcher.collect(task, lambda timeout: task_queue.get_task(task_type, timeout))
+                    started = time.monotonic()
+                    await (handler(tasks) if batcher else handler(task))
+                    task_queue.record_service_time(task_type, time.monotonic() - started, len(tasks))
+                except Exception as e:
+                    logger.error(f"{task_type} 工作协程 {worker_id} 处理任务 {[t['task_id'] for t in tasks]} 时发生错误: {str(e)}")
+                    for t in tasks:
+                        await self._resolve_duplicates(task_type, t["task_id"], "failed", {"error": str(e)})
+                        await task_queue.complete_task(t["task_id"])
+        except asyncio.CancelledError:
+            logger.info(f"{task_type} 工作协程 {worker_id} 已取消")
+            raise
+        logger.info(f"{task_type} 工作协程 {worker_id} 退出")
+
+    async def recover_tasks(self) -> None:
+        """恢复上次运行遗留的任务，对多次中断后被放弃的任务发送失败回调"""
+        requeued, abandoned = await task_queue.recover_entries()
+        await self._restore_duplicates(requeued + abandoned)
+        for entry in abandoned:
+            task_id = entry["task_id"]
+            model = self.task_models.get(entry["type"])
+            task_data = await model.get(task_id) if model else None
+            if not task_data:
+                continue
+            error_msg = f"任务处理被中断 {entry['attempts']} 次，已放弃"
+            logger.error(f"任务 {task_id} {error_msg}")
+            await self._send_callback(task_data.get("handle"), task_id, "failed", {"error": error_msg}, model)
+            await self._resolve_duplicates(entry["type"], task_id, "failed", {"error": error_msg})
+
+    async def _restore_duplicates(self, entries: List[Dict[str, Any]]) -> None:
+        """从恢复任务的记录中找回挂在其上的相同任务，处理完成（或被放弃）时一起交付结果"""
+        if not task_dedup.enabled:
+            return
+        for entry in entries:
+            model = self.task_models.get(entry["type"])
+            task_data = await model.get(entry["task_id"]) if model else None
+            if task_data and task_data.get("dedup_key") and task_data.get("dedup_followers"):
+                task_dedup.restore(entry["task_id"], task_data["dedup_key"], task_data["dedup_followers"])
+                logger.info(f"任务 {entry['task_id']} 恢复了 {len(task_data['dedup_followers'])} 个挂起的相同任务")
+
+    async def _lease_keeper(self) -> None:
+        """共享队列后端下定期续租正在处理的任务，并回收其他进程遗留的过期任务"""
+        interval = task_queue.lease_seconds / 3
+        while self.running:
+            await asyncio.sleep(interval)
+            try:
+                await task_queue.renew_leases()
+                await self.recover_tasks()
+            except Exception as e:
+                logger.error(f"续租或回收任务时发生错误: {str(e)}")
+
     async def start_processing(self):
-        """启动任务处理"""
+        """启动任务处理，为每种任务类型启动独立的工作协程池"""
         self.running = True
-        while self.running:
-            # 获取任务
-            task = await task_queue.get_task()
-            if task:
-                task_type = task["type"]
-                if task_type == "embedding":
-                    await self.process_embedding_task(task)
-                elif task_type == "mask":
-                    await self.process_mask_task(task)
-                elif task_type == "rerank":
-                    await self.process_rerank_task(task)
-                else:
-                    logger.warning(f"未知任务类型: {task_type}")
-            else:
-                # 如果没有任务，等待一段时间
-                await asyncio.sleep(1)
+        self.workers = []
+        for task_type, count in self.worker_counts.items():
+            task_queue.set_capacity(task_type, count)
+            for worker_id in range(count):
+                self.workers.append(asyncio.create_task(self._worker(task_type, worker_id)))
+        if task_queue.backend.shared:
+            self.lease_keeper = asyncio.create_task(self._lease_keeper())
+        logger.info(f"任务处理器启动, 工作协程配置: {self.worker_counts}")
+        await asyncio.gather(*self.workers, return_exceptions=True)
 
-    def stop_processing(self):
-        """停止任务处理"""
+    async def stop_processing(self):
+        """停止任务处理
+
+        空闲的工作协程立即取消；正在处理任务的工作协程在宽限时间内处理完当前任务后退出，
+        超过宽限时间仍未结束的直接取消。
+        """
         self.running = False
+        if self.lease_keeper:
+            self.lease_keeper.cancel()
+        for worker in list(self.idle_workers):
+            worker.cancel()
+        busy = [worker for worker in self.workers if not worker.done()]
+        if busy:
+            logger.info(f"等待 {len(busy)} 个工作协程处理完当前任务")
+            _, pending = await asyncio.wait(busy, timeout=self.shutdown_grace)
+            if pending:
+                # 先关闭队列后端，被取消的任务不会被确认，下次启动或租约过期后重新处理
+                task_queue.close()
+                for worker in pending:
+                    worker.cancel()
+                await asyncio.wait(pending)
+        logger.info("任务处理器已停止")
 
 # 创建全局任务处理器实例
 task_processor = TaskProcessor()
\ No newline at end of file
@@ -0,0 +1,86 @@
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class TokenBatcher:
+    """按token长度分批
+
+    输入先分词一次，按token数排序后依次装入批次，每个批次填充后的token总数（批次大小 × 批内最大长度）
+    不超过 {NAME}_MAX_BATCH_TOKENS，批次大小不超过调用方给出的上限。长短文本不再混在同一批中，
+    短文本不必填充到批内最长文本的长度。各批次的结果按输入的原始顺序返回。
+
+    统计实际token数和填充后的token数，padding_ratio 为填充部分所占的比例。
+    统计在执行推理的进程内累计，进程池模式下只反映当前进程。
+    """
+
+    def __init__(self, name: str, max_tokens: Optional[int] = None):
+        """
+        Args:
+            name: 分批器名称，同时作为环境变量前缀
+            max_tokens: 每批填充后的token总数上限，为None时读取环境变量
+        """
+        self.name = name
+        self.max_tokens = max_tokens or int(os.getenv(f"{name.upper()}_MAX_BATCH_TOKENS", 16384))
+        self._lock = threading.Lock()
+        self.counters = {"batches": 0, "items": 0, "tokens": 0, "padded_tokens": 0}
+
+    def plan(self, lengths: Sequence[int], max_batch_size: int) -> List[List[int]]:
+        """按token数为输入分批
+
+        Args:
+            lengths: 每个输入的token数
+            max_batch_size: 每批最多的输入数
+
+        Returns:
+            List[List[int]]: 每个批次包含的输入下标
+        """
+        batches: List[List[int]] = []
+        current: List[int] = []
+        for index in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            # 按长度升序装入，新输入就是批内最长的
+            if current and (len(current) >= max_batch_size or
+                            (len(current) + 1) * lengths[index] > self.max_tokens):
+                batches.append(current)
+                current = []
+            current.append(index)
+        if current:
+            batches.append(current)
+
+        padded = sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
+        with self._lock:
+            self.counters["batches"] += len(batches)
+            self.counters["items"] += len(lengths)
+            self.counters["tokens"] += sum(lengths)
+            self.counters["padded_tokens"] += padded
+        return batches
+
+    def run(self, lengths: Sequence[int], func: Callable[[List[int]], Sequence[Any]],
+            max_batch_size: int) -> List[Any]:
+        """分批调用func并按原始顺序合并结果
+
+        Args:
+            lengths: 每个输入的token数
+            func: 接收一个批次的输入下标，返回与下标一一对应的结果
+            max_batch_size: 每批最多的输入数
+        """
+        results: List[Any] = [None] * len(lengths)
+        for batch in self.plan(lengths, max_batch_size):
+            for index, result in zip(batch, func(batch)):
+                results[index] = result
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """获取分批和填充统计"""
+        with self._lock:
+            counters = dict(self.counters)
+        padded = counters["padded_tokens"]
+        return {
+            "max_tokens": self.max_tokens,
+            **counters,
+            "avg_batch_size": counters["items"] / counters["batches"] if counters["batches"] else 0.0,
+            "padding_ratio": (padded - counters["tokens"]) / padded if padded else 0.0
+        }
@@ -0,0 +1,251 @@
+import base64
+import json
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+# 向量格式：list 为JSON浮点数列表，其余为紧凑的小端二进制：
+# float32/float16 为浮点数；int8 为按向量对称标量量化（附带scale，还原值 = int8 × scale）；
+# binary 为符号位（大于0为1），每个向量按位打包，8维占1字节
+VECTOR_FORMATS = {
+    "list": None,
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2"),
+    "int8": np.dtype("i1"),
+    "binary": np.dtype("u1")
+}
+# 回调格式
+CALLBACK_FORMATS = ("json", "msgpack", "octet-stream")
+
+Vector = Union[Sequence[float], np.ndarray]
+
+
+def validate_formats(vector_format: str, callback_format: str) -> Tuple[str, str]:
+    """校验请求协商的向量格式和回调格式，为空时使用默认值
+
+    Raises:
+        ValueError: 不支持的格式，或octet-stream回调没有使用二进制向量格式
+    """
+    vector_format = vector_format or "list"
+    callback_format = callback_format or "json"
+    if vector_format not in VECTOR_FORMATS:
+        raise ValueError(f"不支持的向量格式：{vector_format}，可选值: {list(VECTOR_FORMATS)}")
+    if callback_format not in CALLBACK_FORMATS:
+        raise ValueError(f"不支持的回调格式：{callback_format}，可选值: {list(CALLBACK_FORMATS)}")
+    if callback_format == "octet-stream" and vector_format == "list":
+        raise ValueError(f"octet-stream回调需要指定二进制向量格式（{'、'.join(list(VECTOR_FORMATS)[1:])}）")
+    if callback_format == "msgpack":
+        _import_msgpack()
+    return vector_format, callback_format
+
+
+def validate_dimensions(dimensions: Any) -> Optional[int]:
+    """校验请求的输出维度，为空时返回None（不截取）
+
+    Raises:
+        ValueError: 不是正整数
+    """
+    if dimensions is None:
+        return None
+    if isinstance(dimensions, bool) or not isinstance(dimensions, int) or dimensions < 1:
+        raise ValueError("dimensions必须是正整数")
+    return dimensions
+
+
+def truncate_dimensions(vectors: Vector, dimensions: Optional[int]) -> np.ndarray:
+    """截取向量（或矩阵的每一行）的前dimensions维并重新做L2归一化
+
+    dimensions为None或不小于原维度时原样返回。
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not dimensions or dimensions >= vectors.shape[-1]:
+        return vectors
+    truncated = vectors[..., :dimensions]
+    norms = np.linalg.norm(truncated, axis=-1, keepdims=True)
+    return truncated / np.where(norms == 0, 1, norms)
+
+
+def quantize(matrix: Vector, vector_format: str) -> Tuple[bytes, Optional[np.ndarray]]:
+    """把 (行数, 维度) 的矩阵按行量化并打包为小端二进制
+
+    Returns:
+        Tuple[bytes, Optional[np.ndarray]]: 打包后的字节，以及int8格式每行的scale（其他格式为None）
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if vector_format == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127 if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+        scales[scales == 0] = 1
+        quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized.tobytes(), scales.astype(np.float32)
+    if vector_format == "binary":
+        return np.packbits(matrix > 0, axis=1).tobytes(), None
+    return matrix.astype(VECTOR_FORMATS[vector_format]).tobytes(), None
+
+
+def dequantize(data: bytes, vector_format: str, dimensions: int,
+               scales: Optional[Sequence[float]] = None) -> np.ndarray:
+    """把打包的二进制还原为 (行数, 维度) 的float32矩阵，binary格式还原为 ±1"""
+    if not dimensions:
+        return np.zeros((0, 0), dtype=np.float32)
+    if vector_format == "binary":
+        packed = np.frombuffer(data, dtype=np.uint8).reshape(-1, (dimensions + 7) // 8)
+        return np.unpackbits(packed, axis=1, count=dimensions).astype(np.float32) * 2 - 1
+    matrix = np.frombuffer(data, dtype=VECTOR_FORMATS[vector_format]).astype(np.float32).reshape(-1, dimensions)
+    if vector_format == "int8":
+        matrix *= np.asarray(scales, dtype=np.float32).reshape(-1, 1)
+    return matrix
+
+
+def pack_vector(vector: Vector, vector_format: str = "float32") -> bytes:
+    """把向量（或矩阵，按行）打包为小端二进制"""
+    vector = np.asarray(vector, dtype=np.float32)
+    return quantize(vector.reshape(-1, vector.shape[-1]) if vector.size else vector.reshape(0, 0), vector_format)[0]
+
+
+def unpack_vector(data: bytes, vector_format: str = "float32", dimensions: Optional[int] = None,
+                  scale: Optional[float] = None) -> List[float]:
+    """把二进制向量解包为浮点数列表，int8和binary格式需要维度（int8还需要scale）"""
+    if vector_format in ("float32", "float16"):
+        return np.frombuffer(data, dtype=VECTOR_FORMATS[vector_format]).astype(np.float32).tolist()
+    return dequantize(data, vector_format, dimensions, None if scale is None else [scale])[0].tolist()
+
+
+def encode_vector(vector: Vector, vector_format: str = "float32") -> str:
+    """把向量打包并编码为base64字符串"""
+    return base64.b64encode(pack_vector(vector, vector_format)).decode("ascii")
+
+
+def decode_vector(data: str, vector_format: str = "float32", dimensions: Optional[int] = None,
+                  scale: Optional[float] = None) -> List[float]:
+    """把base64字符串解码为浮点数列表"""
+    return unpack_vector(base64.b64decode(data), vector_format, dimensions, scale)
+
+
+def format_vector(vector: Vector, vector_format: str) -> Dict[str, Any]:
+    """按向量格式生成结果字段
+
+    list格式返回 {"embedding": [...]}；二进制格式返回base64编码的向量以及格式和维度，
+    例如 {"embedding": "AAAA...", "embedding_format": "float16", "dimensions": 1792}，int8格式另附 "scale"
+    """
+    if VECTOR_FORMATS[vector_format] is None:
+        return {"embedding": np.asarray(vector, dtype=np.float32).tolist()}
+    vector = np.asarray(vector, dtype=np.float32)
+    data, scales = quantize(vector.reshape(1, -1), vector_format)
+    result = {
+        "embedding": base64.b64encode(data).decode("ascii"),
+        "embedding_format": vector_format,
+        "dimensions": len(vector)
+    }
+    if scales is not None:
+        result["scale"] = float(scales[0])
+    return result
+
+
+def decode_result(result: Dict[str, Any]) -> List[float]:
+    """把format_vector生成的结果字段还原为浮点数列表"""
+    if not result.get("embedding_format"):
+        return result["embedding"]
+    return decode_vector(result["embedding"], result["embedding_format"], result.get("dimensions"),
+                         result.get("scale"))
+
+
+def format_chunks(spans: Sequence[Tuple[int, int, int]], matrix: Sequence[Vector],
+                  vector_format: str) -> List[Dict[str, Any]]:
+    """按向量格式生成长文本分块结果，每块包含在原文中的起止字符位置、token数和向量"""
+    return [{"start": start, "end": end, "tokens": tokens, **format_vector(vector, vector_format)}
+            for (start, end, tokens), vector in zip(spans, matrix)]
+
+
+def convert_chunks(chunks: List[Dict[str, Any]], vector_format: str) -> List[Dict[str, Any]]:
+    """把保存的分块结果（二进制向量）转换为指定的向量格式"""
+    spans = [(chunk["start"], chunk["end"], chunk["tokens"]) for chunk in chunks]
+    matrix = [decode_result(chunk) for chunk in chunks]
+    return format_chunks(spans, matrix, vector_format)
+
+
+def decode_matrix(data: str, vector_format: str, dimensions: int,
+                  scales: Optional[Sequence[float]] = None) -> np.ndarray:
+    """把base64编码的矩阵解码为 (行数, 维度) 的float32数组"""
+    return dequantize(base64.b64decode(data), vector_format, dimensions, scales)
+
+
+def format_matrix(matrix: np.ndarray, vector_format: str) -> Dict[str, Any]:
+    """按向量格式生成批量结果字段
+
+    list格式返回 {"embeddings": [[...], ...]}；二进制格式返回按行拼接的整个矩阵的base64编码，
+    例如 {"embeddings": "AAAA...", "embedding_format": "float16", "dimensions": 1792, "count": 100}，
+    int8格式另附每行的 "scales"
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if VECTOR_FORMATS[vector_format] is None:
+        return {"embeddings": matrix.tolist()}
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(0, 0)
+    data, scales = quantize(matrix, vector_format)
+    result = {
+        "embeddings": base64.b64encode(data).decode("ascii"),
+        "embedding_format": vector_format,
+        "dimensions": int(matrix.shape[1]),
+        "count": int(matrix.shape[0])
+    }
+    if scales is not None:
+        result["scales"] = scales.tolist()
+    return result
+
+
+def _import_msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError("使用msgpack回调格式需要安装msgpack包: pip install msgpack")
+    return msgpack
+
+
+def encode_callback(payload: Dict[str, Any], callback_format: str = "json") -> Tuple[bytes, Dict[str, str]]:
+    """按回调格式编码回调数据
+
+    payload中的二进制向量（embedding或批量结果的embeddings字段）以base64字符串保存（便于写入死信文件），
+    编码时还原为原始字节：
+
+    - json：原样编码为JSON
+    - msgpack：向量字段为原始字节（bin类型），其余字段不变
+    - octet-stream：请求体为 4字节大端无符号整数（元数据长度）+ 其余字段的UTF-8 JSON + 向量原始字节，
+      见 decode_octet_stream。int8的scales和长文本分块等元数据可能很大，不放在请求头中
+
+    Returns:
+        Tuple[bytes, Dict[str, str]]: 请求体和请求头
+    """
+    if callback_format == "json":
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        return body, {"Content-Type": "application/json"}
+
+    field = "embeddings" if "embeddings" in payload else "embedding"
+    binary = payload.get("embedding_format") is not None and isinstance(payload.get(field), str)
+    if callback_format == "msgpack":
+        msgpack = _import_msgpack()
+        data = dict(payload)
+        if binary:
+            data[field] = base64.b64decode(data[field])
+        return msgpack.packb(data, use_bin_type=True), {"Content-Type": "application/msgpack"}
+
+    meta = {key: value for key, value in payload.items() if key != field}
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    data = base64.b64decode(payload[field]) if binary else b""
+    return struct.pack(">I", len(meta_bytes)) + meta_bytes + data, {"Content-Type": "application/octet-stream"}
+
+
+def decode_octet_stream(body: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """解析octet-stream回调的请求体
+
+    Returns:
+        Tuple[Dict, bytes]: 元数据和向量原始字节
+
+    Raises:
+        ValueError: 请求体格式错误
+    """
+    if len(body) < 4:
+        raise ValueError("octet-stream回调数据缺少元数据长度")
+    length = struct.unpack(">I", body[:4])[0]
+    if len(body) < 4 + length:
+        raise ValueError("octet-stream回调数据的元数据不完整")
+    return json.loads(body[4:4 + length].decode("utf-8")), body[4 + length:]